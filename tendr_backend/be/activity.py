@@ -0,0 +1,180 @@
+"""
+user_daily_activity: per user, per (UTC) day totals for the analytics reads.
+
+Stats, the heatmaps and /focus/total used to scan the user's whole history (every
+completed task, every focus session) on each request. Now every write that moves
+one of the totals also adds to that day's row, in the same transaction, with a
+single upsert:
+
+    tasks_completed  +1 / -1 on the task's created_at day   completing / reopening, deleting a completed task
+    focus_seconds    +duration, today                       POST /focus/session
+    xp_gained        +reward, today                         task completions (what xp_service.grant paid)
+    pets_fed         +1, today                              feed_pet
+
+and a read over a date range costs one primary key entry per active day.
+
+Tasks count on the day they were created, not the day they were completed: that is
+what stats and the heatmaps have always shown, and created_at is in every RETURNING,
+so reopening or deleting a task takes it back off the same day it was added to.
+
+rebuild() recomputes the rows from the source tables. Migration 14 runs it once;
+`python activity.py` runs it again for every user, in case something wrote without
+keeping the rollup (e.g. old workers during a deploy). XP gained and pets fed come
+from the XP ledger (xp_events), so days from before it existed show 0 for those.
+"""
+import sys
+from collections import Counter, defaultdict
+from datetime import date
+
+from sqlalchemy import select, delete, func, cast, literal, union_all, or_, Date
+from sqlalchemy.dialects.postgresql import insert as pg_insert
+from sqlalchemy.exc import OperationalError
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from models import Task, FocusSession, XpEvent, User, UserDailyActivity
+
+COUNTERS = ("tasks_completed", "focus_seconds", "xp_gained", "pets_fed")
+REBUILD_BATCH = 500
+
+
+def changes():
+    """{day: Counter(column=delta)}, fill in and pass to add()"""
+    return defaultdict(Counter)
+
+
+def count_tasks(day_changes, created_ats, sign: int = 1):
+    """sign = +1 for tasks that just got completed, -1 for completed ones reopened or deleted."""
+    for created_at in created_ats:
+        if created_at is not None:
+            day_changes[created_at.date()]["tasks_completed"] += sign
+
+
+async def add(db: AsyncSession, user_id, day_changes):
+    """One upsert for every day in day_changes, in the caller's transaction, after its user row write (xp_service)."""
+    rows = [
+        {"user_id": user_id, "day": day, **{c: counts[c] for c in COUNTERS}}
+        # always in day order, so two multi-day upserts can't deadlock on each other's rows
+        for day, counts in sorted(day_changes.items())
+        if any(counts[c] for c in COUNTERS)
+    ]
+    if not rows:
+        return
+    upsert = pg_insert(UserDailyActivity).values(rows)
+    await db.execute(upsert.on_conflict_do_update(
+        index_elements=[UserDailyActivity.user_id, UserDailyActivity.day],
+        set_={c: getattr(UserDailyActivity, c) + upsert.excluded[c] for c in COUNTERS},
+    ))
+
+
+# ---------------------------------------------------
+# reads
+# ---------------------------------------------------
+
+async def days(db: AsyncSession, user_id, start: date, end: date):
+    """Rows (day, *COUNTERS) for the days in [start, end] with any activity, oldest first."""
+    return (await db.execute(
+        select(UserDailyActivity.day, *(getattr(UserDailyActivity, c) for c in COUNTERS))
+        .where(UserDailyActivity.user_id == user_id, UserDailyActivity.day.between(start, end))
+        .order_by(UserDailyActivity.day)
+    )).all()
+
+
+async def total(db: AsyncSession, user_id, column: str, since: date = None) -> int:
+    """One counter summed over every day (from since on)."""
+    query = select(func.sum(getattr(UserDailyActivity, column))).where(UserDailyActivity.user_id == user_id)
+    if since is not None:
+        query = query.where(UserDailyActivity.day >= since)
+    return int((await db.execute(query)).scalar() or 0)
+
+
+async def on_day(db: AsyncSession, user_id, column: str, day: date) -> int:
+    return int((await db.execute(
+        select(getattr(UserDailyActivity, column))
+        .where(UserDailyActivity.user_id == user_id, UserDailyActivity.day == day)
+    )).scalar() or 0)
+
+
+# ---------------------------------------------------
+# rebuild / backfill
+# ---------------------------------------------------
+
+def _rebuild_statements(user_ids=None):
+    def mine(query, model):
+        return query.where(model.user_id.in_(user_ids)) if user_ids is not None else query
+
+    zero = literal(0)
+    task_day = cast(Task.created_at, Date)
+    focus_day = cast(FocusSession.created_at, Date)
+    xp_day = cast(XpEvent.created_at, Date)
+    source = union_all(
+        mine(select(
+            Task.user_id, task_day.label("day"), func.count().label("tasks_completed"),
+            zero.label("focus_seconds"), zero.label("xp_gained"), zero.label("pets_fed"),
+        ).where(Task.completed.is_(True)), Task).group_by(Task.user_id, task_day),
+        mine(select(
+            FocusSession.user_id, focus_day, zero, func.sum(FocusSession.duration_seconds), zero, zero,
+        ), FocusSession).group_by(FocusSession.user_id, focus_day),
+        mine(select(
+            XpEvent.user_id, xp_day, zero, zero,
+            func.coalesce(func.sum(XpEvent.delta).filter(XpEvent.delta > 0), 0),
+            func.count().filter(XpEvent.reason == "pet_fed"),
+        ), XpEvent).group_by(XpEvent.user_id, xp_day),
+    ).subquery()
+    summed = [func.sum(source.c[c]) for c in COUNTERS]
+    totals = (
+        select(source.c.user_id, source.c.day, *summed)
+        .where(source.c.user_id.isnot(None), source.c.day.isnot(None))
+        .group_by(source.c.user_id, source.c.day)
+        .having(or_(*(s > 0 for s in summed)))
+    )
+
+    clear = delete(UserDailyActivity)
+    if user_ids is not None:
+        clear = clear.where(UserDailyActivity.user_id.in_(user_ids))
+    fill = pg_insert(UserDailyActivity).from_select(["user_id", "day", *COUNTERS], totals)
+    # only conflicts with a row written after our snapshot: under REPEATABLE READ that is
+    # a serialization error (and a retry), never a silently kept stale row
+    fill = fill.on_conflict_do_update(
+        index_elements=[UserDailyActivity.user_id, UserDailyActivity.day],
+        set_={c: fill.excluded[c] for c in COUNTERS},
+    )
+    return clear, fill
+
+
+def rebuild(conn, user_ids=None) -> int:
+    """Recompute the rows of user_ids (None => everyone) on a sync connection. Returns rows written."""
+    clear, fill = _rebuild_statements(user_ids)
+    conn.execute(clear)
+    return conn.execute(fill).rowcount
+
+
+def rebuild_all(engine, batch: int = REBUILD_BATCH) -> int:
+    """
+    rebuild() every user, batch users per transaction, safe to run while the app serves.
+    REPEATABLE READ: a write that lands on a row of the batch after its snapshot fails
+    the batch with a serialization error and the batch is redone, instead of being lost.
+    """
+    with engine.connect() as conn:
+        user_ids = conn.execute(select(User.id).order_by(User.id)).scalars().all()
+    written = 0
+    for i in range(0, len(user_ids), batch):
+        chunk = user_ids[i:i + batch]
+        while True:
+            try:
+                with engine.connect().execution_options(isolation_level="REPEATABLE READ") as conn:
+                    rows = rebuild(conn, chunk)
+                    conn.commit()
+                break
+            except OperationalError as e:
+                if getattr(e.orig, "pgcode", None) != "40001":
+                    raise
+                print(f"Batch {i // batch} raced a write, retrying")
+        written += rows
+        print(f"Rebuilt {min(i + batch, len(user_ids))}/{len(user_ids)} users")
+    return written
+
+
+if __name__ == "__main__":
+    from database import engine
+    rows = rebuild_all(engine, int(sys.argv[1]) if len(sys.argv) > 1 else REBUILD_BATCH)
+    print(f"{rows} user_daily_activity rows written")
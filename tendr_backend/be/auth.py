@@ -1,7 +1,176 @@
 from passlib.context import CryptContext
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor
+from fastapi import HTTPException
+import asyncio
+import math
+import os
+import statistics
+import time
+import metrics
 
 pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
 
+
+# ---------------------------------------------------
+# BCRYPT COST
+# ---------------------------------------------------
+#BCRYPT_ROUNDS pins the cost and skips calibration (and its startup time): set it in production.
+#Without it, configure_bcrypt() measures this host at startup and picks the highest rounds
+#where one hash/verify stays under BCRYPT_TARGET_MS, but never less than the old fixed 12:
+#a slow or busy host can only keep the cost, not weaken new hashes.
+#Each extra round doubles the cost. Hashes weaker than the chosen rounds are
+#upgraded on the next successful login; stronger ones are left alone (never downgraded).
+_DEFAULT_ROUNDS = 12   # passlib's default, what every hash used before calibration
+BCRYPT_ROUNDS = os.getenv("BCRYPT_ROUNDS")
+BCRYPT_TARGET_MS = float(os.getenv("BCRYPT_TARGET_MS", "250"))
+#can be raised, not lowered below the default
+BCRYPT_MIN_ROUNDS = max(_DEFAULT_ROUNDS, int(os.getenv("BCRYPT_MIN_ROUNDS", str(_DEFAULT_ROUNDS))))
+BCRYPT_MAX_ROUNDS = 16
+#calibration times this cheap cost and extrapolates, instead of timing the floor itself
+_PROBE_ROUNDS = 8
+
+bcrypt_rounds = _DEFAULT_ROUNDS   # until configure_bcrypt() runs
+_context_rounds = None
+metrics.Gauge("tendr_bcrypt_rounds", "bcrypt cost used for new hashes", fn=lambda: bcrypt_rounds)
+
+
+def _use_rounds(rounds: int):
+    # also runs inside process-pool workers, which have their own pwd_context
+    global _context_rounds
+    if _context_rounds != rounds:
+        pwd_context.update(bcrypt__default_rounds=rounds, bcrypt__min_rounds=rounds)
+        _context_rounds = rounds
+
+
+def time_bcrypt(rounds: int, samples: int = 3) -> float:
+    """Median seconds for one bcrypt hash at this cost (verify costs the same)."""
+    times = []
+    for _ in range(samples):
+        start = time.perf_counter()
+        pwd_context.hash("calibration-password", rounds=rounds)
+        times.append(time.perf_counter() - start)
+    return statistics.median(times)
+
+
+def calibrate_bcrypt_rounds(target_ms: float = BCRYPT_TARGET_MS, min_rounds: int = BCRYPT_MIN_ROUNDS,
+                            max_rounds: int = BCRYPT_MAX_ROUNDS) -> int:
+    """Highest rounds whose hash time stays under target_ms on this host (at least min_rounds)."""
+    base = time_bcrypt(_PROBE_ROUNDS)
+    # cost doubles per round: extrapolate from a cheap setting, then check the guess once.
+    # Above the floor only: at min_rounds we stop, however slow this host is
+    rounds = _PROBE_ROUNDS + math.floor(math.log2(target_ms / 1000 / base))
+    rounds = min(max(rounds, min_rounds), max_rounds)
+    while rounds > min_rounds and time_bcrypt(rounds, samples=1) * 1000 > target_ms:
+        rounds -= 1
+    return rounds
+
+
+def configure_bcrypt():
+    """Called once at startup (lifespan): pin or calibrate the cost for new hashes."""
+    global bcrypt_rounds
+    bcrypt_rounds = int(BCRYPT_ROUNDS) if BCRYPT_ROUNDS else calibrate_bcrypt_rounds()
+    if bcrypt_rounds < _DEFAULT_ROUNDS:
+        print(f"⚠️ BCRYPT_ROUNDS={bcrypt_rounds} is below the default {_DEFAULT_ROUNDS}: new hashes are weaker")
+    _use_rounds(bcrypt_rounds)
+    print(f"bcrypt rounds = {bcrypt_rounds} ({'BCRYPT_ROUNDS' if BCRYPT_ROUNDS else f'calibrated for {BCRYPT_TARGET_MS:.0f}ms'})")
+    return bcrypt_rounds
+
+
+# ---------------------------------------------------
+# PASSWORD HASHING POOL
+# ---------------------------------------------------
+#bcrypt is ~200ms of pure CPU per call. It gets its own small pool instead of the shared
+#threadpool, so a burst of logins queues here while task/pet traffic keeps going.
+#PASSWORD_HASH_WORKERS => hashes running at once (default: one per core)
+#PASSWORD_HASH_QUEUE_LIMIT => callers allowed to wait on top of that; beyond it we answer 503
+#PASSWORD_HASH_EXECUTOR => "thread" (bcrypt releases the GIL) or "process"
+PASSWORD_HASH_WORKERS = int(os.getenv("PASSWORD_HASH_WORKERS", str(os.cpu_count() or 1)))
+PASSWORD_HASH_QUEUE_LIMIT = int(os.getenv("PASSWORD_HASH_QUEUE_LIMIT", "64"))
+PASSWORD_HASH_EXECUTOR = os.getenv("PASSWORD_HASH_EXECUTOR", "thread")
+
+_executor = None
+_slots = None
+_waiting = 0
+_running = 0
+
+hash_jobs_total = metrics.Counter("tendr_password_hash_jobs_total", "bcrypt hash/verify calls")
+hash_rejected_total = metrics.Counter("tendr_password_hash_rejected_total", "bcrypt calls refused because the queue was full")
+hash_wait_seconds_total = metrics.Counter("tendr_password_hash_wait_seconds_total", "Time spent queued for a bcrypt worker")
+metrics.Gauge("tendr_password_hash_queue_depth", "bcrypt calls waiting for a worker", fn=lambda: _waiting)
+metrics.Gauge("tendr_password_hash_in_flight", "bcrypt calls running", fn=lambda: _running)
+
+
+def _get_executor():
+    # created on first use, not at import: a process pool must not be forked by uvicorn --reload's watcher
+    global _executor, _slots
+    if _executor is None:
+        pool_class = ProcessPoolExecutor if PASSWORD_HASH_EXECUTOR == "process" else ThreadPoolExecutor
+        _executor = pool_class(max_workers=PASSWORD_HASH_WORKERS)
+        _slots = asyncio.Semaphore(PASSWORD_HASH_WORKERS)
+    return _executor
+
+
+def shutdown_hash_pool():
+    global _executor, _slots
+    if _executor is not None:
+        _executor.shutdown(wait=False, cancel_futures=True)
+        _executor, _slots = None, None
+
+
+# module level so the process pool can pickle them
+def _hash(password: str, rounds: int) -> str:
+    _use_rounds(rounds)
+    return pwd_context.hash(password)
+
+
+def _verify(password: str, hashed: str) -> bool:
+    return pwd_context.verify(password, hashed)
+
+
+def _verify_and_update(password: str, hashed: str, rounds: int):
+    _use_rounds(rounds)
+    return pwd_context.verify_and_update(password, hashed)
+
+
+async def _run(op: str, fn, *args):
+    global _waiting, _running
+    executor = _get_executor()
+    if _waiting >= PASSWORD_HASH_QUEUE_LIMIT:
+        hash_rejected_total.inc(op=op)
+        raise HTTPException(status_code=503, detail="Too many sign-ins in progress, please retry.", headers={"Retry-After": "1"})
+    queued_at = time.perf_counter()
+    _waiting += 1
+    try:
+        await _slots.acquire()
+    finally:
+        _waiting -= 1
+    hash_wait_seconds_total.inc(time.perf_counter() - queued_at, op=op)
+    hash_jobs_total.inc(op=op)
+    _running += 1
+    try:
+        return await asyncio.get_running_loop().run_in_executor(executor, fn, *args)
+    finally:
+        _running -= 1
+        _slots.release()
+
+
+async def hash_password(password: str) -> str:
+    """pwd_context.hash on the hashing pool. Pass an already truncated password."""
+    return await _run("hash", _hash, password, bcrypt_rounds)
+
+
+async def verify_password(password: str, hashed: str) -> bool:
+    """pwd_context.verify on the hashing pool. Pass an already truncated password."""
+    return await _run("verify", _verify, password, hashed)
+
+
+async def verify_and_update_password(password: str, hashed: str):
+    """
+    Verify, and if the stored hash is weaker than the current cost (passlib's needs_update),
+    also return a fresh hash to store: (matched, new_hash or None). Used at login.
+    """
+    return await _run("verify", _verify_and_update, password, hashed, bcrypt_rounds)
+
 def truncate_password(password: str, max_bytes: int = 72) -> str:
     """
     Truncate password to max_bytes to comply with bcrypt's 72-byte limit.
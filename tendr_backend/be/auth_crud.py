@@ -1,12 +1,12 @@
-from sqlalchemy.orm import Session
-from sqlalchemy import or_
+from sqlalchemy import select, or_
+from sqlalchemy.ext.asyncio import AsyncSession
 from models import User
-from auth import pwd_context, truncate_password
+from auth import truncate_password, hash_password, verify_password, verify_and_update_password
 from jose import jwt, JWTError
 from datetime import timedelta, datetime
 import random
 import os
-from email_verify import send_email
+import email_outbox
 from password_reset import password_reset
 from forget_password import forget_password
 # JWT has  => header | payload | SIGNATURE
@@ -19,19 +19,15 @@ ACCESS_TOKEN_EXPIRE_DAYS = int(os.getenv("ACCESS_TOKEN_EXPIRE_DAYS", "1"))
 # 72 = 72 characters max password length
 
 # creating user => registration part
-def create_user(db:Session, username:str, plain_password:str, email:str):
+async def create_user(db:AsyncSession, username:str, plain_password:str, email:str):
     email_token = random.randint(100000, 999999)
     # Truncate password to 72 bytes (bcrypt limit)
     truncated_password = truncate_password(plain_password)
-    hashed_password = pwd_context.hash(truncated_password)
+    # bcrypt is slow on purpose, keep it off the event loop
+    hashed_password = await hash_password(truncated_password)
     new_user = User( username=username, hashed_password=hashed_password, email=email, user_verification_token=str(email_token), start_acc_time= datetime.utcnow())
-
-    db.add(new_user)
-    db.commit()
-    db.refresh(new_user)
-    new_user.user_verification_token = str(email_token)
     new_user.user_verification_token_expires_at = datetime.utcnow() + timedelta(minutes=30)
-    db.commit()
+    db.add(new_user)
     plain_body = (
         f"Hi {username},\n\n"
         f"Welcome to Tendr. Your verification code is:\n\n"
@@ -83,36 +79,35 @@ def create_user(db:Session, username:str, plain_password:str, email:str):
   </table>
 </body>
 </html>"""
-    success = send_email(email, "Verify your Tendr account", plain_body, html_body=html_body)
-    
-    if success:
-        print(f"✅ Verification email sent to {email}")
-    else:
-        print(f"❌ CRITICAL: Failed to send verification email to {email}")
-        # Note: We still return the user because they are already in the DB, 
-        # but they will be 'unverified' and unable to log in.
-    
+    # user and email commit together; the outbox worker sends it (with retries) after we return
+    await email_outbox.enqueue(db, email, "Verify your Tendr account", plain_body, html_body=html_body,
+                               dedupe_key=f"verify:{email}")
+    await db.commit()
+    await db.refresh(new_user)
+    email_outbox.wake()
+    print(f"📨 Verification email queued for {email}")
+
     return new_user
 
 #to verify the email
-def verify_email(db:Session, email:str, verification_token:str):
-    user = db.query(User).filter(User.email == email).first()
+async def verify_email(db:AsyncSession, email:str, verification_token:str):
+    user = (await db.execute(select(User).where(User.email == email))).scalars().first()
     if user:
         if user.user_verification_token == verification_token and user.user_verification_token_expires_at > datetime.utcnow():
             user.user_verified = True
             user.user_verification_token = None
             user.user_verification_token_expires_at = None
             db.add(user)
-            db.commit()
-            db.refresh(user)
+            await db.commit()
+            await db.refresh(user)
             
             return True
         else:
             return False
 
 #authenticate user => Login part
-def authenticate_user(db:Session, username:str, email:str, password:str):
-    user = db.query(User).filter(or_(User.username == username, User.email == email)).first()
+async def authenticate_user(db:AsyncSession, username:str, email:str, password:str):
+    user = (await db.execute(select(User).where(or_(User.username == username, User.email == email)))).scalars().first()
     if user is None:
         print("user not found")
         return None
@@ -124,13 +119,23 @@ def authenticate_user(db:Session, username:str, email:str, password:str):
     
     # Truncate password to 72 bytes (bcrypt limit)
     truncated_password = truncate_password(password)
-    password_check = pwd_context.verify(truncated_password, user.hashed_password)
+    password_check, new_hash = await verify_and_update_password(truncated_password, user.hashed_password)
     if not password_check:
         print("password not matched")
         return None
+    # stored hash was made with fewer bcrypt rounds than we use now => upgrade it while we have the password
+    if new_hash:
+        user.hashed_password = new_hash
+        await db.commit()
     return user
     
 
+# Claims for a login token: "uid" lets id-only routes skip the user lookup,
+# "ver" is checked against user.token_version so old tokens die when it's bumped
+def token_claims(user: User) -> dict:
+    return {"sub": user.username, "uid": str(user.id), "ver": user.token_version or 0}
+
+
 # Creating JWT token
 def create_access_token(data:dict, expires_delta:timedelta):
     to_encode = data.copy()
@@ -143,8 +148,8 @@ def create_access_token(data:dict, expires_delta:timedelta):
     return encode_jwt
 
 # delete account
-def del_user(db:Session, user_id: str, plain_password:str):
-    user = db.query(User).filter(User.id == user_id).first()
+async def del_user(db:AsyncSession, user_id: str, plain_password:str):
+    user = (await db.execute(select(User).where(User.id == user_id))).scalars().first()
     # Note: Cascading delete in DB should handle tasks and pets if configured, 
     # but let's ensure the user object exists first.
     if user is None:
@@ -152,18 +157,18 @@ def del_user(db:Session, user_id: str, plain_password:str):
         return None
     # Truncate password to 72 bytes (bcrypt limit)
     truncated_password = truncate_password(plain_password)
-    password_check = pwd_context.verify(truncated_password, user.hashed_password)
+    password_check = await verify_password(truncated_password, user.hashed_password)
     if not password_check:
         print("password not matched")
         return False
-    db.delete(user)
-    db.commit()
+    await db.delete(user)
+    await db.commit()
     return True
 
 #to reset password
-def reset_password(db:Session, new_password:str, new_password_confirm: str, old_password:str, username:str):
-    return password_reset(db, new_password, new_password_confirm, old_password, username)
+async def reset_password(db:AsyncSession, new_password:str, new_password_confirm: str, old_password:str, username:str):
+    return await password_reset(db, new_password, new_password_confirm, old_password, username)
 
 #when user forgot password while login
-def forgot_password(db:Session, entered_verify_code:str, new_password:str, new_password_confirm:str, username:str):
-    return forget_password(db, entered_verify_code, username, new_password, new_password_confirm)
\ No newline at end of file
+async def forgot_password(db:AsyncSession, entered_verify_code:str, new_password:str, new_password_confirm:str, username:str):
+    return await forget_password(db, entered_verify_code, username, new_password, new_password_confirm)
\ No newline at end of file
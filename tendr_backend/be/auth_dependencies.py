@@ -1,31 +1,97 @@
 from fastapi import Depends, HTTPException, status
 from fastapi.security import OAuth2PasswordBearer
 from jose import JWTError, jwt
-from sqlalchemy.orm import Session
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
 from datetime import datetime
-from database import get_db   # adjust path based on your project
+from dataclasses import dataclass
+from database import get_db, AsyncSessionLocal   # adjust path based on your project
 from models import User        # your User SQLAlchemy model
 from auth_crud import SECRET_KEY, ALGORITHM  # wherever you defined them
+import user_cache
 
 oauth2_scheme = OAuth2PasswordBearer(tokenUrl="token")
 
 
-def get_current_user(token: str = Depends(oauth2_scheme), db: Session = Depends(get_db)):
-    credentials_exception = HTTPException(
+def _credentials_exception():
+    return HTTPException(
         status_code=status.HTTP_401_UNAUTHORIZED,
         detail="Could not validate credentials",
         headers={"WWW-Authenticate": "Bearer"},
     )
+
+
+def _decode(token: str) -> dict:
     try:
         payload = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
-        username: str = payload.get("sub")
-        if username is None:
-            raise credentials_exception
     except JWTError:
-        raise credentials_exception
+        raise _credentials_exception()
+    if payload.get("sub") is None:
+        raise _credentials_exception()
+    return payload
+
+
+async def get_current_user(token: str = Depends(oauth2_scheme), db: AsyncSession = Depends(get_db)):
+    credentials_exception = _credentials_exception()
+    payload = _decode(token)
+    username: str = payload.get("sub")
     
-    # Fetch the user from DB using username or email
-    user = db.query(User).filter(User.username == username).first()
+    # Warm path: no query at all (see user_cache.py for TTL / invalidation)
+    user = user_cache.get(username)
     if user is None:
+        # Fetch the user from DB using username or email
+        user = (await db.execute(select(User).where(User.username == username))).scalars().first()
+        if user is None:
+            raise credentials_exception
+        # detach it: the cached copy is shared between requests and must not follow this session around
+        db.expunge(user)
+        user_cache.put(username, user)
+    # tokens from before the last password change are dead (tokens without "ver" predate the claim)
+    if "ver" in payload and payload["ver"] != user.token_version:
         raise credentials_exception
+    # lets database.RoutingSession remember this user's writes (read-your-writes)
+    db.info["user_id"] = user.id
     return user
+
+
+@dataclass(frozen=True)
+class TokenUser:
+    """What the token itself says about the caller. Enough for routes that only filter by current_user.id."""
+    id: str
+    username: str
+
+
+async def get_token_user(token: str = Depends(oauth2_scheme), db: AsyncSession = Depends(get_db)) -> TokenUser:
+    """
+    Lighter get_current_user for routes that only need current_user.id (tasks, pets, focus).
+    Takes the id from the "uid" claim and only checks the "ver" claim is still current:
+    no query when the version is cached, a primary key lookup of one column when it isn't.
+    Tokens issued before uid/ver existed go through get_current_user.
+    """
+    payload = _decode(token)
+    user_id, version = payload.get("uid"), payload.get("ver")
+    if user_id is None or version is None:
+        user = await get_current_user(token, db)
+        return TokenUser(id=user.id, username=user.username)
+
+    current = user_cache.get_token_version(user_id)
+    if current is None:
+        current = (await db.execute(select(User.token_version).where(User.id == user_id))).scalar()
+        if current is None:
+            # account deleted
+            raise _credentials_exception()
+        user_cache.put_token_version(user_id, current)
+    if version != current:
+        raise _credentials_exception()
+    db.info["user_id"] = user_id
+    return TokenUser(id=user_id, username=payload["sub"])
+
+
+async def get_read_db(current_user: TokenUser = Depends(get_token_user)):
+    """
+    Session for read-only routes: may be served by a replica (see database.RoutingSession).
+    Falls back to the primary right after this user's own writes, or when no replica is healthy.
+    """
+    async with AsyncSessionLocal(info={"read_only": True, "user_id": current_user.id}) as db:
+        yield db
+
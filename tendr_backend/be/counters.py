@@ -0,0 +1,227 @@
+"""
+Per-user totals kept on the user row by triggers: user.focus_seconds_total,
+user.tasks_completed and user.tasks_open.
+
+/focus/total and the stats count read them with a primary key lookup instead of
+summing the user's history. Postgres keeps them in step: statement-level AFTER
+triggers on tasks and focus_sessions (installed by migration 15) add up what the
+statement changed, from its transition tables, and apply it to the user rows
+in the same transaction. Every write path is covered without the app doing anything,
+including the batch endpoints, cascades and scripts.
+
+The triggers run once per statement, not per row: a multi-row INSERT / UPDATE / DELETE
+(the batch endpoints) costs one user row update. Bulk loads should do the same, an
+executemany of single-row inserts pays it for every row.
+
+Lock order: a task / focus write now takes its user's row lock right away, so
+everything that also touches user_daily_activity writes it after the user row (see
+xp_service: task/pet rows, then the user row, then the activity row).
+
+reconcile() recomputes the totals from the source tables and corrects any that drifted
+(triggers disabled for a restore, session_replication_role = replica, manual fixes...).
+reconcile_loop runs it from the lifespan every COUNTER_RECONCILE_SECONDS;
+`python counters.py` runs it once. Drift should stay at 0: tendr_counter_drift_total
+counts corrected users.
+"""
+import asyncio
+import os
+
+from sqlalchemy import select, update, func, literal, union_all, or_, text
+from sqlalchemy.exc import OperationalError
+
+import metrics
+from models import Task, FocusSession, User
+
+COUNTER_RECONCILE_SECONDS = float(os.getenv("COUNTER_RECONCILE_SECONDS", "3600"))
+COUNTER_RECONCILE_BATCH = int(os.getenv("COUNTER_RECONCILE_BATCH", "500"))
+# one reconciler at a time across processes
+_RECONCILE_LOCK_ID = 0x636E7472  # "cntr"
+
+counter_drift_total = metrics.Counter("tendr_counter_drift_total", "Users whose counters reconcile() corrected")
+
+# table: (SET clause, per-user sums over the changed rows, "anything moved", columns read)
+# One plpgsql function per table; INSERT / UPDATE / DELETE each get their own statement
+# trigger, since a trigger with transition tables can only have one event. The function
+# picks its branch from TG_OP: only the branch that runs gets planned, so it never
+# references a transition table its event lacks.
+_COUNTED = {
+    "tasks": (
+        "tasks_completed = u.tasks_completed + d.completed, tasks_open = u.tasks_open + d.open",
+        "sum(sign * (completed IS TRUE)::int) AS completed, sum(sign * (completed IS NOT TRUE)::int) AS open",
+        "d.completed <> 0 OR d.open <> 0",
+        "user_id, completed",
+    ),
+    "focus_sessions": (
+        "focus_seconds_total = u.focus_seconds_total + d.seconds",
+        "sum(sign * coalesce(duration_seconds, 0)) AS seconds",
+        "d.seconds <> 0",
+        "user_id, duration_seconds",
+    ),
+}
+
+
+def _apply(table: str, rows: str) -> str:
+    set_, sums, changed, _ = _COUNTED[table]
+    return f"""
+        UPDATE "user" u SET {set_}
+        FROM (SELECT user_id, {sums} FROM ({rows}) r GROUP BY user_id) d
+        WHERE u.id = d.user_id AND ({changed});"""
+
+
+def trigger_ddl(table: str):
+    """The statements that (re)install the counter triggers of table."""
+    columns = _COUNTED[table][3]
+    new_rows = f"SELECT {columns}, 1 AS sign FROM new_rows"
+    old_rows = f"SELECT {columns}, -1 AS sign FROM old_rows"
+    function = f"{table}_user_counters"
+    statements = [f"""
+        CREATE OR REPLACE FUNCTION {function}() RETURNS trigger AS $$
+        BEGIN
+            IF TG_OP = 'INSERT' THEN {_apply(table, new_rows)}
+            ELSIF TG_OP = 'DELETE' THEN {_apply(table, old_rows)}
+            ELSE {_apply(table, new_rows + " UNION ALL " + old_rows)}
+            END IF;
+            RETURN NULL;
+        END $$ LANGUAGE plpgsql
+    """]
+    for event, referencing in (
+        ("INSERT", "NEW TABLE AS new_rows"),
+        ("UPDATE", "NEW TABLE AS new_rows OLD TABLE AS old_rows"),
+        ("DELETE", "OLD TABLE AS old_rows"),
+    ):
+        trigger = f"{function}_{event.lower()}"
+        statements.append(f"DROP TRIGGER IF EXISTS {trigger} ON {table}")
+        statements.append(
+            f"CREATE TRIGGER {trigger} AFTER {event} ON {table} REFERENCING {referencing} "
+            f"FOR EACH STATEMENT EXECUTE FUNCTION {function}()"
+        )
+    return statements
+
+
+def install(conn):
+    for table in _COUNTED:
+        for statement in trigger_ddl(table):
+            conn.execute(text(statement))
+
+
+# ---------------------------------------------------
+# reconciliation
+# ---------------------------------------------------
+
+def _expected(user_ids=None):
+    """(id, focus_seconds_total, tasks_completed, tasks_open) from the source tables."""
+    def mine(query, column):
+        return query.where(column.in_(user_ids)) if user_ids is not None else query
+
+    zero = literal(0)
+    source = union_all(
+        mine(select(
+            Task.user_id,
+            zero.label("focus_seconds_total"),
+            func.count().filter(Task.completed.is_(True)).label("tasks_completed"),
+            func.count().filter(Task.completed.isnot(True)).label("tasks_open"),
+        ), Task.user_id).group_by(Task.user_id),
+        mine(select(FocusSession.user_id, func.sum(FocusSession.duration_seconds), zero, zero),
+             FocusSession.user_id).group_by(FocusSession.user_id),
+    ).subquery()
+    totals = (
+        select(
+            source.c.user_id,
+            func.sum(source.c.focus_seconds_total).label("focus_seconds_total"),
+            func.sum(source.c.tasks_completed).label("tasks_completed"),
+            func.sum(source.c.tasks_open).label("tasks_open"),
+        ).group_by(source.c.user_id).subquery()
+    )
+    # users with no tasks or sessions at all should be at 0
+    return mine(
+        select(
+            User.id,
+            func.coalesce(totals.c.focus_seconds_total, 0).label("focus_seconds_total"),
+            func.coalesce(totals.c.tasks_completed, 0).label("tasks_completed"),
+            func.coalesce(totals.c.tasks_open, 0).label("tasks_open"),
+        ).outerjoin(totals, totals.c.user_id == User.id),
+        User.id,
+    ).subquery()
+
+
+def reconcile(conn, user_ids=None) -> list:
+    """
+    Correct the counters of user_ids (None => everyone) on a sync connection.
+    Returns [(user_id, column, stored, expected)] for every counter that was off.
+    """
+    expected = _expected(user_ids)
+    columns = ("focus_seconds_total", "tasks_completed", "tasks_open")
+    drifted = conn.execute(
+        select(User.id, *(getattr(User, c) for c in columns), *(expected.c[c] for c in columns))
+        .join(expected, expected.c.id == User.id)
+        .where(or_(*(getattr(User, c) != expected.c[c] for c in columns)))
+        .order_by(User.id)
+    ).all()
+    if not drifted:
+        return []
+    # bump data_version too: the counters are in ETag'd responses
+    conn.execute(
+        update(User).where(User.id == expected.c.id, User.id.in_([row[0] for row in drifted]))
+        .values({**{c: expected.c[c] for c in columns}, "data_version": User.data_version + 1})
+    )
+    return [
+        (row[0], column, int(row[1 + i]), int(row[1 + len(columns) + i]))
+        for row in drifted for i, column in enumerate(columns)
+        if row[1 + i] != row[1 + len(columns) + i]
+    ]
+
+
+def reconcile_all(engine, batch: int = COUNTER_RECONCILE_BATCH, report: bool = True) -> list:
+    """
+    reconcile() every user, batch users per transaction, safe to run while the app serves.
+    REPEATABLE READ: a trigger moving a counter after the batch's snapshot makes the
+    correction fail with a serialization error (and the batch is redone) instead of
+    overwriting the newer value with the snapshot's.
+    report=False for the initial backfill (migration 15): every user starts off "drifted" there.
+    """
+    drift = []
+    with engine.connect() as lock_conn:
+        if not lock_conn.execute(text("SELECT pg_try_advisory_lock(:id)"), {"id": _RECONCILE_LOCK_ID}).scalar():
+            return drift  # another process is on it
+        try:
+            user_ids = lock_conn.execute(select(User.id).order_by(User.id)).scalars().all()
+            lock_conn.commit()
+            for i in range(0, len(user_ids), batch):
+                chunk = user_ids[i:i + batch]
+                while True:
+                    try:
+                        with engine.connect().execution_options(isolation_level="REPEATABLE READ") as conn:
+                            found = reconcile(conn, chunk)
+                            conn.commit()
+                        break
+                    except OperationalError as e:
+                        # 40P01: a write locking several users' rows in another order (a script,
+                        # a batch) can deadlock with the batch's UPDATE; redone like a conflict
+                        if getattr(e.orig, "pgcode", None) not in ("40001", "40P01"):
+                            raise
+                drift.extend(found)
+        finally:
+            lock_conn.execute(text("SELECT pg_advisory_unlock(:id)"), {"id": _RECONCILE_LOCK_ID})
+            lock_conn.commit()
+    if report:
+        for user_id, column, stored, expected in drift:
+            print(f"Counter drift: user {user_id} {column} was {stored}, should be {expected}")
+        counter_drift_total.inc(len({d[0] for d in drift}))
+    return drift
+
+
+async def reconcile_loop(engine):
+    """Background task (lifespan): reconcile_all every COUNTER_RECONCILE_SECONDS, in a thread."""
+    while True:
+        await asyncio.sleep(COUNTER_RECONCILE_SECONDS)
+        try:
+            await asyncio.to_thread(reconcile_all, engine)
+        except Exception as e:
+            print(f"Counter reconciliation failed: {e}")
+
+
+if __name__ == "__main__":
+    import sys
+    from database import engine
+    drift = reconcile_all(engine, int(sys.argv[1]) if len(sys.argv) > 1 else COUNTER_RECONCILE_BATCH)
+    print(f"{len(drift)} counters corrected")
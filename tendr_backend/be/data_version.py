@@ -0,0 +1,77 @@
+"""
+Per-user data version, served as the ETag of the endpoints clients poll
+(GET /tasks, GET /pet, /analysis, /activity, /focus/total, /focus/today).
+
+The GUI refetches on every page switch, and again after every task completion,
+almost always to get the same data back. user.data_version only goes up: any
+flush that inserts, changes or deletes one of the user's tasks, pets, pet days or
+focus sessions bumps it in the same transaction. A request whose If-None-Match
+still matches costs one primary key lookup and gets a 304, with no list query.
+
+- ORM writes are caught by the after_flush hook below. Code that changes those
+  tables with a bulk UPDATE/DELETE has to call bump(db, user_id) itself.
+- the ETag also covers today's (UTC) date, since effective points, streaks,
+  "today" totals and pet starvation move with the calendar, not with writes
+- the ETag covers the user id, so two accounts at the same version never share one
+"""
+import hashlib
+from datetime import datetime
+from itertools import chain
+
+from sqlalchemy import event, select, update
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import Session
+from starlette.requests import Request
+from starlette.responses import Response
+
+from models import User, Task, Pet, FocusSession, PetQualifyingDay
+
+_TRACKED = (Task, Pet, FocusSession, PetQualifyingDay)
+
+
+async def bump(db: AsyncSession, user_id):
+    await db.execute(update(User).where(User.id == user_id).values(data_version=User.data_version + 1))
+
+
+async def etag(db: AsyncSession, user_id, *extra) -> str:
+    """Weak ETag for user_id's current data; pass anything else the response depends on as extra."""
+    version = (await db.execute(select(User.data_version).where(User.id == user_id))).scalar()
+    raw = ":".join(str(part) for part in (user_id, version, datetime.utcnow().date(), *extra))
+    return 'W/"' + hashlib.sha1(raw.encode()).hexdigest()[:20] + '"'
+
+
+def headers(tag: str) -> dict:
+    # no-cache = keep it, but revalidate with If-None-Match every time
+    return {"ETag": tag, "Cache-Control": "private, no-cache"}
+
+
+def not_modified(request: Request, tag: str):
+    """A 304 response if the request's If-None-Match covers tag, else None."""
+    if_none_match = request.headers.get("if-none-match")
+    if not if_none_match:
+        return None
+    # weak comparison (RFC 9110 13.1.2): the W/ prefix doesn't matter
+    wanted = {t.strip().removeprefix("W/") for t in if_none_match.split(",")}
+    if "*" in wanted or tag.removeprefix("W/") in wanted:
+        return Response(status_code=304, headers=headers(tag))
+    return None
+
+
+# ---------------------------------------------------
+# bump on flush
+# ---------------------------------------------------
+
+@event.listens_for(Session, "after_flush")
+def _bump_changed_users(session, flush_context):
+    # new/dirty/deleted still hold what was just flushed; the bump joins the same transaction
+    modified = (obj for obj in session.dirty if session.is_modified(obj, include_collections=False))
+    user_ids = {
+        obj.user_id
+        for obj in chain(session.new, modified, session.deleted)
+        if isinstance(obj, _TRACKED) and obj.user_id is not None
+    }
+    if not user_ids:
+        return
+    session.connection().execute(
+        update(User).where(User.id.in_(sorted(user_ids))).values(data_version=User.data_version + 1)
+    )
@@ -1,6 +1,13 @@
-from sqlalchemy import create_engine
-from sqlalchemy.orm import sessionmaker, declarative_base
+from sqlalchemy import create_engine, event, exc, text
+from sqlalchemy.pool import QueuePool, AsyncAdaptedQueuePool
+from sqlalchemy.orm import sessionmaker, declarative_base, Session
+from sqlalchemy.ext.asyncio import create_async_engine, async_sessionmaker, AsyncSession
+from sqlalchemy.sql.dml import UpdateBase
+import asyncio
+import itertools
+import time
 import os
+import metrics
 """
 This file sets up the database connection and base class for SQLAlchemy models.
 """
@@ -17,18 +24,131 @@ BASE_DIR = os.path.dirname(os.path.abspath(__file__))
 DATABASE_URL = os.getenv("DATABASE_URL")
 
 # Handle potential SQLAlchemy compatibility issue with 'postgres://' URLs
-if DATABASE_URL and DATABASE_URL.startswith("postgres://"):
-    DATABASE_URL = DATABASE_URL.replace("postgres://", "postgresql://", 1)
+def _fix_scheme(url: str) -> str:
+    if url and url.startswith("postgres://"):
+        return url.replace("postgres://", "postgresql://", 1)
+    return url
+
+DATABASE_URL = _fix_scheme(DATABASE_URL)
 
 if not DATABASE_URL:
     raise RuntimeError("DATABASE_URL is not set")
 
 
+def _to_async_url(url: str) -> str:
+    """
+    Turn the sync (psycopg2) url into an asyncpg one.
+    asyncpg doesn't understand libpq's sslmode=..., it takes ssl=... instead.
+    """
+    scheme, rest = url.split("://", 1)
+    if scheme in ("postgresql", "postgresql+psycopg2", "postgresql+psycopg"):
+        scheme = "postgresql+asyncpg"
+    rest = rest.replace("sslmode=", "ssl=")
+    return f"{scheme}://{rest}"
+
+
+# Request traffic goes through the async engine, override it only if the async url
+# can't be derived from DATABASE_URL
+ASYNC_DATABASE_URL = os.getenv("ASYNC_DATABASE_URL") or _to_async_url(DATABASE_URL)
+
+
+# ---------------------------------------------------
+# CONNECTION POOL
+# ---------------------------------------------------
+#per engine, per worker process: a worker can hold up to DB_POOL_SIZE + DB_MAX_OVERFLOW connections,
+#so workers * (size + overflow) has to stay under Postgres max_connections (GET /ready shows both)
+DB_POOL_SIZE = int(os.getenv("DB_POOL_SIZE", "5"))
+DB_MAX_OVERFLOW = int(os.getenv("DB_MAX_OVERFLOW", "10"))
+#seconds a request waits for a free connection before erroring
+DB_POOL_TIMEOUT = float(os.getenv("DB_POOL_TIMEOUT", "30"))
+#close connections older than this many seconds (-1 => never), keeps us under proxy/LB idle cutoffs
+DB_POOL_RECYCLE = int(os.getenv("DB_POOL_RECYCLE", "1800"))
+#"always" => SELECT 1 on every checkout (the old behaviour), "never" => no ping,
+#a number => only ping connections that sat idle in the pool longer than that many seconds
+DB_POOL_PRE_PING = os.getenv("DB_POOL_PRE_PING", "30").strip().lower()
+
+
+class _WaitTimingMixin:
+    """Times how long each checkout waited on the pool (only slow when it's saturated)."""
+    wait_count = 0
+    wait_total = 0.0
+    wait_max = 0.0
+
+    def _do_get(self):
+        start = time.perf_counter()
+        try:
+            return super()._do_get()
+        finally:
+            waited = time.perf_counter() - start
+            self.wait_count += 1
+            self.wait_total += waited
+            self.wait_max = max(self.wait_max, waited)
+
+
+class TimedQueuePool(_WaitTimingMixin, QueuePool):
+    pass
+
+
+class TimedAsyncQueuePool(_WaitTimingMixin, AsyncAdaptedQueuePool):
+    pass
+
+
+def _pool_kwargs(is_async: bool) -> dict:
+    return dict(
+        poolclass=TimedAsyncQueuePool if is_async else TimedQueuePool,
+        pool_size=DB_POOL_SIZE,
+        max_overflow=DB_MAX_OVERFLOW,
+        pool_timeout=DB_POOL_TIMEOUT,
+        pool_recycle=DB_POOL_RECYCLE,
+        pool_pre_ping=DB_POOL_PRE_PING == "always",
+    )
+
+
+def _ping_when_idle(sync_engine, idle_seconds: float):
+    """Pre-ping only connections that sat in the pool for idle_seconds, instead of every checkout."""
+
+    @event.listens_for(sync_engine, "checkin")
+    def _checked_in(dbapi_connection, connection_record):
+        connection_record.info["checked_in_at"] = time.monotonic()
+
+    @event.listens_for(sync_engine, "checkout")
+    def _checkout(dbapi_connection, connection_record, connection_proxy):
+        checked_in_at = connection_record.info.get("checked_in_at")
+        if checked_in_at is None or time.monotonic() - checked_in_at < idle_seconds:
+            return
+        try:
+            sync_engine.dialect.do_ping(dbapi_connection)
+        except Exception:
+            # the pool throws this connection away and checks out a fresh one
+            raise exc.DisconnectionError()
+
+
+def _make_engine(url: str, is_async: bool):
+    new_engine = create_async_engine(url, **_pool_kwargs(True)) if is_async else create_engine(url, **_pool_kwargs(False))
+    if DB_POOL_PRE_PING not in ("always", "never"):
+        _ping_when_idle(new_engine.sync_engine if is_async else new_engine, float(DB_POOL_PRE_PING))
+    return new_engine
+
+
+def pool_stats(some_engine) -> dict:
+    pool = some_engine.pool
+    return {
+        "size": pool.size(),
+        "max_overflow": DB_MAX_OVERFLOW,
+        "checked_out": pool.checkedout(),
+        "idle": pool.checkedin(),
+        # QueuePool counts overflow from -size, only the part above pool_size is real overflow
+        "overflow": max(0, pool.overflow()),
+        "checkouts": pool.wait_count,
+        "avg_wait_ms": round(1000 * pool.wait_total / pool.wait_count, 3) if pool.wait_count else 0.0,
+        "max_wait_ms": round(1000 * pool.wait_max, 3),
+    }
+
 
 #main connection b/w db and app
 #connect_args={"check_same_thread": False} => this allows multiple parts of your app to access the db at the same time
 
-engine = create_engine(DATABASE_URL, pool_pre_ping=True)
+engine = _make_engine(DATABASE_URL, is_async=False)
 
 #temp connection to db
 #autocommit=False => give control and changes are saved only after i commit!
@@ -36,12 +156,138 @@ engine = create_engine(DATABASE_URL, pool_pre_ping=True)
 #bind=engine => tells your session, “This is the database you’re working with.”
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
 
+#async version of the same thing, used by every route
+#an awaiting request gives its worker back to the event loop instead of pinning a threadpool thread
+#expire_on_commit=False => objects stay readable after commit (async sessions can't lazy-reload expired attributes)
+async_engine = _make_engine(ASYNC_DATABASE_URL, is_async=True)
+
 Base = declarative_base()
 
+
+# ---------------------------------------------------
+# READ REPLICAS
+# ---------------------------------------------------
+#comma separated list, e.g. DATABASE_REPLICA_URLS=postgresql://...replica1,postgresql://...replica2
+#when it's empty every read goes to the primary, same as before
+REPLICA_URLS = [u.strip() for u in os.getenv("DATABASE_REPLICA_URLS", "").split(",") if u.strip()]
+#a replica further behind than this stops getting reads until it catches up
+REPLICA_MAX_LAG_SECONDS = float(os.getenv("REPLICA_MAX_LAG_SECONDS", "2"))
+#after a user's own write, their reads stay on the primary this long (read-your-writes).
+#Keep it >= REPLICA_MAX_LAG_SECONDS: anything older is then already on every replica we read from.
+READ_YOUR_WRITES_SECONDS = float(os.getenv("READ_YOUR_WRITES_SECONDS", str(REPLICA_MAX_LAG_SECONDS)))
+
+replica_engines = [_make_engine(_to_async_url(_fix_scheme(url)), is_async=True) for url in REPLICA_URLS]
+#seconds behind the primary, None => not measured yet or unreachable (gets no reads)
+replica_lag = [None] * len(replica_engines)
+
+#user id -> time.monotonic() of their last commit that wrote something.
+#Per process: a write served by another worker is only covered by the lag bound above.
+_last_write = {}
+_round_robin = itertools.count()
+
+read_sessions_total = metrics.Counter("tendr_db_read_sessions_total", "Read-only sessions by where they were routed")
+metrics.Gauge(
+    "tendr_replica_lag_seconds", "Replication lag per replica, -1 when unknown",
+    fn=lambda: [({"replica": str(i)}, -1 if lag is None else lag) for i, lag in enumerate(replica_lag)],
+)
+
+
+
+def all_pools() -> dict:
+    """name -> engine for every request-serving pool, used by /ready and /metrics"""
+    pools = {"primary": async_engine}
+    pools.update({f"replica{i}": replica for i, replica in enumerate(replica_engines)})
+    return pools
+
+
+def _pool_samples(key: str):
+    return [({"pool": name}, pool_stats(e)[key]) for name, e in all_pools().items()]
+
+
+metrics.Gauge("tendr_db_pool_checked_out", "Connections currently in use", fn=lambda: _pool_samples("checked_out"))
+metrics.Gauge("tendr_db_pool_idle", "Connections sitting idle in the pool", fn=lambda: _pool_samples("idle"))
+metrics.Gauge("tendr_db_pool_overflow", "Connections open above pool_size", fn=lambda: _pool_samples("overflow"))
+metrics.Gauge("tendr_db_pool_avg_wait_ms", "Average time a checkout waited for a connection", fn=lambda: _pool_samples("avg_wait_ms"))
+
+
+def recently_wrote(user_id) -> bool:
+    wrote_at = _last_write.get(user_id)
+    return wrote_at is not None and time.monotonic() - wrote_at < READ_YOUR_WRITES_SECONDS
+
+
+def _pick_replica(user_id):
+    """Index of the replica to read from, or None for the primary."""
+    if user_id is not None and recently_wrote(user_id):
+        return None
+    healthy = [i for i, lag in enumerate(replica_lag) if lag is not None and lag <= REPLICA_MAX_LAG_SECONDS]
+    if not healthy:
+        return None
+    return healthy[next(_round_robin) % len(healthy)]
+
+
+class RoutingSession(Session):
+    """
+    Session that can send its reads to a replica.
+    Only sessions opened with info={"read_only": True} ever leave the primary, and only until
+    they write something: flushes and UPDATE/INSERT/DELETE statements always go to the primary,
+    and after that the session stays there so it reads its own changes back.
+    The replica is picked once per session so all its queries see the same snapshot.
+    """
+
+    def get_bind(self, mapper=None, clause=None, **kw):
+        if self._flushing or isinstance(clause, UpdateBase):
+            self.info["wrote"] = True
+        if not self.info.get("read_only") or self.info.get("wrote"):
+            return async_engine.sync_engine
+        if "replica" not in self.info:
+            self.info["replica"] = _pick_replica(self.info.get("user_id"))
+            read_sessions_total.inc(target="primary" if self.info["replica"] is None else "replica")
+        if self.info["replica"] is None:
+            return async_engine.sync_engine
+        return replica_engines[self.info["replica"]].sync_engine
+
+
+@event.listens_for(RoutingSession, "after_commit")
+def _remember_write(session):
+    user_id = session.info.get("user_id")
+    if not session.info.get("wrote") or user_id is None:
+        return
+    now = time.monotonic()
+    _last_write[user_id] = now
+    if len(_last_write) > 10000:
+        for key, wrote_at in list(_last_write.items()):
+            if now - wrote_at >= READ_YOUR_WRITES_SECONDS:
+                _last_write.pop(key, None)
+
+
+_LAG_SQL = text("""
+    SELECT CASE
+        WHEN NOT pg_is_in_recovery() THEN 0
+        WHEN pg_last_wal_receive_lsn() = pg_last_wal_replay_lsn() THEN 0
+        ELSE COALESCE(EXTRACT(EPOCH FROM now() - pg_last_xact_replay_timestamp()), 0)
+    END
+""")
+
+
+async def monitor_replica_lag(interval: float = 5.0):
+    """Background task: keeps replica_lag fresh so lagging replicas drop out of rotation."""
+    while True:
+        for i, replica in enumerate(replica_engines):
+            try:
+                async with replica.connect() as conn:
+                    replica_lag[i] = float((await conn.execute(_LAG_SQL)).scalar())
+            except Exception as e:
+                print(f"Replica {i} lag check failed: {e}")
+                replica_lag[i] = None
+        await asyncio.sleep(interval)
+
+
+AsyncSessionLocal = async_sessionmaker(
+    async_engine, class_=AsyncSession, sync_session_class=RoutingSession,
+    autoflush=False, expire_on_commit=False,
+)
+
 #this is for testing my code (good while using fastapi)
-def get_db():
-    db = SessionLocal()
-    try:
+async def get_db():
+    async with AsyncSessionLocal() as db:
         yield db
-    finally:
-        db.close()
\ No newline at end of file
@@ -0,0 +1,152 @@
+"""
+Durable email outbox.
+
+Routes never talk to the email providers any more. They call enqueue() inside
+the transaction that creates the OTP, so the email row and the code it carries
+commit together. A background worker (delivery_loop, started by the lifespan)
+then sends it with send_email. The request returns as soon as the row is
+committed instead of waiting up to 25s on the bridge + Resend timeouts.
+
+- retries: a failed send is retried with exponential backoff, up to OUTBOX_MAX_ATTEMPTS
+- dedupe: a resent OTP supersedes the still-pending one with the same dedupe_key,
+  so a user hammering "resend" gets one email with the newest code
+- several workers/processes can run: rows are claimed with FOR UPDATE SKIP LOCKED,
+  and claiming pushes next_attempt_at forward (a lease), so a worker that dies
+  mid-send leaves the row to be picked up again later
+- status per row: pending / sent / failed / superseded, plus attempts, last_error, provider
+"""
+import asyncio
+import os
+import time
+from datetime import datetime, timedelta
+
+from sqlalchemy import select, update, delete
+from sqlalchemy.ext.asyncio import AsyncSession
+
+import metrics
+from database import AsyncSessionLocal
+from email_verify import send_email
+from models import EmailOutbox
+
+OUTBOX_POLL_SECONDS = float(os.getenv("OUTBOX_POLL_SECONDS", "5"))
+OUTBOX_BATCH_SIZE = int(os.getenv("OUTBOX_BATCH_SIZE", "10"))
+OUTBOX_MAX_ATTEMPTS = int(os.getenv("OUTBOX_MAX_ATTEMPTS", "6"))
+#how long a claimed row stays invisible to other workers while it's being sent
+OUTBOX_LEASE_SECONDS = int(os.getenv("OUTBOX_LEASE_SECONDS", "120"))
+#sent / superseded / failed rows are deleted after this many days
+OUTBOX_KEEP_DAYS = int(os.getenv("OUTBOX_KEEP_DAYS", "7"))
+
+emails_total = metrics.Counter("tendr_outbox_emails_total", "Outbox deliveries by result")
+
+_wakeup = None
+
+
+async def enqueue(db: AsyncSession, to_email: str, subject: str, body: str, html_body: str = None, dedupe_key: str = None):
+    """
+    Add an email to the caller's transaction; it goes out once the caller commits.
+    Call wake() after the commit so the worker doesn't wait for its next poll.
+    """
+    if dedupe_key:
+        await db.execute(
+            update(EmailOutbox)
+            .where(EmailOutbox.dedupe_key == dedupe_key, EmailOutbox.status == "pending")
+            .values(status="superseded")
+        )
+    db.add(EmailOutbox(to_email=to_email, subject=subject, body=body, html_body=html_body, dedupe_key=dedupe_key))
+
+
+def wake():
+    if _wakeup is not None:
+        _wakeup.set()
+
+
+async def _claim(db: AsyncSession):
+    now = datetime.utcnow()
+    due = (
+        select(EmailOutbox.id)
+        .where(EmailOutbox.status == "pending", EmailOutbox.next_attempt_at <= now)
+        .order_by(EmailOutbox.next_attempt_at)
+        .limit(OUTBOX_BATCH_SIZE)
+        .with_for_update(skip_locked=True)
+    )
+    rows = (await db.execute(
+        update(EmailOutbox)
+        .where(EmailOutbox.id.in_(due.scalar_subquery()))
+        .values(attempts=EmailOutbox.attempts + 1, next_attempt_at=now + timedelta(seconds=OUTBOX_LEASE_SECONDS))
+        .returning(EmailOutbox),
+        execution_options={"synchronize_session": False},
+    )).scalars().all()
+    await db.commit()
+    return rows
+
+
+async def _send(email: EmailOutbox):
+    """(provider, error)"""
+    try:
+        provider = await send_email(email.to_email, email.subject, email.body, html_body=email.html_body)
+        return provider, None if provider else "no email provider accepted the message"
+    except Exception as e:
+        return None, str(e)
+
+
+async def _record(db: AsyncSession, email: EmailOutbox, provider, error):
+    if provider:
+        values = {"status": "sent", "sent_at": datetime.utcnow(), "provider": provider, "last_error": None}
+        emails_total.inc(result="sent")
+    elif email.attempts >= OUTBOX_MAX_ATTEMPTS:
+        values = {"status": "failed", "last_error": error}
+        emails_total.inc(result="failed")
+        print(f"❌ Giving up on email {email.id} to {email.to_email} after {email.attempts} attempts: {error}")
+    else:
+        # 30s, 1m, 2m, 4m...
+        retry_in = timedelta(seconds=30 * 2 ** (email.attempts - 1))
+        values = {"next_attempt_at": datetime.utcnow() + retry_in, "last_error": error}
+        emails_total.inc(result="retry")
+    # a newer OTP may have superseded this row while it was being sent: only touch pending rows
+    await db.execute(
+        update(EmailOutbox).where(EmailOutbox.id == email.id, EmailOutbox.status == "pending").values(**values)
+    )
+
+
+async def deliver_due() -> int:
+    """Send one batch of due emails. Returns how many were claimed."""
+    async with AsyncSessionLocal() as db:
+        emails = await _claim(db)
+        # sends in parallel, so a slow provider costs one timeout per batch (well inside the lease)
+        results = await asyncio.gather(*(_send(email) for email in emails))
+        for email, (provider, error) in zip(emails, results):
+            await _record(db, email, provider, error)
+        await db.commit()
+    return len(emails)
+
+
+async def purge_old():
+    async with AsyncSessionLocal() as db:
+        await db.execute(delete(EmailOutbox).where(
+            EmailOutbox.status != "pending",
+            EmailOutbox.created_at < datetime.utcnow() - timedelta(days=OUTBOX_KEEP_DAYS),
+        ))
+        await db.commit()
+
+
+async def delivery_loop():
+    """Background task (lifespan): deliver due emails, wake up early when something was enqueued."""
+    global _wakeup
+    _wakeup = asyncio.Event()
+    last_purge = 0.0
+    while True:
+        claimed = 0
+        try:
+            claimed = await deliver_due()
+            if time.monotonic() - last_purge > 3600:
+                await purge_old()
+                last_purge = time.monotonic()
+        except Exception as e:
+            print(f"Email outbox worker error: {e}")
+        if claimed >= OUTBOX_BATCH_SIZE:
+            continue
+        try:
+            await asyncio.wait_for(_wakeup.wait(), OUTBOX_POLL_SECONDS)
+        except asyncio.TimeoutError:
+            pass
+        _wakeup.clear()
@@ -1,15 +1,119 @@
 import os
-import requests
+import time
+import httpx
 from dotenv import load_dotenv
+import metrics
 
 # Load env
 load_dotenv()
 
-def send_email(to_email, subject, body, html_body=None):
+# ---------------------------------------------------
+# SHARED HTTP CLIENT + CIRCUIT BREAKERS
+# ---------------------------------------------------
+#one keep-alive client for every provider call instead of a new connection per email
+#(created on first use inside the running event loop, closed by the app lifespan)
+_client = None
+
+#after EMAIL_BREAKER_FAILURES failures in a row a provider is skipped for EMAIL_BREAKER_COOLDOWN_SECONDS,
+#then a single trial request decides whether it's back
+EMAIL_BREAKER_FAILURES = int(os.getenv("EMAIL_BREAKER_FAILURES", "3"))
+EMAIL_BREAKER_COOLDOWN_SECONDS = float(os.getenv("EMAIL_BREAKER_COOLDOWN_SECONDS", "60"))
+
+provider_requests_total = metrics.Counter("tendr_email_provider_requests_total", "Email provider calls by result (ok, error, skipped)")
+provider_seconds_total = metrics.Counter("tendr_email_provider_seconds_total", "Time spent waiting on each email provider")
+
+
+class CircuitBreaker:
+    """closed => calls go through; open => skipped until the cooldown ends; then half open => one trial call"""
+
+    def __init__(self, name: str):
+        self.name = name
+        self.failures = 0
+        self.opened_at = None
+        self.trial_running = False
+
+    def is_open(self) -> bool:
+        return self.opened_at is not None
+
+    def allow(self) -> bool:
+        if self.opened_at is None:
+            return True
+        if time.monotonic() - self.opened_at < EMAIL_BREAKER_COOLDOWN_SECONDS or self.trial_running:
+            return False
+        self.trial_running = True
+        return True
+
+    def record_success(self):
+        self.failures = 0
+        self.opened_at = None
+        self.trial_running = False
+
+    def record_failure(self):
+        self.failures += 1
+        self.trial_running = False
+        if self.opened_at is not None or self.failures >= EMAIL_BREAKER_FAILURES:
+            if self.opened_at is None:
+                print(f"⚠️ Email provider {self.name} is failing, skipping it for {EMAIL_BREAKER_COOLDOWN_SECONDS:g}s")
+            self.opened_at = time.monotonic()
+
+
+breakers = {"bridge": CircuitBreaker("bridge"), "resend": CircuitBreaker("resend")}
+metrics.Gauge(
+    "tendr_email_provider_circuit_open", "1 while a provider is being skipped",
+    fn=lambda: [({"provider": name}, int(b.is_open())) for name, b in breakers.items()],
+)
+
+
+def _get_client() -> httpx.AsyncClient:
+    global _client
+    if _client is None:
+        _client = httpx.AsyncClient(limits=httpx.Limits(max_connections=20, max_keepalive_connections=10))
+    return _client
+
+
+async def close_client():
+    global _client
+    if _client is not None:
+        await _client.aclose()
+        _client = None
+
+
+async def _send_bridge(bridge_url, to_email, subject, body, html_body):
+    response = await _get_client().post(bridge_url, json={
+        "to": to_email,
+        "subject": subject,
+        "body": body
+    }, timeout=15)
+    return response.status_code == 200, f"status {response.status_code}"
+
+
+async def _send_resend(resend_key, to_email, subject, body, html_body):
+    payload = {
+        "from": "Tendr <onboarding@resend.dev>",
+        "to": to_email,
+        "subject": subject,
+        "text": body,
+    }
+    if html_body:
+        payload["html"] = html_body
+    response = await _get_client().post(
+        os.getenv("RESEND_API_URL", "https://api.resend.com/emails"),
+        headers={"Authorization": f"Bearer {resend_key}", "Content-Type": "application/json"},
+        json=payload,
+        timeout=10
+    )
+    if response.status_code not in [200, 201]:
+        return False, f"status {response.status_code} (Resend requires a domain to email others)"
+    return True, None
+
+
+async def send_email(to_email, subject, body, html_body=None):
+    # Returns the provider that took the message ("bridge" / "resend"), None if none did.
+    # Called by the email outbox worker (email_outbox.py), not by request handlers.
     # Try the Google Bridge first (Best for sending to anyone without a domain)
     bridge_url = os.getenv("EMAIL_BRIDGE_URL")
     resend_key = os.getenv("RESEND_API_KEY")
-    
+
     # ALWAYS print the OTP to logs as a fail-safe first
     print("\n" + "!"*60)
     print(f"🔑 SECURITY OTP FOR: {to_email}")
@@ -17,46 +121,39 @@ def send_email(to_email, subject, body, html_body=None):
     print("!"*60 + "\n")
 
     # OPTION A: Google Apps Script Bridge (No Domain Needed)
-    if bridge_url:
-        try:
-            print(f"DEBUG: Using Google Bridge to send to {to_email}...")
-            response = requests.post(bridge_url, json={
-                "to": to_email,
-                "subject": subject,
-                "body": body
-            }, timeout=15)
-            if response.status_code == 200:
-                print(f"✅ SUCCESS: Email sent via Bridge to {to_email}")
-                return True
-        except Exception as e:
-            print(f"❌ BRIDGE ERROR: {str(e)}")
-
     # OPTION B: Resend API (Requires Domain for strangers)
+    providers = []
+    if bridge_url:
+        providers.append(("bridge", _send_bridge, bridge_url))
     if resend_key:
+        providers.append(("resend", _send_resend, resend_key))
+
+    for name, send, setting in providers:
+        breaker = breakers[name]
+        if not breaker.allow():
+            # known to be down: fail over straight away instead of paying its timeout again
+            provider_requests_total.inc(provider=name, result="skipped")
+            continue
+        start = time.perf_counter()
         try:
-            print(f"DEBUG: Using Resend to send to {to_email}...")
-            payload = {
-                "from": "Tendr <onboarding@resend.dev>",
-                "to": to_email,
-                "subject": subject,
-                "text": body,
-            }
-            if html_body:
-                payload["html"] = html_body
-            response = requests.post(
-                "https://api.resend.com/emails",
-                headers={"Authorization": f"Bearer {resend_key}", "Content-Type": "application/json"},
-                json=payload,
-                timeout=10
-            )
-            if response.status_code in [200, 201]:
-                print(f"✅ SUCCESS: Email sent via Resend to {to_email}")
-                return True
-            else:
-                print(f"⚠️ RESEND FAILED (Status {response.status_code}). Note: Resend requires a domain to email others.")
+            print(f"DEBUG: Using {name} to send to {to_email}...")
+            sent, error = await send(setting, to_email, subject, body, html_body)
         except Exception as e:
-            print(f"❌ RESEND ERROR: {str(e)}")
+            sent, error = False, str(e)
+        finally:
+            #a trial cancelled mid-call (CancelledError isn't an Exception) would otherwise
+            #leave the breaker waiting for a result forever; success/failure below set it again anyway
+            breaker.trial_running = False
+        provider_seconds_total.inc(time.perf_counter() - start, provider=name)
+        if sent:
+            breaker.record_success()
+            provider_requests_total.inc(provider=name, result="ok")
+            print(f"✅ SUCCESS: Email sent via {name} to {to_email}")
+            return name
+        breaker.record_failure()
+        provider_requests_total.inc(provider=name, result="error")
+        print(f"❌ {name.upper()} ERROR: {error}")
 
     # If both fail
     print("❌ CRITICAL: No working email path found. OTP only exists in these logs.")
-    return False
+    return None
@@ -1,22 +1,22 @@
-from email_verify import send_email
+import email_outbox
 import random
-from auth import pwd_context, truncate_password
+from auth import truncate_password, hash_password
 from models import User
-from sqlalchemy.orm import Session
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
 from fastapi import HTTPException
 from datetime import datetime, timedelta
 
 
 
-def to_confirm_email(db:Session, email:str):
-    user = db.query(User).filter(User.email == email).first()
+async def to_confirm_email(db:AsyncSession, email:str):
+    user = (await db.execute(select(User).where(User.email == email))).scalars().first()
     if user is None:
         raise HTTPException(status_code=404, detail="User not found")
     else:
         email_token = random.randint(100000, 999999)
         user.user_verification_token = str(email_token)
         user.user_verification_token_expires_at = datetime.utcnow() + timedelta(minutes=15)
-        db.commit()
         plain = (
             f"Hi {user.username},\n\n"
             f"Your Tendr password reset code is:\n\n"
@@ -68,31 +68,34 @@ def to_confirm_email(db:Session, email:str):
   </table>
 </body>
 </html>"""
-        success = send_email(user.email, "Your Tendr reset code", plain, html_body=html)
-        if success:
-            print(f"✅ Password reset OTP sent to {user.email}")
-        else:
-            print(f"❌ CRITICAL: Failed to send password reset OTP to {user.email}")
-        
+        # a resend supersedes the previous, still undelivered code for this address
+        await email_outbox.enqueue(db, user.email, "Your Tendr reset code", plain, html_body=html,
+                                   dedupe_key=f"reset:{user.email}")
+        await db.commit()
+        email_outbox.wake()
+        print(f"📨 Password reset OTP queued for {user.email}")
+
         return {"message": "OTP processed"}
 
 
 from sqlalchemy import or_
 
-def forget_password(db:Session, entered_verify_code:str, identity:str, new_password:str, new_password_confirm:str):
-    user = db.query(User).filter(or_(User.username == identity, User.email == identity)).first()
+async def forget_password(db:AsyncSession, entered_verify_code:str, identity:str, new_password:str, new_password_confirm:str):
+    user = (await db.execute(select(User).where(or_(User.username == identity, User.email == identity)))).scalars().first()
     if user:
         if entered_verify_code == user.user_verification_token :
             if user.user_verification_token_expires_at > datetime.utcnow():
                 if new_password == new_password_confirm:
                     # Truncate password to 72 bytes (bcrypt limit)
                     truncated_password = truncate_password(new_password)
-                    hashed_password = pwd_context.hash(truncated_password)
+                    hashed_password = await hash_password(truncated_password)
                     user.hashed_password = hashed_password
+                    # log out every token issued with the old password
+                    user.token_version = (user.token_version or 0) + 1
                     # If this was a Google user, allow them to log in with their new password now
                     user.provider = None 
-                    db.commit()
-                    db.refresh(user)
+                    await db.commit()
+                    await db.refresh(user)
                     return True
                 else:
                     print("new_password != new_password_confirm")
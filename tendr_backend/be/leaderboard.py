@@ -0,0 +1,221 @@
+"""
+Global XP leaderboard: the top N, the caller's rank and the users just above / below them.
+
+A rank needs every user's balance, and ordering all of them (user.xp plus their
+uncompacted ledger tail, xp_service) on each request doesn't scale. Each worker keeps
+the ranking in memory instead: a SortedList of (-xp, user_id), where moving a user and
+finding a position are O(log n), plus user_id -> xp.
+
+It is fed from the XP ledger (xp_events), not from the requests this worker serves, so
+a completion or a feed moves its user on every worker, whichever one served it:
+
+    load    every balance and the newest event id, from one REPEATABLE READ snapshot
+    poll    the events after that id, each moves one user (remove + add, O(log n));
+            every LEADERBOARD_POLL_SECONDS and before each GET /leaderboard, so the
+            caller sees their own XP change right away
+    reload  a fresh load every LEADERBOARD_RELOAD_SECONDS, for what the ledger doesn't
+            carry: new accounts with no event yet, deleted ones, XP set by hand
+
+Event ids are handed out at INSERT but become visible at COMMIT, so a later id can show
+up before an earlier one. An id skipped by a poll is a hole: the next polls ask for it
+again for LEADERBOARD_HOLE_SECONDS, after which it was rolled back (or deleted).
+
+A user the board doesn't know yet (signed up after the load) starts at the default 100.
+Ties share a rank and are listed by user id.
+"""
+import asyncio
+import os
+import time
+
+from fastapi import HTTPException
+from sortedcontainers import SortedList
+from sqlalchemy import select, func, or_, text, union_all
+from sqlalchemy.ext.asyncio import AsyncSession
+
+import metrics
+import xp_service
+from database import AsyncSessionLocal, async_engine
+from models import User, XpEvent
+
+LEADERBOARD_POLL_SECONDS = float(os.getenv("LEADERBOARD_POLL_SECONDS", "2"))
+LEADERBOARD_RELOAD_SECONDS = float(os.getenv("LEADERBOARD_RELOAD_SECONDS", "3600"))
+LEADERBOARD_HOLE_SECONDS = float(os.getenv("LEADERBOARD_HOLE_SECONDS", "60"))
+# ids below the load's newest one checked for in-flight events
+_LOAD_LOOKBACK = 1000
+# more holes than that and we load again instead of asking for each of them
+_MAX_HOLES = 1000
+_NEW_USER_XP = 100
+
+
+class Leaderboard:
+    """Users ordered by XP, most first. Moves and rank lookups are O(log n)."""
+
+    def __init__(self, balances=()):
+        self._xp = dict(balances)
+        self._order = SortedList((-xp, user_id) for user_id, xp in self._xp.items())
+
+    def __len__(self):
+        return len(self._xp)
+
+    def __contains__(self, user_id):
+        return user_id in self._xp
+
+    def xp(self, user_id):
+        return self._xp.get(user_id)
+
+    def set(self, user_id, xp: int):
+        old = self._xp.get(user_id)
+        if old is not None:
+            self._order.remove((-old, user_id))
+        self._xp[user_id] = xp
+        self._order.add((-xp, user_id))
+
+    def move(self, user_id, delta: int):
+        self.set(user_id, self._xp.get(user_id, _NEW_USER_XP) + delta)
+
+    def discard(self, user_id):
+        xp = self._xp.pop(user_id, None)
+        if xp is not None:
+            self._order.remove((-xp, user_id))
+
+    def rank(self, user_id):
+        """1 + the number of users with more XP (None if unknown)."""
+        xp = self._xp.get(user_id)
+        return None if xp is None else self._order.bisect_left((-xp,)) + 1
+
+    def _entries(self, keys):
+        return [(self._order.bisect_left((key[0],)) + 1, key[1], -key[0]) for key in keys]
+
+    def top(self, n: int):
+        """[(rank, user_id, xp)] of the first n users."""
+        return self._entries(self._order.islice(0, n))
+
+    def around(self, user_id, k: int):
+        """[(rank, user_id, xp)] of user_id and the k users on either side of it."""
+        xp = self._xp.get(user_id)
+        if xp is None:
+            return []
+        i = self._order.index((-xp, user_id))
+        return self._entries(self._order.islice(max(i - k, 0), i + k + 1))
+
+
+board = Leaderboard()
+_mark = None  # newest xp_events id applied, None until the first load
+_holes = {}  # skipped id -> when it was first missed
+_loaded_at = 0.0
+_sync_lock = asyncio.Lock()
+
+metrics.Gauge("tendr_leaderboard_users", "Users on this worker's leaderboard", fn=lambda: len(board))
+
+
+async def _load():
+    global board, _mark, _loaded_at
+    # user.xp and the uncompacted deltas summed per user in one pass, no join to misplan
+    parts = union_all(
+        select(User.id.label("user_id"), func.coalesce(User.xp, 100).label("xp")),
+        select(XpEvent.user_id, XpEvent.delta).where(XpEvent.compacted.is_(False)),
+    ).subquery()
+    async with async_engine.connect() as conn:
+        # one snapshot for the balances, the mark and the holes below it
+        conn = await conn.execution_options(isolation_level="REPEATABLE READ")
+        balances = (await conn.execute(
+            select(parts.c.user_id, func.sum(parts.c.xp)).group_by(parts.c.user_id)
+        )).all()
+        mark = (await conn.execute(select(func.coalesce(func.max(XpEvent.id), 0)))).scalar()
+        missing = (await conn.execute(
+            text("SELECT g FROM generate_series(CAST(:low AS bigint), CAST(:mark AS bigint)) g "
+                 "WHERE NOT EXISTS (SELECT 1 FROM xp_events WHERE id = g)"),
+            {"low": max(mark - _LOAD_LOOKBACK, 1), "mark": mark},
+        )).scalars().all()
+        await conn.rollback()
+    now = time.monotonic()
+    board = Leaderboard((user_id, int(xp)) for user_id, xp in balances)
+    _mark, _loaded_at = mark, now
+    _holes.clear()
+    _holes.update(dict.fromkeys(missing, now))
+    print(f"Leaderboard loaded: {len(board)} users, up to event {mark}")
+
+
+async def _poll(db: AsyncSession):
+    global _mark, _loaded_at
+    query = select(XpEvent.id, XpEvent.user_id, XpEvent.delta)
+    if _holes:
+        query = query.where(or_(XpEvent.id > _mark, XpEvent.id.in_(list(_holes))))
+    else:
+        query = query.where(XpEvent.id > _mark)
+    events = (await db.execute(query.order_by(XpEvent.id))).all()
+    now = time.monotonic()
+    for event_id, user_id, delta in events:
+        if event_id > _mark:
+            _holes.update(dict.fromkeys(range(_mark + 1, event_id), now))
+            _mark = event_id
+        elif _holes.pop(event_id, None) is None:
+            continue
+        board.move(user_id, delta)
+    for event_id in [e for e, missed in _holes.items() if now - missed > LEADERBOARD_HOLE_SECONDS]:
+        del _holes[event_id]
+    if len(_holes) > _MAX_HOLES:
+        _loaded_at = 0.0  # due for a reload
+
+
+async def sync(db: AsyncSession = None):
+    """
+    Bring this worker's board up to date: a (re)load when one is due, else a poll.
+    With a request's db it only loads if nothing is loaded yet, reloads are sync_loop's.
+    """
+    async with _sync_lock:
+        due = time.monotonic() - _loaded_at >= LEADERBOARD_RELOAD_SECONDS
+        if _mark is None or (due and db is None):
+            await _load()
+        elif db is not None:
+            await _poll(db)
+        else:
+            async with AsyncSessionLocal() as db:
+                await _poll(db)
+
+
+async def sync_loop():
+    """Background task (lifespan): load, then follow the ledger every LEADERBOARD_POLL_SECONDS."""
+    while True:
+        try:
+            await sync()
+        except Exception as e:
+            print(f"Leaderboard sync failed: {e}")
+        await asyncio.sleep(LEADERBOARD_POLL_SECONDS)
+
+
+async def standings(db: AsyncSession, user_id, limit: int, around: int):
+    """The GET /leaderboard payload: a poll, then one query for the usernames on it."""
+    await sync(db)
+    if user_id not in board:
+        # no XP change since the last load (a new account): place it at its balance
+        xp = await xp_service.current(db, user_id)
+        if xp is None:
+            raise HTTPException(status_code=404, detail="User not found")
+        board.set(user_id, int(xp))
+    top = board.top(limit)
+    near = board.around(user_id, around)
+    shown = {entry[1] for entry in top + near}
+    names = dict((await db.execute(select(User.id, User.username).where(User.id.in_(shown)))).all())
+    gone = shown - names.keys()
+    if gone:
+        # deleted since the last load: drop them and rank again without them
+        for user in gone:
+            board.discard(user)
+        top, near = board.top(limit), board.around(user_id, around)
+    if user_id not in names:
+        raise HTTPException(status_code=404, detail="User not found")
+
+    def rows(entries):
+        return [
+            {"rank": rank, "username": names[uid], "xp": xp, "me": uid == user_id}
+            for rank, uid, xp in entries if uid in names
+        ]
+
+    return {
+        "users": len(board),
+        "rank": board.rank(user_id),
+        "xp": board.xp(user_id),
+        "top": rows(top),
+        "around": rows(near),
+    }
@@ -1,29 +1,42 @@
 from dotenv import load_dotenv
 load_dotenv()
 
-from fastapi import FastAPI, Depends, HTTPException, status, Request, Body
+from fastapi import FastAPI, Depends, HTTPException, status, Request, Body, Query, Response
 from fastapi.security import OAuth2PasswordBearer, OAuth2PasswordRequestForm
-from sqlalchemy.orm import Session
+from sqlalchemy import select, text
+from sqlalchemy.ext.asyncio import AsyncSession
 from fastapi.middleware.cors import CORSMiddleware
-from datetime import datetime, timedelta
+from datetime import datetime, timedelta, date
+from typing import Optional
 from jose import jwt
 import models
 import os
 from models import User, Task, Base, FocusSession
-from database import SessionLocal, engine
+from database import engine, get_db
+import database
 import task_crud
 import pet_crud
 import auth_crud
+import refresh_tokens
+import activity
+import counters
+import leaderboard
+import data_version
+import xp_service
+import email_outbox
+import email_verify
 from forget_password import to_confirm_email
 import stats
 from auth import pwd_context
+import auth
 from auth_crud import SECRET_KEY, ALGORITHM
-from auth_dependencies import get_current_user
+from auth_dependencies import get_current_user, get_token_user, get_read_db
 from schemas import (
-    TaskCreate, TaskResponse, TaskCompletionUpdate,
+    TaskCreate, TaskResponse, TaskCompletionUpdate, TaskBatchCreate, TaskBatchCompletion, TaskBatchDelete,
     PetCreate, PetUpdate, PetResponse, PetFeed,
     RegistrationUser, TokenResponse, DeleteAccountRequest, EmailVerificationRequest, ForgotPasswordRequest,
-    FocusSessionCreate, FocusSessionResponse, GoogleCompleteRegistrationRequest, DeleteAccountOtpRequest
+    FocusSessionCreate, FocusSessionResponse, GoogleCompleteRegistrationRequest, DeleteAccountOtpRequest,
+    RefreshTokenRequest,
 )
 from starlette.responses import RedirectResponse, HTMLResponse
 from starlette.middleware.sessions import SessionMiddleware
@@ -36,119 +49,41 @@ import urllib.parse
 # DATABASE & APP SETUP
 # ---------------------------------------------------
 
-from sqlalchemy import text, func
-
-# Emergency schema update for Render (since we added 'theme' column)
-with engine.connect() as conn:
-    try:
-        conn.execute(text('ALTER TABLE "user" ADD COLUMN theme VARCHAR DEFAULT \'light\''))
-        conn.commit()
-    except Exception:
-        pass # Column already exists
-
-# Add category column to tasks table
-with engine.connect() as conn:
-    try:
-        conn.execute(text('ALTER TABLE tasks ADD COLUMN category VARCHAR(50)'))
-        conn.commit()
-    except Exception:
-        pass  # Column already exists
-
-# Fix focus_sessions table — the original raw SQL used SERIAL/INTEGER types which are
-# incompatible with the SQLAlchemy model (String UUID). Drop the table if it has wrong
-# column types so create_all can recreate it correctly.
-with engine.connect() as conn:
-    try:
-        result = conn.execute(text("""
-            SELECT data_type FROM information_schema.columns
-            WHERE table_name = 'focus_sessions' AND column_name = 'id'
-        """))
-        row = result.fetchone()
-        if row and row[0] not in ('character varying', 'text', 'uuid'):
-            conn.execute(text('DROP TABLE IF EXISTS focus_sessions'))
-            conn.commit()
-    except Exception:
-        pass
-
-# Add completed_at to tasks
-with engine.connect() as conn:
-    try:
-        conn.execute(text('ALTER TABLE tasks ADD COLUMN completed_at TIMESTAMP DEFAULT NULL'))
-        conn.commit()
-    except Exception:
-        pass
-
-# Add due_date to tasks
-with engine.connect() as conn:
-    try:
-        conn.execute(text('ALTER TABLE tasks ADD COLUMN due_date DATE DEFAULT NULL'))
-        conn.commit()
-    except Exception:
-        pass
-
-# Add points column to tasks and backfill from priority
-with engine.connect() as conn:
-    try:
-        conn.execute(text('ALTER TABLE tasks ADD COLUMN points INTEGER DEFAULT NULL'))
-        conn.commit()
-    except Exception:
-        pass
-with engine.connect() as conn:
-    try:
-        conn.execute(text("""
-            UPDATE tasks SET points = CASE
-                WHEN lower(priority) = 'high'   THEN 25
-                WHEN lower(priority) = 'medium' THEN 15
-                ELSE 10
-            END
-            WHERE points IS NULL
-        """))
-        conn.commit()
-    except Exception:
-        pass
-
-# Add gender to pets
-with engine.connect() as conn:
-    try:
-        conn.execute(text("ALTER TABLE pets ADD COLUMN gender VARCHAR(10) DEFAULT NULL"))
-        conn.commit()
-    except Exception:
-        pass
-
-# Add bond + last_focused_at to pets
-with engine.connect() as conn:
-    try:
-        conn.execute(text('ALTER TABLE pets ADD COLUMN bond FLOAT DEFAULT 0.0'))
-        conn.commit()
-    except Exception:
-        pass
-with engine.connect() as conn:
-    try:
-        conn.execute(text('ALTER TABLE pets ADD COLUMN last_focused_at TIMESTAMP DEFAULT NOW()'))
-        conn.commit()
-    except Exception:
-        pass
-
-# Create pet_qualifying_days table
-with engine.connect() as conn:
-    try:
-        conn.execute(text('''
-            CREATE TABLE IF NOT EXISTS pet_qualifying_days (
-                id VARCHAR PRIMARY KEY,
-                pet_id VARCHAR REFERENCES pets(id) ON DELETE CASCADE,
-                user_id VARCHAR REFERENCES "user"(id) ON DELETE CASCADE,
-                date DATE NOT NULL,
-                created_at TIMESTAMP DEFAULT NOW(),
-                UNIQUE(pet_id, date)
-            )
-        '''))
-        conn.commit()
-    except Exception:
-        pass
-
-models.Base.metadata.create_all(bind=engine)
-
-app = FastAPI()
+from sqlalchemy import func
+from contextlib import asynccontextmanager
+from starlette.concurrency import run_in_threadpool
+import migrations
+import metrics
+import asyncio
+from starlette.responses import PlainTextResponse, JSONResponse
+from row_json import RowsJSONResponse
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # One query when the schema is already current; otherwise one worker migrates
+    # under an advisory lock while the others wait (see migrations.py)
+    await run_in_threadpool(migrations.run_migrations, engine)
+    await run_in_threadpool(auth.configure_bcrypt)
+    lag_monitor = asyncio.create_task(database.monitor_replica_lag()) if database.replica_engines else None
+    token_purge = asyncio.create_task(refresh_tokens.purge_loop())
+    email_worker = asyncio.create_task(email_outbox.delivery_loop())
+    xp_compactor = asyncio.create_task(xp_service.compact_loop())
+    counter_reconciler = asyncio.create_task(counters.reconcile_loop(engine))
+    leaderboard_sync = asyncio.create_task(leaderboard.sync_loop())
+    yield
+    leaderboard_sync.cancel()
+    counter_reconciler.cancel()
+    xp_compactor.cancel()
+    email_worker.cancel()
+    await email_verify.close_client()
+    if lag_monitor:
+        lag_monitor.cancel()
+    token_purge.cancel()
+    auth.shutdown_hash_pool()
+
+
+app = FastAPI(lifespan=lifespan)
 
 app.add_middleware(ProxyHeadersMiddleware, trusted_hosts="*")
 
@@ -170,6 +105,7 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=["X-Next-Cursor", "ETag"],
 )
 
 
@@ -177,28 +113,36 @@ login_sessions = {}
 
 #if the fe is web application then there is no needd for this local_sessions dict and the start_google_login function and google_login_status function remove them both entirely..
 
-# ---------------------------------------------------
-# DEPENDENCY
-# ---------------------------------------------------
-
-def get_db():
-    db = SessionLocal()
-    try:
-        yield db
-    finally:
-        db.close()
-
-
 @app.get("/")
-def read_root():
+async def read_root():
     return {"message": "This is Task Manager side of our app Tendr!!"}
 
 @app.head("/health")
-def health():
+async def health():
     return {"status": "ok"}
 
+@app.get("/ready")
+async def ready():
+    """
+    Readiness probe: 200 once the primary answers, 503 otherwise.
+    Also reports each pool's usage so workers * (size + max_overflow) can be sized against max_connections.
+    """
+    body = {"pools": {name: database.pool_stats(e) for name, e in database.all_pools().items()}}
+    try:
+        async with database.async_engine.connect() as conn:
+            body["max_connections"] = int((await conn.execute(text("SHOW max_connections"))).scalar())
+    except Exception as e:
+        print(f"Readiness check failed: {e}")
+        return JSONResponse(status_code=503, content={"status": "unavailable", **body})
+    return {"status": "ready", **body}
+
+@app.get("/metrics", response_class=PlainTextResponse)
+async def get_metrics():
+    """Prometheus scrape endpoint (replica lag, read routing...), see metrics.py"""
+    return metrics.render()
+
 @app.get("/debug/session")
-def debug_session(request: Request):
+async def debug_session(request: Request):
     return {
         "session_keys": list(request.session.keys()),
         "cookies": request.cookies,
@@ -207,16 +151,37 @@ def debug_session(request: Request):
 
 
 @app.get("/user/xp")
-def get_user_xp(current_user = Depends(get_current_user), db: Session = Depends(get_db)):
+async def get_user_xp(current_user = Depends(get_token_user), db: AsyncSession = Depends(get_read_db)):
     """Get current user's XP"""
-    user = db.query(User).filter(User.id == current_user.id).first()
-    if not user:
+    # compacted balance + the ledger tail (xp_service); a NULL balance counts as 100
+    xp = await xp_service.current(db, current_user.id)
+    if xp is None:
         raise HTTPException(status_code=404, detail="User not found")
-    # Initialize XP to 100 if None
-    if user.xp is None:
-        user.xp = 100
-        db.commit()
-    return {"xp": user.xp}
+    return {"xp": xp}
+
+
+@app.get("/user/xp/history")
+async def get_user_xp_history(
+    days: int = Query(30, ge=1, le=366),
+    current_user = Depends(get_token_user),
+    db: AsyncSession = Depends(get_read_db),
+):
+    """XP gained / spent per day, from the xp_events ledger"""
+    end = datetime.utcnow().replace(hour=0, minute=0, second=0, microsecond=0) + timedelta(days=1)
+    totals = await xp_service.daily_totals(db, current_user.id, end - timedelta(days=days), end)
+    return [{"date": day, "gained": gained, "spent": spent} for day, gained, spent in totals]
+
+
+@app.get("/leaderboard")
+async def get_leaderboard(
+    limit: int = Query(10, ge=1, le=100),
+    around: int = Query(2, ge=0, le=25),
+    current_user = Depends(get_token_user),
+    db: AsyncSession = Depends(get_read_db),
+):
+    """Top `limit` users by XP, the caller's rank and the `around` users on either side of them"""
+    # served from this worker's in-memory ranking, caught up with the XP ledger first (leaderboard.py)
+    return await leaderboard.standings(db, current_user.id, limit, around)
 
 
 # ---------------------------------------------------
@@ -224,48 +189,93 @@ def get_user_xp(current_user = Depends(get_current_user), db: Session = Depends(
 # ---------------------------------------------------
 
 @app.post("/tasks", response_model=None)
-def create_task_endpoint(task: TaskCreate,current_user= Depends(get_current_user),db: Session = Depends(get_db)):
-    task = task_crud.create_task(db, task.title, task.priority, current_user, task.category, task.due_date)
+async def create_task_endpoint(task: TaskCreate,current_user= Depends(get_token_user),db: AsyncSession = Depends(get_db)):
+    task = await task_crud.create_task(db, task.title, task.priority, current_user, task.category, task.due_date)
     if not task:
         raise HTTPException(status_code=400, detail="Task creation failed")
     return TaskResponse.model_validate(task)
 
 
 @app.get("/tasks", response_model=list[TaskResponse])
-def get_all_tasks_endpoint(current_user= Depends(get_current_user),db: Session = Depends(get_db)):
-    tasks = db.query(Task).filter(Task.user_id == current_user.id).all()
-    if not tasks:
-        return []
-    return [TaskResponse.model_validate({
-        "id": t.id, "title": t.title, "priority": t.priority,
-        "category": t.category, "completed": t.completed,
-        "created_at": t.created_at, "completed_at": t.completed_at,
-        "due_date": t.due_date, "user_id": t.user_id,
-        "points": t.points,
-        "xpReward": task_crud.compute_effective_points(t),
-    }) for t in tasks]
+async def get_all_tasks_endpoint(
+    request: Request,
+    completed: Optional[bool] = None,
+    category: Optional[str] = None,
+    priority: Optional[str] = None,
+    due_from: Optional[date] = None,
+    due_to: Optional[date] = None,
+    sort: str = Query("created_at", enum=list(task_crud.TASK_SORTS)),
+    limit: Optional[int] = Query(None, ge=1, le=500),
+    cursor: Optional[str] = None,
+    current_user= Depends(get_token_user),
+    db: AsyncSession = Depends(get_read_db),
+):
+    # the body stays a plain list; when there is another page its cursor comes back in
+    # X-Next-Cursor (pass it as ?cursor= with the same filters/sort). No limit => everything.
+    # every page and filter is its own representation: a tag from one URL must not 304 another
+    tag = await data_version.etag(db, current_user.id, completed, category, priority, due_from, due_to, sort, limit, cursor)
+    unchanged = data_version.not_modified(request, tag)
+    if unchanged:
+        return unchanged
+    try:
+        tasks, next_cursor = await task_crud.list_tasks(
+            db, current_user, completed=completed, category=category, priority=priority,
+            due_from=due_from, due_to=due_to, sort=sort, limit=limit, cursor=cursor,
+        )
+    except task_crud.InvalidCursor as e:
+        raise HTTPException(status_code=400, detail=f"Invalid cursor: {e}")
+    body = [task_crud.task_row_dict(t, t.xp_reward) for t in tasks]
+    headers = data_version.headers(tag)
+    if next_cursor:
+        headers["X-Next-Cursor"] = next_cursor
+    return RowsJSONResponse(body, headers=headers)
+
+
+# declared before the /tasks/{...} routes so "batch" isn't taken for a task id
+
+def _check_batch_size(count: int):
+    if count > task_crud.TASK_BATCH_MAX:
+        raise HTTPException(status_code=413, detail=f"At most {task_crud.TASK_BATCH_MAX} operations per batch")
+
+
+@app.post("/tasks/batch")
+async def create_tasks_batch_endpoint(batch: TaskBatchCreate, current_user= Depends(get_token_user), db: AsyncSession = Depends(get_db)):
+    _check_batch_size(len(batch.tasks))
+    return {"results": await task_crud.create_tasks(db, batch.tasks, current_user)}
+
+
+@app.patch("/tasks/batch")
+async def update_tasks_batch_endpoint(batch: TaskBatchCompletion, current_user= Depends(get_token_user), db: AsyncSession = Depends(get_db)):
+    _check_batch_size(len(batch.items))
+    return await task_crud.update_tasks_completion(db, [(i.id, i.completed) for i in batch.items], current_user)
+
+
+@app.delete("/tasks/batch")
+async def delete_tasks_batch_endpoint(batch: TaskBatchDelete, current_user= Depends(get_token_user), db: AsyncSession = Depends(get_db)):
+    _check_batch_size(len(batch.ids))
+    return await task_crud.delete_tasks_by_id(db, batch.ids, current_user)
 
 
 @app.put("/tasks/{title}", response_model=TaskResponse)
-def update_task_endpoint(
+async def update_task_endpoint(
     title: str,
-    current_user= Depends(get_current_user),
-    db: Session = Depends(get_db)
+    current_user= Depends(get_token_user),
+    db: AsyncSession = Depends(get_db)
 ):
-    task = task_crud.update_task(db, title, current_user)
+    task = await task_crud.update_task(db, title, current_user)
     if not task:
         raise HTTPException(status_code=400, detail="Updating Task Failed")
     return TaskResponse.model_validate(task)
 
 
 @app.patch("/tasks/{task_id}", response_model=TaskResponse)
-def update_task_completion_endpoint(
+async def update_task_completion_endpoint(
     task_id: str,
     task_update: TaskCompletionUpdate,
-    current_user= Depends(get_current_user),
-    db: Session = Depends(get_db)
+    current_user= Depends(get_token_user),
+    db: AsyncSession = Depends(get_db)
 ):
-    task_data = task_crud.update_task_completion(db, task_id, task_update.completed, current_user)
+    task_data = await task_crud.update_task_completion(db, task_id, task_update.completed, current_user)
     if not task_data:
         raise HTTPException(status_code=404, detail="Task not found")
     
@@ -276,12 +286,12 @@ def update_task_completion_endpoint(
 
 
 @app.delete("/tasks/{task_id}")
-def delete_task_by_id_endpoint(
+async def delete_task_by_id_endpoint(
     task_id: str,
-    current_user= Depends(get_current_user),
-    db: Session = Depends(get_db)
+    current_user= Depends(get_token_user),
+    db: AsyncSession = Depends(get_db)
 ):
-    result = task_crud.delete_task_by_id(db, task_id, current_user)
+    result = await task_crud.delete_task_by_id(db, task_id, current_user)
     if result is None:
         raise HTTPException(status_code=404, detail="Task not found")
     return {"message": "Task deleted successfully"}
@@ -292,12 +302,12 @@ def delete_task_by_id_endpoint(
 # ---------------------------------------------------
 
 @app.post("/pets", response_model=PetResponse)
-def create_pet_endpoint(
+async def create_pet_endpoint(
     pet: PetCreate,
-    db: Session = Depends(get_db),
-    current_user=Depends(get_current_user)
+    db: AsyncSession = Depends(get_db),
+    current_user=Depends(get_token_user)
 ):
-    pet_data = pet_crud.create_pet(db, pet.name, pet.type, current_user, pet.gender)
+    pet_data = await pet_crud.create_pet(db, pet.name, pet.type, current_user, pet.gender)
     if not pet_data:
         raise HTTPException(status_code=400, detail="Pet creation failed")
     return pet_data
@@ -305,26 +315,31 @@ def create_pet_endpoint(
 
 
 @app.get("/pet", response_model=list[PetResponse])
-def get_all_pets_endpoint(
-    current_user= Depends(get_current_user),
-    db: Session = Depends(get_db)
+async def get_all_pets_endpoint(
+    request: Request,
+    current_user= Depends(get_token_user),
+    db: AsyncSession = Depends(get_read_db)
 ):
-    pets = pet_crud.get_all_pets(db, current_user)
-    return [PetResponse.model_validate(p) for p in pets]
+    tag = await data_version.etag(db, current_user.id)
+    unchanged = data_version.not_modified(request, tag)
+    if unchanged:
+        return unchanged
+    # if this starves a pet the version moves on and the next request simply gets a 200
+    pets = await pet_crud.get_all_pets(db, current_user)
+    return RowsJSONResponse([p._asdict() for p in pets], headers=data_version.headers(tag))
 
 
 
 
 @app.put("/pet/{id}", response_model=PetResponse)
-def update_pet_endpoint(
+async def update_pet_endpoint(
     pet_update: PetUpdate,
     id: str,
-    current_user= Depends(get_current_user),
-    db: Session = Depends(get_db)
+    current_user= Depends(get_token_user),
+    db: AsyncSession = Depends(get_db)
 ):
-    pet = pet_crud.update_pet(
-        db, id, pet_update.hunger, pet_update.age,
-        pet_update.last_fed, current_user
+    pet = await pet_crud.update_pet(
+        db, id, pet_update.hunger, pet_update.last_fed, current_user
     )
     if not pet:
         raise HTTPException(status_code=400, detail="Pet Updating Failed")
@@ -332,19 +347,19 @@ def update_pet_endpoint(
 
 
 @app.patch("/pet/feed/{id}", response_model=PetResponse)
-def feed_pet_endpoint(id: str, db: Session = Depends(get_db), current_user= Depends(get_current_user)):
-    pet_data = pet_crud.feed_pet(db, id, current_user)
+async def feed_pet_endpoint(id: str, db: AsyncSession = Depends(get_db), current_user= Depends(get_token_user)):
+    pet_data = await pet_crud.feed_pet(db, id, current_user)
     if not pet_data:
         raise HTTPException(status_code=400, detail="Feeding pet failed")
     return pet_data
 
 @app.delete("/pet/{id}")
-def delete_pet_endpoint(
+async def delete_pet_endpoint(
     id: str,
-    current_user= Depends(get_current_user),
-    db: Session = Depends(get_db)
+    current_user= Depends(get_token_user),
+    db: AsyncSession = Depends(get_db)
 ):
-    result = pet_crud.delete_pet(db, id, current_user)
+    result = await pet_crud.delete_pet(db, id, current_user)
     if result is None:
         raise HTTPException(status_code=404, detail="Pet not found")
     return {"message": "Pet deleted successfully"}
@@ -385,7 +400,7 @@ async def google_login(request: Request, desktop_port: int = None):
 
 
 @app.get("/auth/google/callback")
-async def google_callback(request: Request, db: Session = Depends(get_db)):
+async def google_callback(request: Request, db: AsyncSession = Depends(get_db)):
     print(f"DEBUG: Google Callback hit. URL: {request.url}")
     # Standardize callback URL to match login (must be identical)
     redirect_uri = request.url_for("google_callback")
@@ -428,7 +443,7 @@ async def google_callback(request: Request, db: Session = Depends(get_db)):
     else:
         frontend_url = "https://tendr-tick-treats.onrender.com"
 
-    user = db.query(User).filter(User.email == user_email).first()
+    user = (await db.execute(select(User).where(User.email == user_email))).scalars().first()
 
     if not user:
         # New user — issue a short-lived pending token and let them pick a username
@@ -447,7 +462,7 @@ async def google_callback(request: Request, db: Session = Depends(get_db)):
         return RedirectResponse(redirect_url)
 
     # Returning user — issue normal auth token
-    data = { "sub": user.username }
+    data = auth_crud.token_claims(user)
     jwt_token = auth_crud.create_access_token(data, expires_delta=timedelta(minutes=30))
 
     encoded_username = urllib.parse.quote(user.username)
@@ -462,7 +477,7 @@ async def google_callback(request: Request, db: Session = Depends(get_db)):
     return RedirectResponse(redirect_url)
 
 @app.post("/auth/google/complete-registration")
-def complete_google_registration(body: GoogleCompleteRegistrationRequest, db: Session = Depends(get_db)):
+async def complete_google_registration(body: GoogleCompleteRegistrationRequest, db: AsyncSession = Depends(get_db)):
     from jose import JWTError
 
     try:
@@ -488,15 +503,16 @@ def complete_google_registration(body: GoogleCompleteRegistrationRequest, db: Se
     if not all(c.isalnum() or c in "_-" for c in username):
         raise HTTPException(status_code=400, detail="Username may only contain letters, numbers, underscores, and hyphens.")
 
-    if db.query(User).filter(User.username == username).first():
+    if (await db.execute(select(User).where(User.username == username))).scalars().first():
         raise HTTPException(status_code=400, detail="Username already taken. Please choose another.")
 
     # Guard against double-submission — user may already exist if they hit this twice
-    existing = db.query(User).filter(User.email == user_email).first()
+    existing = (await db.execute(select(User).where(User.email == user_email))).scalars().first()
     if existing:
-        data = {"sub": existing.username}
+        data = auth_crud.token_claims(existing)
         jwt_token = auth_crud.create_access_token(data, expires_delta=timedelta(minutes=30))
-        return {"token": jwt_token, "username": existing.username, "email": existing.email}
+        refresh_token = await refresh_tokens.issue(db, existing)
+        return {"token": jwt_token, "refresh_token": refresh_token, "username": existing.username, "email": existing.email}
 
     new_user = User(
         username=username,
@@ -508,23 +524,24 @@ def complete_google_registration(body: GoogleCompleteRegistrationRequest, db: Se
         provider_id=user_sub,
     )
     db.add(new_user)
-    db.commit()
-    db.refresh(new_user)
+    await db.commit()
+    await db.refresh(new_user)
 
-    data = {"sub": new_user.username}
+    data = auth_crud.token_claims(new_user)
     jwt_token = auth_crud.create_access_token(data, expires_delta=timedelta(minutes=30))
-    return {"token": jwt_token, "username": new_user.username, "email": new_user.email}
+    refresh_token = await refresh_tokens.issue(db, new_user)
+    return {"token": jwt_token, "refresh_token": refresh_token, "username": new_user.username, "email": new_user.email}
 
 
-def _authenticate_form(form_data: OAuth2PasswordRequestForm, db: Session):
+async def _authenticate_form(form_data: OAuth2PasswordRequestForm, db: AsyncSession):
     """Shared logic for /login and /token — username field accepts email or username."""
     identifier = form_data.username
     password = form_data.password
 
     if '@' in identifier:
-        user = auth_crud.authenticate_user(db, '', identifier, password)
+        user = await auth_crud.authenticate_user(db, '', identifier, password)
     else:
-        user = auth_crud.authenticate_user(db, identifier, '', password)
+        user = await auth_crud.authenticate_user(db, identifier, '', password)
 
     if user == "unverified":
         raise HTTPException(status_code=403, detail="Please verify your email before logging in. Check your inbox for the verification code.")
@@ -533,72 +550,93 @@ def _authenticate_form(form_data: OAuth2PasswordRequestForm, db: Session):
     if user.provider == "google" and not user.hashed_password:
         raise HTTPException(status_code=400, detail="This account uses Google login. Use 'Forgot Password' to set a password.")
 
-    data = {"sub": user.username}
+    data = auth_crud.token_claims(user)
     token = auth_crud.create_access_token(data, expires_delta=timedelta(minutes=20))
-    return {"access_token": token, "token_type": "bearer", "username": user.username, "email": user.email}
+    refresh_token = await refresh_tokens.issue(db, user)
+    return {"access_token": token, "token_type": "bearer", "username": user.username, "email": user.email,
+            "refresh_token": refresh_token}
 
 
 @app.post("/login", response_model=TokenResponse)
-def login(form_data: OAuth2PasswordRequestForm = Depends(), db: Session = Depends(get_db)):
-    return _authenticate_form(form_data, db)
+async def login(form_data: OAuth2PasswordRequestForm = Depends(), db: AsyncSession = Depends(get_db)):
+    return await _authenticate_form(form_data, db)
 
 
 @app.post("/token", response_model=TokenResponse)
-def token(form_data: OAuth2PasswordRequestForm = Depends(), db: Session = Depends(get_db)):
+async def token(form_data: OAuth2PasswordRequestForm = Depends(), db: AsyncSession = Depends(get_db)):
     """Swagger Authorize endpoint — username field accepts email or username."""
-    return _authenticate_form(form_data, db)
+    return await _authenticate_form(form_data, db)
+
+
+@app.post("/token/refresh", response_model=TokenResponse)
+async def refresh_access_token(body: RefreshTokenRequest, db: AsyncSession = Depends(get_db)):
+    """New access token + rotated refresh token, no password needed (see refresh_tokens.py)."""
+    rotated = await refresh_tokens.rotate(db, body.refresh_token)
+    if not rotated:
+        raise HTTPException(status_code=401, detail="Invalid or expired refresh token. Please log in again.")
+    user, refresh_token = rotated
+    token = auth_crud.create_access_token(auth_crud.token_claims(user), expires_delta=timedelta(minutes=20))
+    return {"access_token": token, "token_type": "bearer", "username": user.username, "email": user.email,
+            "refresh_token": refresh_token}
+
+
+@app.post("/token/revoke")
+async def revoke_refresh_token(body: RefreshTokenRequest, db: AsyncSession = Depends(get_db)):
+    """Logout: the refresh token and every token rotated from it stop working."""
+    await refresh_tokens.revoke(db, body.refresh_token)
+    return {"message": "Logged out"}
 
 
 @app.patch("/reset_password")
-def password_reset_endpoint(
+async def password_reset_endpoint(
     new_password: str,
     new_password_confirm: str,
     old_password: str,
     username: str,
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_db)
 ):
-    reset = auth_crud.password_reset(db, new_password, new_password_confirm, old_password, username)
+    reset = await auth_crud.password_reset(db, new_password, new_password_confirm, old_password, username)
     if not reset:
         raise HTTPException(status_code=400, detail="Password reset failed")
     return {"message": "Password reset successful!"}
 
 
 @app.post("/send_forgot_password_otp")
-def send_forgot_password_otp(email: str, db: Session = Depends(get_db)):
-    result = to_confirm_email(db, email)
+async def send_forgot_password_otp(email: str, db: AsyncSession = Depends(get_db)):
+    result = await to_confirm_email(db, email)
     if not result:
         raise HTTPException(status_code=404, detail="Email not found")
     return {"message": "OTP sent to your email"}
 
 
 @app.patch("/forgot_password")
-def forgot_password_endpoint(
+async def forgot_password_endpoint(
     data: ForgotPasswordRequest,
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_db)
 ):
-    forget = auth_crud.forgot_password(db, data.entered_verify_code, data.new_password, data.new_password_confirm, data.username)
+    forget = await auth_crud.forgot_password(db, data.entered_verify_code, data.new_password, data.new_password_confirm, data.username)
     if not forget:
         raise HTTPException(status_code=400, detail="Forget password reset failed")
     return {"message": "Forget password reset done!"}
 
 
 @app.delete("/delete_account")
-def delete_account(data: DeleteAccountRequest,db: Session = Depends(get_db),current_user = Depends(get_current_user)):
-    result = auth_crud.del_user(db, current_user.id, data.password)
+async def delete_account(data: DeleteAccountRequest,db: AsyncSession = Depends(get_db),current_user = Depends(get_current_user)):
+    result = await auth_crud.del_user(db, current_user.id, data.password)
     if not result:
         raise HTTPException(status_code=404, detail="user not found")
     return {"message": "user account deleted successfully"}
 
 
 @app.get("/user/provider")
-def get_user_provider(current_user = Depends(get_current_user)):
+async def get_user_provider(current_user = Depends(get_current_user)):
     return {"provider": current_user.provider}
 
 
 @app.delete("/delete_account_otp")
-def delete_account_with_otp(
+async def delete_account_with_otp(
     data: DeleteAccountOtpRequest,
-    db: Session = Depends(get_db),
+    db: AsyncSession = Depends(get_db),
     current_user = Depends(get_current_user),
 ):
     if current_user.provider != "google":
@@ -607,17 +645,20 @@ def delete_account_with_otp(
     otp = data.otp.strip()
     if not otp:
         raise HTTPException(status_code=400, detail="OTP is required.")
-    if otp != current_user.user_verification_token:
+    # fresh row, not the cached current_user: the OTP was issued moments ago
+    user = (await db.execute(select(User).where(User.id == current_user.id))).scalars().first()
+    if not user:
+        raise HTTPException(status_code=404, detail="User not found")
+    if otp != user.user_verification_token:
         raise HTTPException(status_code=400, detail="Incorrect OTP.")
     if (
-        not current_user.user_verification_token_expires_at
-        or current_user.user_verification_token_expires_at < datetime.utcnow()
+        not user.user_verification_token_expires_at
+        or user.user_verification_token_expires_at < datetime.utcnow()
     ):
         raise HTTPException(status_code=400, detail="OTP has expired. Please request a new one.")
 
-    user = db.query(User).filter(User.id == current_user.id).first()
-    db.delete(user)
-    db.commit()
+    await db.delete(user)
+    await db.commit()
     return {"message": "Account deleted successfully."}
 
 
@@ -627,17 +668,17 @@ def delete_account_with_otp(
 # ---------------------------------------------------
 
 @app.post("/signup")
-def register_user(user: RegistrationUser, db: Session = Depends(get_db)):
+async def register_user(user: RegistrationUser, db: AsyncSession = Depends(get_db)):
     from sqlalchemy import or_
     # Check if username or email already exists
-    existing = db.query(User).filter(or_(User.username == user.username, User.email == user.email)).first()
+    existing = (await db.execute(select(User).where(or_(User.username == user.username, User.email == user.email)))).scalars().first()
     if existing:
         if existing.username == user.username:
             raise HTTPException(status_code=400, detail="Username already exists")
         if existing.email == user.email:
             raise HTTPException(status_code=400, detail="Email already exists")
 
-    auth_crud.create_user(db, user.username, user.password, user.email)
+    await auth_crud.create_user(db, user.username, user.password, user.email)
     return {"message": "User registered successfully!"}
 
 
@@ -645,7 +686,7 @@ def register_user(user: RegistrationUser, db: Session = Depends(get_db)):
 async def verify_email_endpoint(
     request: Request,
     body: EmailVerificationRequest = Body(None),
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_db)
 ):
     # Support both query parameters (for GUI) and JSON body (for web frontend)
     email = None
@@ -663,7 +704,7 @@ async def verify_email_endpoint(
     if not email or not verification_token:
         raise HTTPException(status_code=400, detail="Email and verification_token are required")
     
-    result = auth_crud.verify_email(db, email, verification_token)
+    result = await auth_crud.verify_email(db, email, verification_token)
     if not result:
         raise HTTPException(status_code=400, detail="Email verification failed")
     return {"message": "Email verified successfully"}
@@ -674,27 +715,24 @@ async def verify_email_endpoint(
 # ---------------------------------------------------
 
 @app.get("/user/theme")
-def get_user_theme(current_user = Depends(get_current_user), db: Session = Depends(get_db)):
+async def get_user_theme(current_user = Depends(get_current_user)):
     """Get current user's theme preference"""
-    user = db.query(User).filter(User.id == current_user.id).first()
-    if not user:
-        raise HTTPException(status_code=404, detail="User not found")
     # Default to 'light' if not set
-    theme = user.theme or 'light'
+    theme = current_user.theme or 'light'
     return {"theme": theme}
 
 @app.patch("/user/theme")
-def update_user_theme(theme: str = Body(..., embed=True), current_user = Depends(get_current_user), db: Session = Depends(get_db)):
+async def update_user_theme(theme: str = Body(..., embed=True), current_user = Depends(get_current_user), db: AsyncSession = Depends(get_db)):
     """Update current user's theme preference"""
     if theme not in ['light', 'dark']:
         raise HTTPException(status_code=400, detail="Theme must be 'light' or 'dark'")
     
-    user = db.query(User).filter(User.id == current_user.id).first()
+    user = (await db.execute(select(User).where(User.id == current_user.id))).scalars().first()
     if not user:
         raise HTTPException(status_code=404, detail="User not found")
     
     user.theme = theme
-    db.commit()
+    await db.commit()
     return {"message": "Theme updated successfully", "theme": theme}
 
 
@@ -702,9 +740,72 @@ def update_user_theme(theme: str = Body(..., embed=True), current_user = Depends
 # STATS ROUTES
 # ---------------------------------------------------
 
+@app.get("/activity")
+async def get_activity(
+    request: Request,
+    response: Response,
+    start: Optional[date] = Query(None, alias="from"),
+    end: Optional[date] = Query(None, alias="to"),
+    current_user = Depends(get_token_user),
+    db: AsyncSession = Depends(get_read_db),
+):
+    """Per-day totals (heatmaps), from the user_daily_activity rollup. Defaults to the last 30 days, at most 366."""
+    end = end or datetime.utcnow().date()
+    start = start or end - timedelta(days=29)
+    if start > end or (end - start).days >= 366:
+        raise HTTPException(status_code=400, detail="from must be on or before to, at most 366 days apart")
+    tag = await data_version.etag(db, current_user.id, start, end)
+    unchanged = data_version.not_modified(request, tag)
+    if unchanged:
+        return unchanged
+    response.headers.update(data_version.headers(tag))
+    # only days with any activity are listed
+    return [
+        {"date": row.day, **{c: getattr(row, c) for c in activity.COUNTERS}}
+        for row in await activity.days(db, current_user.id, start, end)
+    ]
+
+
+# declared before /analysis/{user_id}, which would otherwise take "series" for a user id
+@app.get("/analysis/series")
+async def get_analysis_series(
+    request: Request,
+    response: Response,
+    start: Optional[date] = Query(None, alias="from"),
+    end: Optional[date] = Query(None, alias="to"),
+    bucket: str = Query("day", enum=list(stats.SERIES_BUCKET_DAYS)),
+    current_user = Depends(get_token_user),
+    db: AsyncSession = Depends(get_read_db),
+):
+    """Completed tasks per day / week / month, by priority and category (heatmaps and breakdowns)."""
+    span = stats.SERIES_BUCKET_DAYS.get(bucket)
+    if span is None:
+        raise HTTPException(status_code=400, detail=f"bucket must be one of {', '.join(stats.SERIES_BUCKET_DAYS)}")
+    end = end or datetime.utcnow().date()
+    start = start or end - timedelta(days=span * (stats.SERIES_DEFAULT_BUCKETS - 1))
+    if start > end or (end - start).days >= span * stats.SERIES_MAX_BUCKETS:
+        raise HTTPException(status_code=400, detail=f"from must be on or before to, at most {stats.SERIES_MAX_BUCKETS} {bucket}s apart")
+    tag = await data_version.etag(db, current_user.id, "series", start, end, bucket)
+    unchanged = data_version.not_modified(request, tag)
+    if unchanged:
+        return unchanged
+    response.headers.update(data_version.headers(tag))
+    return {
+        "bucket": bucket,
+        "from": start,
+        "to": end,
+        "buckets": await stats.completed_series(db, current_user.id, start, end, bucket),
+    }
+
+
 @app.get("/analysis/{user_id}")
-def get_user_stats_all_time(user_id: str, current_user = Depends(get_current_user),db: Session = Depends(get_db)):
-    user_stats = stats.get_user_stats(db, user_id, stats.start_of_all_time, current_user)
+async def get_user_stats_all_time(user_id: str, request: Request, response: Response, current_user = Depends(get_current_user),db: AsyncSession = Depends(get_read_db)):
+    tag = await data_version.etag(db, current_user.id)
+    unchanged = data_version.not_modified(request, tag)
+    if unchanged:
+        return unchanged
+    response.headers.update(data_version.headers(tag))
+    user_stats = await stats.get_user_stats(db, user_id, stats.start_of_all_time, current_user)
     if not user_stats:
         raise HTTPException(status_code=404, detail="User stats not found")
     return user_stats
@@ -715,38 +816,49 @@ def get_user_stats_all_time(user_id: str, current_user = Depends(get_current_use
 # ---------------------------------------------------
 
 @app.post("/focus/session", response_model=FocusSessionResponse)
-def save_focus_session(
+async def save_focus_session(
     session: FocusSessionCreate,
-    current_user=Depends(get_current_user),
-    db: Session = Depends(get_db)
+    current_user=Depends(get_token_user),
+    db: AsyncSession = Depends(get_db)
 ):
     if session.duration_seconds < 5:
         raise HTTPException(status_code=400, detail="Session too short (minimum 5 seconds)")
-    new_session = FocusSession(user_id=current_user.id, duration_seconds=session.duration_seconds)
+    new_session = FocusSession(user_id=current_user.id, duration_seconds=session.duration_seconds,
+                               created_at=datetime.utcnow())
     db.add(new_session)
-    db.commit()
-    db.refresh(new_session)
+    # the insert first: its counter trigger locks the user row, which comes before the activity row
+    await db.flush()
+    day_changes = activity.changes()
+    day_changes[new_session.created_at.date()]["focus_seconds"] += session.duration_seconds
+    await activity.add(db, current_user.id, day_changes)
+    await db.commit()  # id / created_at are set client side, no refresh needed
     try:
-        pet_crud.add_bond_from_focus(db, current_user.id, session.duration_seconds)
+        await pet_crud.add_bond_from_focus(db, current_user.id, session.duration_seconds)
     except Exception:
         pass
     return new_session
 
 
 @app.get("/focus/total")
-def get_focus_total(current_user=Depends(get_current_user), db: Session = Depends(get_db)):
-    total = db.query(func.sum(FocusSession.duration_seconds)).filter(
-        FocusSession.user_id == current_user.id
-    ).scalar() or 0
-    return {"total_seconds": int(total)}
+async def get_focus_total(request: Request, response: Response, current_user=Depends(get_token_user), db: AsyncSession = Depends(get_read_db)):
+    tag = await data_version.etag(db, current_user.id)
+    unchanged = data_version.not_modified(request, tag)
+    if unchanged:
+        return unchanged
+    response.headers.update(data_version.headers(tag))
+    # kept on the user row by the focus_sessions trigger (counters.py): a primary key lookup
+    total = (await db.execute(select(User.focus_seconds_total).where(User.id == current_user.id))).scalar()
+    return {"total_seconds": total or 0}
 
 
 @app.get("/focus/today")
-def get_focus_today(current_user=Depends(get_current_user), db: Session = Depends(get_db)):
-    today_start = datetime.utcnow().replace(hour=0, minute=0, second=0, microsecond=0)
-    total = db.query(func.sum(FocusSession.duration_seconds)).filter(
-        FocusSession.user_id == current_user.id,
-        FocusSession.created_at >= today_start,
-    ).scalar() or 0
-    return {"total_seconds": int(total)}
+async def get_focus_today(request: Request, response: Response, current_user=Depends(get_token_user), db: AsyncSession = Depends(get_read_db)):
+    tag = await data_version.etag(db, current_user.id)
+    unchanged = data_version.not_modified(request, tag)
+    if unchanged:
+        return unchanged
+    response.headers.update(data_version.headers(tag))
+    # today's rollup row: a primary key lookup
+    total = await activity.on_day(db, current_user.id, "focus_seconds", datetime.utcnow().date())
+    return {"total_seconds": total}
 
@@ -0,0 +1,77 @@
+"""
+Tiny in-process metrics registry, served in Prometheus text format at /metrics.
+
+Counter => only goes up (requests routed, errors...)
+Gauge   => current value (replica lag, pool size...). Pass fn= to compute it on scrape.
+
+Each worker process has its own registry; Prometheus scrapes and sums them.
+"""
+import threading
+
+_registry = []
+_lock = threading.Lock()
+
+
+def _label_str(labels: dict) -> str:
+    if not labels:
+        return ""
+    inner = ",".join(f'{k}="{v}"' for k, v in sorted(labels.items()))
+    return "{" + inner + "}"
+
+
+class _Metric:
+    kind = ""
+
+    def __init__(self, name: str, help: str):
+        self.name = name
+        self.help = help
+        self._values = {}
+        _registry.append(self)
+
+    def samples(self):
+        with _lock:
+            return list(self._values.items())
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} {self.kind}"]
+        for labels, value in self.samples():
+            lines.append(f"{self.name}{_label_str(dict(labels))} {value}")
+        return lines
+
+
+class Counter(_Metric):
+    kind = "counter"
+
+    def inc(self, amount: float = 1, **labels):
+        key = tuple(sorted(labels.items()))
+        with _lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+
+class Gauge(_Metric):
+    kind = "gauge"
+
+    def __init__(self, name: str, help: str, fn=None):
+        """fn() -> number, or a list of (labels dict, number), evaluated at scrape time"""
+        super().__init__(name, help)
+        self._fn = fn
+
+    def set(self, value: float, **labels):
+        key = tuple(sorted(labels.items()))
+        with _lock:
+            self._values[key] = value
+
+    def samples(self):
+        if self._fn is None:
+            return super().samples()
+        result = self._fn()
+        if isinstance(result, (int, float)):
+            return [((), result)]
+        return [(tuple(sorted(labels.items())), value) for labels, value in result]
+
+
+def render() -> str:
+    lines = []
+    for metric in list(_registry):
+        lines.extend(metric.render())
+    return "\n".join(lines) + "\n"
@@ -0,0 +1,498 @@
+"""
+Versioned schema migrations.
+
+Every step in MIGRATIONS runs exactly once, in order, and records its version in
+the schema_version table. Only one process migrates at a time (Postgres advisory
+lock), the others wait for it and then see there is nothing left to do.
+
+When the database is already up to date this costs a single query, so it's cheap
+to run on every worker start.
+
+Adding a migration => append a new (version, name, function) to MIGRATIONS.
+Never edit or reorder one that has shipped. Write steps so they are safe to run
+on a database that create_all already built from the current models
+(IF NOT EXISTS / IF EXISTS everywhere), because a fresh database runs them all.
+
+Steps that build indexes on live tables are marked @non_transactional and use
+CREATE/DROP INDEX CONCURRENTLY, so they don't block writes while they run.
+
+Run by hand with:  python migrations.py
+"""
+from sqlalchemy import text
+from sqlalchemy.exc import ProgrammingError
+import activity
+import counters
+import models
+
+# any constant works, it just has to be the same for every process
+MIGRATION_LOCK_ID = 7263001
+
+
+def non_transactional(step):
+    """Run this step in autocommit mode (needed for CREATE INDEX CONCURRENTLY)."""
+    step.transactional = False
+    return step
+
+
+def _table_exists(conn, table: str) -> bool:
+    return conn.execute(text("SELECT to_regclass(:t) IS NOT NULL"), {"t": f'"{table}"'}).scalar()
+
+
+def _legacy_columns(conn):
+    """Everything main.py used to try (and swallow) on import, now run once."""
+    # The original raw SQL created focus_sessions with SERIAL/INTEGER ids, which don't
+    # match the model (String UUID). Drop it so create_all can recreate it correctly.
+    id_type = conn.execute(text("""
+        SELECT data_type FROM information_schema.columns
+        WHERE table_name = 'focus_sessions' AND column_name = 'id'
+    """)).scalar()
+    if id_type and id_type not in ('character varying', 'text', 'uuid'):
+        conn.execute(text('DROP TABLE IF EXISTS focus_sessions'))
+
+    conn.execute(text('ALTER TABLE IF EXISTS "user" ADD COLUMN IF NOT EXISTS theme VARCHAR DEFAULT \'light\''))
+    conn.execute(text('ALTER TABLE IF EXISTS tasks ADD COLUMN IF NOT EXISTS category VARCHAR(50)'))
+    conn.execute(text('ALTER TABLE IF EXISTS tasks ADD COLUMN IF NOT EXISTS completed_at TIMESTAMP DEFAULT NULL'))
+    conn.execute(text('ALTER TABLE IF EXISTS tasks ADD COLUMN IF NOT EXISTS due_date DATE DEFAULT NULL'))
+    conn.execute(text('ALTER TABLE IF EXISTS tasks ADD COLUMN IF NOT EXISTS points INTEGER DEFAULT NULL'))
+    if _table_exists(conn, "tasks"):
+        conn.execute(text("""
+            UPDATE tasks SET points = CASE
+                WHEN lower(priority) = 'high'   THEN 25
+                WHEN lower(priority) = 'medium' THEN 15
+                ELSE 10
+            END
+            WHERE points IS NULL
+        """))
+    conn.execute(text('ALTER TABLE IF EXISTS pets ADD COLUMN IF NOT EXISTS gender VARCHAR(10) DEFAULT NULL'))
+    conn.execute(text('ALTER TABLE IF EXISTS pets ADD COLUMN IF NOT EXISTS bond FLOAT DEFAULT 0.0'))
+    conn.execute(text('ALTER TABLE IF EXISTS pets ADD COLUMN IF NOT EXISTS last_focused_at TIMESTAMP DEFAULT NOW()'))
+
+    # pet_qualifying_days got a UNIQUE(pet_id, date) when it was created by hand,
+    # keep creating it that way on databases that already have pets
+    if _table_exists(conn, "pets") and _table_exists(conn, "user"):
+        conn.execute(text('''
+            CREATE TABLE IF NOT EXISTS pet_qualifying_days (
+                id VARCHAR PRIMARY KEY,
+                pet_id VARCHAR REFERENCES pets(id) ON DELETE CASCADE,
+                user_id VARCHAR REFERENCES "user"(id) ON DELETE CASCADE,
+                date DATE NOT NULL,
+                created_at TIMESTAMP DEFAULT NOW(),
+                UNIQUE(pet_id, date)
+            )
+        '''))
+
+
+# the tables that existed when this step shipped. Later tables get their own step with
+# explicit DDL: on a not-yet-migrated database create_all would try to point their uuid
+# foreign keys at the old varchar ids and fail before the uuid steps ever run
+_ORIGINAL_TABLES = ("user", "tasks", "pets", "pet_qualifying_days", "focus_sessions")
+
+
+def _create_missing_tables(conn):
+    tables = [models.Base.metadata.tables[name] for name in _ORIGINAL_TABLES]
+    models.Base.metadata.create_all(bind=conn, tables=tables)
+
+
+def _create_index_concurrently(conn, name: str, ddl: str):
+    # a CONCURRENTLY build that failed halfway leaves an INVALID index behind,
+    # and IF NOT EXISTS would happily skip it, so clear it out first
+    invalid = conn.execute(text("""
+        SELECT 1 FROM pg_index i JOIN pg_class c ON c.oid = i.indexrelid
+        WHERE c.relname = :name AND NOT i.indisvalid
+    """), {"name": name}).scalar()
+    if invalid:
+        conn.execute(text(f'DROP INDEX CONCURRENTLY IF EXISTS "{name}"'))
+    conn.execute(text(ddl))
+
+
+@non_transactional
+def _query_shaped_indexes(conn):
+    """Composite/partial indexes from models.py, built without locking out writes."""
+    _create_index_concurrently(conn, "ix_tasks_user_id_completed_created_at",
+        'CREATE INDEX CONCURRENTLY IF NOT EXISTS ix_tasks_user_id_completed_created_at '
+        'ON tasks (user_id, completed, created_at)')
+    _create_index_concurrently(conn, "ix_focus_sessions_user_id_created_at",
+        'CREATE INDEX CONCURRENTLY IF NOT EXISTS ix_focus_sessions_user_id_created_at '
+        'ON focus_sessions (user_id, created_at) INCLUDE (duration_seconds)')
+    _create_index_concurrently(conn, "ix_pets_user_id",
+        'CREATE INDEX CONCURRENTLY IF NOT EXISTS ix_pets_user_id ON pets (user_id)')
+    _create_index_concurrently(conn, "ix_pets_user_id_alive",
+        'CREATE INDEX CONCURRENTLY IF NOT EXISTS ix_pets_user_id_alive ON pets (user_id) WHERE is_alive')
+
+    # Databases built by create_all never got UNIQUE(pet_id, date). Drop duplicate days
+    # (keep the first) and attach a concurrently built index as the constraint.
+    has_constraint = conn.execute(text(
+        "SELECT 1 FROM pg_constraint WHERE conname = 'pet_qualifying_days_pet_id_date_key'"
+    )).scalar()
+    if not has_constraint:
+        conn.execute(text("""
+            DELETE FROM pet_qualifying_days d USING pet_qualifying_days keep
+            WHERE d.pet_id = keep.pet_id AND d.date = keep.date AND d.ctid > keep.ctid
+        """))
+        _create_index_concurrently(conn, "pet_qualifying_days_pet_id_date_key",
+            'CREATE UNIQUE INDEX CONCURRENTLY IF NOT EXISTS pet_qualifying_days_pet_id_date_key '
+            'ON pet_qualifying_days (pet_id, date)')
+        conn.execute(text(
+            'ALTER TABLE pet_qualifying_days ADD CONSTRAINT pet_qualifying_days_pet_id_date_key '
+            'UNIQUE USING INDEX pet_qualifying_days_pet_id_date_key'
+        ))
+
+    # ix_tasks_title was a btree over a 1000-char column nothing filters on; the ix_*_id
+    # ones duplicated the primary key indexes
+    for name in ("ix_tasks_title", "ix_tasks_id", "ix_pets_id", "ix_focus_sessions_id", "ix_user_id"):
+        conn.execute(text(f'DROP INDEX CONCURRENTLY IF EXISTS "{name}"'))
+
+
+# ---------------------------------------------------
+# String ids -> native uuid (expand / backfill / swap / validate)
+# ---------------------------------------------------
+# Old workers keep writing string ids the whole time: a trigger mirrors every write into
+# a uuid shadow column, the backfill catches up existing rows in small batches, indexes
+# are built CONCURRENTLY on the shadows, and only the final swap takes a (short) lock.
+
+_UUID_COLUMNS = {
+    "user": ["id"],
+    "tasks": ["id", "user_id"],
+    "pets": ["id", "user_id"],
+    "focus_sessions": ["id", "user_id"],
+    "pet_qualifying_days": ["id", "pet_id", "user_id"],
+}
+
+# (table, column, referenced table, on delete)
+_UUID_FOREIGN_KEYS = [
+    ("tasks", "user_id", "user", None),
+    ("pets", "user_id", "user", None),
+    ("focus_sessions", "user_id", "user", None),
+    ("pet_qualifying_days", "pet_id", "pets", "CASCADE"),
+    ("pet_qualifying_days", "user_id", "user", "CASCADE"),
+]
+
+# every index that covers an id column: (final name, table, definition on the new columns)
+_UUID_INDEXES = [
+    ("ix_tasks_user_id_completed_created_at", "tasks", "(user_id_uuid, completed, created_at)"),
+    ("ix_focus_sessions_user_id_created_at", "focus_sessions", "(user_id_uuid, created_at) INCLUDE (duration_seconds)"),
+    ("ix_pets_user_id", "pets", "(user_id_uuid)"),
+    ("ix_pets_user_id_alive", "pets", "(user_id_uuid) WHERE is_alive"),
+]
+
+UUID_BACKFILL_BATCH = 5000
+
+
+def _still_string_ids(conn, table: str) -> bool:
+    # fresh databases got uuid columns straight from create_all
+    data_type = conn.execute(text("""
+        SELECT data_type FROM information_schema.columns
+        WHERE table_name = :t AND column_name = 'id'
+    """), {"t": table}).scalar()
+    return data_type is not None and data_type != "uuid"
+
+
+def _uuid_shadow_columns(conn):
+    """Add nullable uuid shadows plus a trigger keeping them in sync. Metadata-only, no rewrite."""
+    for table, columns in _UUID_COLUMNS.items():
+        if not _still_string_ids(conn, table):
+            continue
+        for col in columns:
+            conn.execute(text(f'ALTER TABLE "{table}" ADD COLUMN IF NOT EXISTS {col}_uuid uuid'))
+        assigns = " ".join(f"NEW.{col}_uuid := NEW.{col}::uuid;" for col in columns)
+        conn.execute(text(f"""
+            CREATE OR REPLACE FUNCTION {table}_uuid_shadow() RETURNS trigger AS $$
+            BEGIN {assigns} RETURN NEW; END
+            $$ LANGUAGE plpgsql
+        """))
+        conn.execute(text(f'DROP TRIGGER IF EXISTS {table}_uuid_shadow ON "{table}"'))
+        conn.execute(text(f"""
+            CREATE TRIGGER {table}_uuid_shadow BEFORE INSERT OR UPDATE ON "{table}"
+            FOR EACH ROW EXECUTE FUNCTION {table}_uuid_shadow()
+        """))
+        # lets the swap SET NOT NULL without scanning the table under lock
+        conn.execute(text(f'ALTER TABLE "{table}" DROP CONSTRAINT IF EXISTS {table}_id_uuid_not_null'))
+        conn.execute(text(
+            f'ALTER TABLE "{table}" ADD CONSTRAINT {table}_id_uuid_not_null CHECK (id_uuid IS NOT NULL) NOT VALID'
+        ))
+
+
+@non_transactional
+def _uuid_backfill(conn):
+    """Copy existing ids into the shadows in small committed batches, then index them."""
+    for table, columns in _UUID_COLUMNS.items():
+        if not _still_string_ids(conn, table):
+            continue
+        sets = ", ".join(f"{col}_uuid = t.{col}::uuid" for col in columns)
+        last = ""
+        while True:
+            # walks the existing primary key, so each batch is an index range, not a rescan
+            last_in_batch = conn.execute(text(f"""
+                WITH batch AS (
+                    SELECT id FROM "{table}" WHERE id > :last ORDER BY id LIMIT :n
+                ), done AS (
+                    UPDATE "{table}" t SET {sets} FROM batch WHERE t.id = batch.id AND t.id_uuid IS NULL
+                )
+                SELECT max(id) FROM batch
+            """), {"last": last, "n": UUID_BACKFILL_BATCH}).scalar()
+            if last_in_batch is None:
+                break
+            last = last_in_batch
+        conn.execute(text(f'ALTER TABLE "{table}" VALIDATE CONSTRAINT {table}_id_uuid_not_null'))
+        _create_index_concurrently(conn, f"{table}_pkey_uuid",
+            f'CREATE UNIQUE INDEX CONCURRENTLY IF NOT EXISTS {table}_pkey_uuid ON "{table}" (id_uuid)')
+
+    for name, table, definition in _UUID_INDEXES:
+        if _still_string_ids(conn, table):
+            _create_index_concurrently(conn, f"{name}_uuid",
+                f'CREATE INDEX CONCURRENTLY IF NOT EXISTS {name}_uuid ON "{table}" {definition}')
+    if _still_string_ids(conn, "pet_qualifying_days"):
+        _create_index_concurrently(conn, "pet_qualifying_days_pet_id_date_key_uuid",
+            'CREATE UNIQUE INDEX CONCURRENTLY IF NOT EXISTS pet_qualifying_days_pet_id_date_key_uuid '
+            'ON pet_qualifying_days (pet_id_uuid, date)')
+
+
+def _uuid_swap(conn):
+    """Swap the shadows in. Only catalog changes here, all in one short transaction."""
+    if not _still_string_ids(conn, "user"):
+        return
+    # don't queue behind a long transaction while holding everyone else up; the runner
+    # fails, rolls back, and the next start retries
+    conn.execute(text("SET LOCAL lock_timeout = '5s'"))
+    # whatever they ended up being called, nothing may still point at the old id columns
+    foreign_keys = conn.execute(text("""
+        SELECT conrelid::regclass::text, conname FROM pg_constraint
+        WHERE contype = 'f' AND confrelid IN ('"user"'::regclass, 'pets'::regclass)
+    """)).all()
+    for table, name in foreign_keys:
+        conn.execute(text(f'ALTER TABLE {table} DROP CONSTRAINT "{name}"'))
+
+    for table, columns in _UUID_COLUMNS.items():
+        conn.execute(text(f'DROP TRIGGER IF EXISTS {table}_uuid_shadow ON "{table}"'))
+        conn.execute(text(f"DROP FUNCTION IF EXISTS {table}_uuid_shadow()"))
+        # dropping the old columns also drops the old primary key and every index on them
+        for col in columns:
+            conn.execute(text(f'ALTER TABLE "{table}" DROP COLUMN {col}'))
+            conn.execute(text(f'ALTER TABLE "{table}" RENAME COLUMN {col}_uuid TO {col}'))
+        conn.execute(text(f'ALTER TABLE "{table}" ALTER COLUMN id SET NOT NULL'))
+        conn.execute(text(f'ALTER TABLE "{table}" DROP CONSTRAINT {table}_id_uuid_not_null'))
+        conn.execute(text(f'ALTER INDEX {table}_pkey_uuid RENAME TO {table}_pkey'))
+        conn.execute(text(f'ALTER TABLE "{table}" ADD CONSTRAINT {table}_pkey PRIMARY KEY USING INDEX {table}_pkey'))
+
+    for name, _, _ in _UUID_INDEXES:
+        conn.execute(text(f"ALTER INDEX {name}_uuid RENAME TO {name}"))
+    conn.execute(text("ALTER INDEX pet_qualifying_days_pet_id_date_key_uuid RENAME TO pet_qualifying_days_pet_id_date_key"))
+    conn.execute(text(
+        "ALTER TABLE pet_qualifying_days ADD CONSTRAINT pet_qualifying_days_pet_id_date_key "
+        "UNIQUE USING INDEX pet_qualifying_days_pet_id_date_key"
+    ))
+
+    # NOT VALID => no scan under lock, the next step validates without blocking writes
+    for table, col, ref, on_delete in _UUID_FOREIGN_KEYS:
+        conn.execute(text(
+            f'ALTER TABLE "{table}" ADD CONSTRAINT {table}_{col}_fkey FOREIGN KEY ({col}) '
+            f'REFERENCES "{ref}" (id){" ON DELETE " + on_delete if on_delete else ""} NOT VALID'
+        ))
+
+
+@non_transactional
+def _uuid_validate_foreign_keys(conn):
+    for table, col, _, _ in _UUID_FOREIGN_KEYS:
+        not_valid = conn.execute(text(
+            "SELECT 1 FROM pg_constraint WHERE conname = :c AND NOT convalidated"
+        ), {"c": f"{table}_{col}_fkey"}).scalar()
+        if not_valid:
+            conn.execute(text(f'ALTER TABLE "{table}" VALIDATE CONSTRAINT {table}_{col}_fkey'))
+
+
+def _token_version(conn):
+    # constant default => no table rewrite on PG 11+
+    conn.execute(text('ALTER TABLE "user" ADD COLUMN IF NOT EXISTS token_version INTEGER NOT NULL DEFAULT 0'))
+
+
+def _refresh_tokens(conn):
+    conn.execute(text("""
+        CREATE TABLE IF NOT EXISTS refresh_tokens (
+            id UUID PRIMARY KEY,
+            token_hash VARCHAR(64) NOT NULL UNIQUE,
+            family_id UUID NOT NULL,
+            user_id UUID NOT NULL REFERENCES "user" (id) ON DELETE CASCADE,
+            token_version INTEGER NOT NULL,
+            created_at TIMESTAMP,
+            expires_at TIMESTAMP NOT NULL,
+            used_at TIMESTAMP,
+            revoked BOOLEAN NOT NULL
+        )
+    """))
+    conn.execute(text("CREATE INDEX IF NOT EXISTS ix_refresh_tokens_family_id ON refresh_tokens (family_id)"))
+    conn.execute(text("CREATE INDEX IF NOT EXISTS ix_refresh_tokens_user_id ON refresh_tokens (user_id)"))
+
+
+def _email_outbox(conn):
+    conn.execute(text("""
+        CREATE TABLE IF NOT EXISTS email_outbox (
+            id UUID PRIMARY KEY,
+            to_email VARCHAR NOT NULL,
+            subject VARCHAR NOT NULL,
+            body VARCHAR NOT NULL,
+            html_body VARCHAR,
+            dedupe_key VARCHAR,
+            status VARCHAR(20) NOT NULL,
+            attempts INTEGER NOT NULL,
+            next_attempt_at TIMESTAMP NOT NULL,
+            last_error VARCHAR,
+            provider VARCHAR(20),
+            created_at TIMESTAMP,
+            sent_at TIMESTAMP
+        )
+    """))
+    conn.execute(text(
+        "CREATE INDEX IF NOT EXISTS ix_email_outbox_due ON email_outbox (next_attempt_at) WHERE status = 'pending'"
+    ))
+    conn.execute(text(
+        "CREATE INDEX IF NOT EXISTS ix_email_outbox_dedupe_key ON email_outbox (dedupe_key) WHERE status = 'pending'"
+    ))
+
+
+@non_transactional
+def _task_keyset_indexes(conn):
+    _create_index_concurrently(conn, "ix_tasks_user_id_created_at_id",
+        'CREATE INDEX CONCURRENTLY IF NOT EXISTS ix_tasks_user_id_created_at_id '
+        'ON tasks (user_id, created_at, id)')
+    _create_index_concurrently(conn, "ix_tasks_user_id_due_date_id",
+        'CREATE INDEX CONCURRENTLY IF NOT EXISTS ix_tasks_user_id_due_date_id '
+        'ON tasks (user_id, due_date, id)')
+
+
+def _data_version(conn):
+    conn.execute(text('ALTER TABLE "user" ADD COLUMN IF NOT EXISTS data_version BIGINT NOT NULL DEFAULT 0'))
+
+
+def _xp_events(conn):
+    conn.execute(text("""
+        CREATE TABLE IF NOT EXISTS xp_events (
+            id BIGSERIAL PRIMARY KEY,
+            user_id UUID NOT NULL REFERENCES "user" (id) ON DELETE CASCADE,
+            delta INTEGER NOT NULL,
+            reason VARCHAR(30) NOT NULL,
+            ref_id UUID,
+            created_at TIMESTAMP NOT NULL,
+            compacted BOOLEAN NOT NULL DEFAULT false
+        )
+    """))
+    conn.execute(text(
+        "CREATE INDEX IF NOT EXISTS ix_xp_events_user_id_created_at ON xp_events (user_id, created_at) INCLUDE (delta)"
+    ))
+    conn.execute(text(
+        "CREATE INDEX IF NOT EXISTS ix_xp_events_uncompacted ON xp_events (user_id) INCLUDE (delta) WHERE NOT compacted"
+    ))
+
+
+def _user_daily_activity(conn):
+    conn.execute(text("""
+        CREATE TABLE IF NOT EXISTS user_daily_activity (
+            user_id UUID NOT NULL REFERENCES "user" (id) ON DELETE CASCADE,
+            day DATE NOT NULL,
+            tasks_completed INTEGER NOT NULL DEFAULT 0,
+            focus_seconds BIGINT NOT NULL DEFAULT 0,
+            xp_gained INTEGER NOT NULL DEFAULT 0,
+            pets_fed INTEGER NOT NULL DEFAULT 0,
+            PRIMARY KEY (user_id, day)
+        )
+    """))
+    # the history so far; workers wait for this step, so nothing writes meanwhile
+    # (python activity.py redoes it for when something did)
+    activity.rebuild(conn)
+
+
+@non_transactional
+def _user_counters(conn):
+    for column, kind in (("focus_seconds_total", "BIGINT"), ("tasks_completed", "INTEGER"), ("tasks_open", "INTEGER")):
+        conn.execute(text(f'ALTER TABLE "user" ADD COLUMN IF NOT EXISTS {column} {kind} NOT NULL DEFAULT 0'))
+    # each CREATE TRIGGER waits for the writes in flight on its table and commits right away,
+    # so tasks / focus_sessions are only blocked for a moment, not for the whole backfill.
+    # Once they're in, every write moves the counters itself and the backfill can run in
+    # per-user batches next to live traffic (REPEATABLE READ, see reconcile_all)
+    counters.install(conn)
+    counters.reconcile_all(conn.engine, report=False)
+
+
+# (version, name, function(conn)) => ordered, append only
+MIGRATIONS = [
+    (1, "legacy column fixes", _legacy_columns),
+    (2, "create missing tables", _create_missing_tables),
+    (3, "query-shaped composite and partial indexes", _query_shaped_indexes),
+    (4, "uuid shadow columns", _uuid_shadow_columns),
+    (5, "uuid backfill and shadow indexes", _uuid_backfill),
+    (6, "uuid swap", _uuid_swap),
+    (7, "validate uuid foreign keys", _uuid_validate_foreign_keys),
+    (8, "user.token_version", _token_version),
+    (9, "refresh_tokens", _refresh_tokens),
+    (10, "email_outbox", _email_outbox),
+    (11, "tasks keyset pagination indexes", _task_keyset_indexes),
+    (12, "user.data_version", _data_version),
+    (13, "xp_events", _xp_events),
+    (14, "user_daily_activity", _user_daily_activity),
+    (15, "user counters and their triggers", _user_counters),
+]
+
+LATEST_VERSION = MIGRATIONS[-1][0]
+
+
+def current_version(conn) -> int:
+    try:
+        return conn.execute(text("SELECT max(version) FROM schema_version")).scalar() or 0
+    except ProgrammingError:
+        # schema_version doesn't exist yet => nothing has been migrated
+        conn.rollback()
+        return 0
+
+
+def run_migrations(engine) -> int:
+    """Bring the schema up to LATEST_VERSION. Returns the number of steps applied."""
+    with engine.connect() as conn:
+        if current_version(conn) >= LATEST_VERSION:
+            conn.rollback()
+            return 0
+
+        conn.execute(text("SELECT pg_advisory_lock(:id)"), {"id": MIGRATION_LOCK_ID})
+        try:
+            conn.execute(text("""
+                CREATE TABLE IF NOT EXISTS schema_version (
+                    version INTEGER PRIMARY KEY,
+                    name VARCHAR NOT NULL,
+                    applied_at TIMESTAMP NOT NULL DEFAULT NOW()
+                )
+            """))
+            conn.commit()
+
+            # another worker may have finished while we waited for the lock
+            done = current_version(conn)
+            applied = 0
+            for version, name, step in MIGRATIONS:
+                if version <= done:
+                    continue
+                print(f"Applying migration {version}: {name}")
+                if getattr(step, "transactional", True):
+                    step(conn)
+                else:
+                    conn.commit()
+                    conn.execution_options(isolation_level="AUTOCOMMIT")
+                    try:
+                        step(conn)
+                    finally:
+                        conn.commit()
+                        conn.execution_options(isolation_level=engine.dialect.default_isolation_level)
+                conn.execute(
+                    text("INSERT INTO schema_version (version, name) VALUES (:v, :n)"),
+                    {"v": version, "n": name},
+                )
+                # one transaction per step => a failed step leaves the earlier ones applied
+                conn.commit()
+                applied += 1
+            return applied
+        finally:
+            conn.rollback()
+            conn.execute(text("SELECT pg_advisory_unlock(:id)"), {"id": MIGRATION_LOCK_ID})
+            conn.commit()
+
+
+if __name__ == "__main__":
+    from database import engine
+    applied = run_migrations(engine)
+    print(f"{applied} migration(s) applied, schema at version {LATEST_VERSION}")
@@ -1,4 +1,4 @@
-from sqlalchemy import Column, Integer, String, Boolean, DateTime, Float, ForeignKey, Date
+from sqlalchemy import Column, Integer, BigInteger, String, Boolean, DateTime, Float, ForeignKey, Date, Index, UniqueConstraint, Uuid, text
 from sqlalchemy.orm import relationship
 from database import Base
 from datetime import datetime
@@ -8,6 +8,20 @@ import uuid
 def _uuid() -> str:
     return str(uuid.uuid4())
 
+
+# Ids are native 16-byte uuid columns in Postgres, but as_uuid=False keeps them plain
+# strings in Python, so API responses look exactly like they did with String ids
+UUID = Uuid(as_uuid=False)
+
+
+def is_uuid(value) -> bool:
+    """Ids come straight from the url; anything that isn't a uuid can't match a row."""
+    try:
+        uuid.UUID(str(value))
+        return True
+    except ValueError:
+        return False
+
 """"
 Q - What is a Model?
 Ans - A model is like a blueprint for a table in your database.
@@ -16,8 +30,8 @@ For ex - a "Task" model will become a "tasks" table, and each task you add will
 
 class Task(Base):
     __tablename__ = "tasks"
-    id = Column(String, primary_key=True, default=_uuid, index=True)
-    title = Column(String(1000), index=True)
+    id = Column(UUID, primary_key=True, default=_uuid)
+    title = Column(String(1000))
     completed = Column(Boolean, default=False)
     created_at = Column(DateTime, default=datetime.utcnow)
     updated_at = Column(DateTime, default=datetime.utcnow)
@@ -26,12 +40,21 @@ class Task(Base):
     category = Column(String(50), nullable=True)
     due_date = Column(Date, nullable=True)
     points = Column(Integer, nullable=True)
-    user_id = Column(String, ForeignKey("user.id"))
+    user_id = Column(UUID, ForeignKey("user.id"))
     user = relationship("User", back_populates="tasks")
 
+    # Indexes follow the queries, not the columns (migrations.py creates them on old databases):
+    # user_id + completed + created_at => GET /tasks?completed= and the stats count/streak scans
+    # user_id + created_at/due_date + id => GET /tasks keyset pages in either sort (task_crud.list_tasks)
+    __table_args__ = (
+        Index("ix_tasks_user_id_completed_created_at", "user_id", "completed", "created_at"),
+        Index("ix_tasks_user_id_created_at_id", "user_id", "created_at", "id"),
+        Index("ix_tasks_user_id_due_date_id", "user_id", "due_date", "id"),
+    )
+
 class Pet(Base):
     __tablename__ = "pets"
-    id = Column(String, primary_key=True, default=_uuid, index=True)
+    id = Column(UUID, primary_key=True, default=_uuid)
     name = Column(String, index=True, nullable=False)
     age = Column(Float, default=0.0)
     type = Column(String, nullable=False)
@@ -41,30 +64,46 @@ class Pet(Base):
     gender = Column(String(10), nullable=True)
     bond = Column(Float, default=0.0)
     last_focused_at = Column(DateTime, default=datetime.utcnow)
-    user_id = Column(String, ForeignKey("user.id"))
+    user_id = Column(UUID, ForeignKey("user.id"))
     user = relationship("User", back_populates="pets")
     qualifying_days = relationship("PetQualifyingDay", cascade="all, delete-orphan")
 
+    # user_id => GET /pet, partial on is_alive => add_bond_from_focus only looks at living pets
+    __table_args__ = (
+        Index("ix_pets_user_id", "user_id"),
+        Index("ix_pets_user_id_alive", "user_id", postgresql_where=text("is_alive")),
+    )
+
 
 class PetQualifyingDay(Base):
     __tablename__ = "pet_qualifying_days"
-    id = Column(String, primary_key=True, default=_uuid)
-    pet_id = Column(String, ForeignKey("pets.id", ondelete="CASCADE"), nullable=False)
-    user_id = Column(String, ForeignKey("user.id", ondelete="CASCADE"), nullable=False)
+    id = Column(UUID, primary_key=True, default=_uuid)
+    pet_id = Column(UUID, ForeignKey("pets.id", ondelete="CASCADE"), nullable=False)
+    user_id = Column(UUID, ForeignKey("user.id", ondelete="CASCADE"), nullable=False)
     date = Column(Date, nullable=False)
     created_at = Column(DateTime, default=datetime.utcnow)
 
+    # one qualifying day per pet per day, also what _check_qualifying_day looks up
+    __table_args__ = (
+        UniqueConstraint("pet_id", "date", name="pet_qualifying_days_pet_id_date_key"),
+    )
+
 class FocusSession(Base):
     __tablename__ = "focus_sessions"
-    id = Column(String, primary_key=True, default=_uuid, index=True)
-    user_id = Column(String, ForeignKey("user.id"))
+    id = Column(UUID, primary_key=True, default=_uuid)
+    user_id = Column(UUID, ForeignKey("user.id"))
     duration_seconds = Column(Integer, nullable=False)
     created_at = Column(DateTime, default=datetime.utcnow)
     user = relationship("User", back_populates="focus_sessions")
 
+    # /focus/total, /focus/today and _check_qualifying_day; INCLUDE lets the SUMs run index-only
+    __table_args__ = (
+        Index("ix_focus_sessions_user_id_created_at", "user_id", "created_at", postgresql_include=["duration_seconds"]),
+    )
+
 class User(Base):
     __tablename__ = "user"
-    id = Column(String, primary_key=True, default=_uuid, index=True)
+    id = Column(UUID, primary_key=True, default=_uuid)
     username = Column(String, unique=True, index=True)
     hashed_password = Column(String)
     email = Column(String, unique=True, index=True)
@@ -82,6 +121,103 @@ class User(Base):
     provider_id = Column(String, nullable=True)
     # Theme preference: 'light' or 'dark' (default: 'light')
     theme = Column(String, default='light')
+    # copied into every JWT as "ver"; bumping it (password change...) invalidates all tokens issued before
+    token_version = Column(Integer, default=0, server_default=text("0"), nullable=False)
+    # bumped by every change to the user's tasks/pets/focus sessions; the ETag of the polled GETs (data_version.py)
+    data_version = Column(BigInteger, default=0, server_default=text("0"), nullable=False)
+    # kept by triggers on tasks / focus_sessions, checked by a reconciliation job (counters.py)
+    focus_seconds_total = Column(BigInteger, default=0, server_default=text("0"), nullable=False)
+    tasks_completed = Column(Integer, default=0, server_default=text("0"), nullable=False)
+    tasks_open = Column(Integer, default=0, server_default=text("0"), nullable=False)
+
+
+
+
+
+class RefreshToken(Base):
+    """
+    One row per issued refresh token; only the sha256 of the token is stored.
+    Every refresh marks the presented row used and issues the next one in the same family.
+    Presenting a used (or revoked) token again means it leaked => the whole family is revoked.
+    """
+    __tablename__ = "refresh_tokens"
+    id = Column(UUID, primary_key=True, default=_uuid)
+    token_hash = Column(String(64), nullable=False, unique=True)
+    family_id = Column(UUID, nullable=False, index=True)
+    user_id = Column(UUID, ForeignKey("user.id", ondelete="CASCADE"), nullable=False, index=True)
+    # user.token_version at issue time: a password change kills refresh tokens too
+    token_version = Column(Integer, nullable=False, default=0)
+    created_at = Column(DateTime, default=datetime.utcnow)
+    expires_at = Column(DateTime, nullable=False)
+    used_at = Column(DateTime, nullable=True)
+    revoked = Column(Boolean, nullable=False, default=False)
+
+
+class EmailOutbox(Base):
+    """
+    Emails waiting to go out (see email_outbox.py). Written in the same transaction as the
+    OTP it carries, delivered by a background worker with retries.
+    status: pending => sent | failed (gave up) | superseded (a newer email with the same dedupe_key replaced it)
+    """
+    __tablename__ = "email_outbox"
+    id = Column(UUID, primary_key=True, default=_uuid)
+    to_email = Column(String, nullable=False)
+    subject = Column(String, nullable=False)
+    body = Column(String, nullable=False)
+    html_body = Column(String, nullable=True)
+    # e.g. "reset_otp:<email>": only the newest pending email per key is delivered
+    dedupe_key = Column(String, nullable=True)
+    status = Column(String(20), nullable=False, default="pending")
+    attempts = Column(Integer, nullable=False, default=0)
+    # also the claim lease: a worker that dies mid-send leaves the row due again after it
+    next_attempt_at = Column(DateTime, nullable=False, default=datetime.utcnow)
+    last_error = Column(String, nullable=True)
+    provider = Column(String(20), nullable=True)
+    created_at = Column(DateTime, default=datetime.utcnow)
+    sent_at = Column(DateTime, nullable=True)
+
+    # the worker's "what's due" scan and enqueue's "supersede older ones" lookup
+    __table_args__ = (
+        Index("ix_email_outbox_due", "next_attempt_at", postgresql_where=text("status = 'pending'")),
+        Index("ix_email_outbox_dedupe_key", "dedupe_key", postgresql_where=text("status = 'pending'")),
+    )
+
+
+class XpEvent(Base):
+    """
+    Append-only XP ledger (see xp_service.py): one row per XP change, never updated
+    except for the compaction flag. The balance is user.xp (everything compacted so far)
+    plus the deltas of this user's rows that aren't compacted yet.
+    """
+    __tablename__ = "xp_events"
+    id = Column(BigInteger, primary_key=True, autoincrement=True)
+    user_id = Column(UUID, ForeignKey("user.id", ondelete="CASCADE"), nullable=False)
+    delta = Column(Integer, nullable=False)
+    # task_completed, tasks_completed (a batch), task_deleted_late, tasks_deleted_late, pet_fed
+    reason = Column(String(30), nullable=False)
+    # the task / pet behind the change, when there is a single one
+    ref_id = Column(UUID, nullable=True)
+    created_at = Column(DateTime, nullable=False, default=datetime.utcnow)
+    compacted = Column(Boolean, nullable=False, default=False, server_default=text("false"))
 
+    # user_id + created_at => XP-over-time range scans; partial on NOT compacted => the
+    # balance read and the compaction job only ever see the short uncompacted tail
+    __table_args__ = (
+        Index("ix_xp_events_user_id_created_at", "user_id", "created_at", postgresql_include=["delta"]),
+        Index("ix_xp_events_uncompacted", "user_id", postgresql_include=["delta"], postgresql_where=text("NOT compacted")),
+    )
 
 
+class UserDailyActivity(Base):
+    """
+    Per user per (UTC) day totals, kept up to date by the writes that change them
+    (see activity.py). Analytics read a range of these instead of the whole history.
+    """
+    __tablename__ = "user_daily_activity"
+    user_id = Column(UUID, ForeignKey("user.id", ondelete="CASCADE"), primary_key=True)
+    day = Column(Date, primary_key=True)
+    # completed tasks, on the day the task was created (what stats and the heatmaps have always counted)
+    tasks_completed = Column(Integer, nullable=False, default=0, server_default=text("0"))
+    focus_seconds = Column(BigInteger, nullable=False, default=0, server_default=text("0"))
+    xp_gained = Column(Integer, nullable=False, default=0, server_default=text("0"))
+    pets_fed = Column(Integer, nullable=False, default=0, server_default=text("0"))
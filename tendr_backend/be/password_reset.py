@@ -1,23 +1,26 @@
 from models import User
-from sqlalchemy.orm import Session
-from auth import pwd_context, truncate_password
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
+from auth import truncate_password, hash_password, verify_password
 
 #fetch password
 #check the old password (correct or not)
 #if correct : store(update db) new hashed password if (new_hash_password === new_hash_password_confirm) [infact for new_pass and new_pass_confirm hash is not imp]
 
-def password_reset(db:Session, new_password:str, new_password_confirm: str, old_password:str, username:str):
-    user =  db.query(User).filter(User.username == username).first()
+async def password_reset(db:AsyncSession, new_password:str, new_password_confirm: str, old_password:str, username:str):
+    user =  (await db.execute(select(User).where(User.username == username))).scalars().first()
     if user:
         # Truncate passwords to 72 bytes (bcrypt limit)
         truncated_old_password = truncate_password(old_password)
-        if pwd_context.verify(truncated_old_password, user.hashed_password):
+        if await verify_password(truncated_old_password, user.hashed_password):
             if new_password == new_password_confirm:
                 truncated_new_password = truncate_password(new_password)
-                new_hashed_password = pwd_context.hash(truncated_new_password)
+                new_hashed_password = await hash_password(truncated_new_password)
                 user.hashed_password = new_hashed_password
-                db.commit()
-                db.refresh(user)
+                # log out every token issued with the old password
+                user.token_version = (user.token_version or 0) + 1
+                await db.commit()
+                await db.refresh(user)
                 return True
             else:
                 print("new_password != new_password_confirm")
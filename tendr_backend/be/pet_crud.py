@@ -1,10 +1,18 @@
+import uuid
 from datetime import datetime, date, timedelta
-from sqlalchemy.orm import Session
-from models import Pet, User, FocusSession, PetQualifyingDay
+from sqlalchemy import select, update, delete, exists, func, cast, literal, Date
+from sqlalchemy.dialects.postgresql import insert as pg_insert
+from sqlalchemy.ext.asyncio import AsyncSession
+from models import Pet, User, FocusSession, PetQualifyingDay, is_uuid
 from fastapi import HTTPException
+import activity
+import data_version
+import xp_service
 
+FEED_COST = 35
 
-def create_pet(db: Session, name: str, type: str, current_user, gender: str = None):
+
+async def create_pet(db: AsyncSession, name: str, type: str, current_user, gender: str = None):
     now = datetime.utcnow()
     new_pet = Pet(
         name=name,
@@ -19,126 +27,186 @@ def create_pet(db: Session, name: str, type: str, current_user, gender: str = No
         is_alive=True,
     )
     db.add(new_pet)
-    db.commit()
-    db.refresh(new_pet)
+    await db.commit()  # every column is set client side, no refresh needed
     return new_pet
 
 
-def get_pet_by_id(db: Session, id: str, current_user):
-    return db.query(Pet).filter(Pet.id == id, Pet.user_id == current_user.id).first()
+async def get_pet_by_id(db: AsyncSession, id: str, current_user):
+    if not is_uuid(id):
+        return None
+    result = await db.execute(select(Pet).where(Pet.id == id, Pet.user_id == current_user.id))
+    return result.scalars().first()
+
+
+# what GET /pet sends (PetResponse order), read as plain rows instead of ORM objects
+PET_LIST_COLUMNS = (
+    Pet.id, Pet.name, Pet.type, Pet.age, Pet.hunger, Pet.last_fed, Pet.is_alive,
+    Pet.gender, Pet.bond, Pet.last_focused_at, Pet.user_id,
+)
 
 
-def get_all_pets(db: Session, current_user):
-    pets = db.query(Pet).filter(Pet.user_id == current_user.id).all()
+async def get_all_pets(db: AsyncSession, current_user):
+    query = select(*PET_LIST_COLUMNS).where(Pet.user_id == current_user.id)
+    pets = (await db.execute(query)).all()
     if not pets:
         return []
     today = datetime.utcnow().date()
-    changed = False
-    for pet in pets:
-        if pet.is_alive:
-            days_since_fed = (today - pet.last_fed.date()).days
-            if days_since_fed >= 3:
-                pet.is_alive = False
-                changed = True
-    if changed:
-        db.commit()
-        for pet in pets:
-            db.refresh(pet)
+    starved = [pet.id for pet in pets if pet.is_alive and (today - pet.last_fed.date()).days >= 3]
+    if starved:
+        dead = {pet.id: pet for pet in (await db.execute(
+            update(Pet).where(Pet.id.in_(starved)).values(is_alive=False).returning(*PET_LIST_COLUMNS),
+            execution_options={"synchronize_session": False},
+        )).all()}
+        await data_version.bump(db, current_user.id)
+        await db.commit()
+        pets = [dead.get(pet.id, pet) for pet in pets]
     return pets
 
 
-def _check_qualifying_day(db: Session, pet: Pet, user_id: str):
-    today = datetime.utcnow().date()
-    existing = db.query(PetQualifyingDay).filter(
-        PetQualifyingDay.pet_id == pet.id,
-        PetQualifyingDay.date == today,
-    ).first()
-    if existing:
-        return
-    start_of_today = datetime.combine(today, datetime.min.time())
-    fed_today = pet.last_fed.date() == today
-    focused_today = db.query(FocusSession).filter(
-        FocusSession.user_id == user_id,
-        FocusSession.created_at >= start_of_today,
-    ).first() is not None
-    if fed_today and focused_today:
-        qd = PetQualifyingDay(pet_id=pet.id, user_id=user_id, date=today)
-        db.add(qd)
-        pet.age = (pet.age or 0) + 1
-        db.commit()
-
-
-def feed_pet(db: Session, pet_id: str, current_user):
-    pet = db.query(Pet).filter(Pet.id == pet_id, Pet.user_id == current_user.id).first()
+async def _record_qualifying_day(db: AsyncSession, pet_id, user_id, focused_today: bool):
+    """
+    Fed and focused today => today is a qualifying day and the pet ages by one.
+    The caller knows the pet was fed today; focused_today=False checks for a focus
+    session here. One statement: the day is inserted (a no-op if it's already there)
+    and only an inserted day ages the pet. Returns the new age, or None if nothing
+    changed. Runs in the caller's transaction, which bumps data_version and commits.
+    """
+    now = datetime.utcnow()
+    today = now.date()
+    values = select(
+        literal(str(uuid.uuid4()), PetQualifyingDay.id.type),
+        literal(pet_id, PetQualifyingDay.pet_id.type),
+        literal(user_id, PetQualifyingDay.user_id.type),
+        literal(today, Date),
+        literal(now, PetQualifyingDay.created_at.type),
+    )
+    if not focused_today:
+        start_of_today = datetime.combine(today, datetime.min.time())
+        values = values.where(exists().where(
+            FocusSession.user_id == user_id,
+            FocusSession.created_at >= start_of_today,
+        ))
+    day = (
+        pg_insert(PetQualifyingDay)
+        .from_select(["id", "pet_id", "user_id", "date", "created_at"], values)
+        .on_conflict_do_nothing(constraint="pet_qualifying_days_pet_id_date_key")
+        .returning(PetQualifyingDay.pet_id)
+        .cte("day")
+    )
+    aged = (
+        update(Pet).where(Pet.id == day.c.pet_id)
+        .values(age=func.coalesce(Pet.age, 0) + 1)
+        .returning(Pet.age)
+    )
+    return (await db.execute(aged, execution_options={"synchronize_session": False})).scalar()
+
+
+async def feed_pet(db: AsyncSession, pet_id: str, current_user):
+    if not is_uuid(pet_id):
+        return None
+    pet = (await db.execute(
+        select(*PET_LIST_COLUMNS).where(Pet.id == pet_id, Pet.user_id == current_user.id)
+    )).first()
     if not pet:
         return None
 
     today = datetime.utcnow().date()
     days_since_fed = (today - pet.last_fed.date()).days
     if days_since_fed >= 3:
-        pet.is_alive = False
-        db.commit()
-        db.refresh(pet)
-        return pet
-
-    user = db.query(User).filter(User.id == current_user.id).first()
-    if not user or user.xp < 35:
+        pet = (await db.execute(
+            update(Pet).where(Pet.id == pet.id).values(is_alive=False).returning(*PET_LIST_COLUMNS),
+            execution_options={"synchronize_session": False},
+        )).first()
+        await data_version.bump(db, current_user.id)
+        await db.commit()
+        return pet._asdict() if pet else None
+
+    # Conditional on the last_fed we just read: a double-click's second request waits
+    # for the first, then matches no row and gets the fed pet back without paying again
+    fed = (await db.execute(
+        update(Pet).where(Pet.id == pet.id, Pet.last_fed == pet.last_fed)
+        .values(hunger=100, last_fed=datetime.utcnow())
+        .returning(*PET_LIST_COLUMNS),
+        execution_options={"synchronize_session": False},
+    )).first()
+    if fed is None:
+        await db.rollback()
+        fed = (await db.execute(select(*PET_LIST_COLUMNS).where(Pet.id == pet.id))).first()
+        return fed._asdict() if fed else None
+
+    fed = fed._asdict()
+    age = await _record_qualifying_day(db, pet.id, current_user.id, focused_today=False)
+    if age is not None:
+        fed["age"] = age
+    # pet rows, then the user row, then the activity row (xp_service); spend also bumps data_version
+    if await xp_service.spend(db, current_user.id, FEED_COST, "pet_fed", pet.id) is None:
+        await db.rollback()
         raise HTTPException(status_code=400, detail="Not enough XP to feed pet")
+    day_changes = activity.changes()
+    day_changes[today]["pets_fed"] += 1
+    await activity.add(db, current_user.id, day_changes)
+    await db.commit()
+    return fed
 
-    user.xp -= 35
-    pet.hunger = 100
-    pet.last_fed = datetime.utcnow()
 
-    db.commit()
-    db.refresh(pet)
-    db.refresh(user)
-
-    _check_qualifying_day(db, pet, str(current_user.id))
-
-    return pet
-
-
-def add_bond_from_focus(db: Session, user_id: str, duration_seconds: int):
-    pet = db.query(Pet).filter(Pet.user_id == user_id, Pet.is_alive == True).first()
+async def add_bond_from_focus(db: AsyncSession, user_id: str, duration_seconds: int):
+    now = datetime.utcnow()
+    today = now.date()
+    pet_id = (
+        select(Pet.id).where(Pet.user_id == user_id, Pet.is_alive == True)
+        .limit(1).scalar_subquery()
+    )
+    # bond decays 33 per day without focus, then gains 15 per hour of this session, capped at 100
+    days_since_focus = func.coalesce(literal(today, Date) - cast(Pet.last_focused_at, Date), 0)
+    decayed = func.greatest(0.0, func.coalesce(Pet.bond, 0.0) - days_since_focus * 33)
+    gain = (duration_seconds / 60 / 60) * 15
+    pet = (await db.execute(
+        update(Pet).where(Pet.id == pet_id)
+        .values(bond=func.least(100.0, decayed + gain), last_focused_at=now)
+        .returning(Pet.id, Pet.last_fed),
+        execution_options={"synchronize_session": False},
+    )).first()
     if not pet:
         return
 
-    today = datetime.utcnow().date()
-    days_since_focus = (today - pet.last_focused_at.date()).days
-    pet.bond = max(0.0, (pet.bond or 0.0) - days_since_focus * 33)
+    if pet.last_fed and pet.last_fed.date() == today:
+        await _record_qualifying_day(db, pet.id, user_id, focused_today=True)
+    await data_version.bump(db, user_id)
+    await db.commit()
 
-    duration_minutes = duration_seconds / 60
-    gain = (duration_minutes / 60) * 15
-    pet.bond = min(100.0, pet.bond + gain)
-    pet.last_focused_at = datetime.utcnow()
 
-    db.commit()
-    db.refresh(pet)
-
-    _check_qualifying_day(db, pet, str(user_id))
-
-
-def update_pet(db: Session, id: str, hunger: int, last_fed: datetime, age: float, current_user):
-    pet = get_pet_by_id(db, id, current_user)
+async def update_pet(db: AsyncSession, id: str, hunger: int, last_fed: datetime, current_user):
+    if not is_uuid(id):
+        return None
+    pet = (await db.execute(
+        update(Pet).where(Pet.id == id, Pet.user_id == current_user.id)
+        .values(hunger=hunger, last_fed=last_fed)
+        .returning(*PET_LIST_COLUMNS),
+        execution_options={"synchronize_session": False},
+    )).first()
     if pet is None:
         return None
-    pet.hunger = hunger
-    pet.last_fed = last_fed
-    pet.age = age
-    db.commit()
-    db.refresh(pet)
-    return pet
+    await data_version.bump(db, current_user.id)
+    await db.commit()
+    return pet._asdict()
 
 
-def check_dead_pet(db: Session, current_user):
-    pets = db.query(Pet).filter(Pet.is_alive == False, Pet.user_id == current_user.id).all()
+async def check_dead_pet(db: AsyncSession, current_user):
+    result = await db.execute(select(Pet).where(Pet.is_alive == False, Pet.user_id == current_user.id))
+    pets = result.scalars().all()
     return pets or None
 
 
-def delete_pet(db: Session, id: str, current_user):
-    pet = get_pet_by_id(db, id, current_user)
-    if pet is None:
+async def delete_pet(db: AsyncSession, id: str, current_user):
+    if not is_uuid(id):
+        return False
+    # its qualifying days go with it (ON DELETE CASCADE), no need to load them first
+    deleted = (await db.execute(
+        delete(Pet).where(Pet.id == id, Pet.user_id == current_user.id).returning(Pet.id),
+        execution_options={"synchronize_session": False},
+    )).first()
+    if deleted is None:
         return False
-    db.delete(pet)
-    db.commit()
+    await data_version.bump(db, current_user.id)
+    await db.commit()
     return True
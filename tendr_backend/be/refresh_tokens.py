@@ -0,0 +1,127 @@
+"""
+Refresh tokens: renew a short-lived access token without the password (and without bcrypt).
+
+- the client gets an opaque random refresh token next to its access token at login
+- only sha256(token) is stored, so a database leak doesn't hand out sessions,
+  and a renewal is one unique-index lookup instead of a password hash
+- rotation: every refresh marks the presented token used and hands out the next
+  one in the same family (one family per login)
+- reuse detection: presenting a token that was already used means someone else
+  has a copy => the whole family is revoked and both parties must log in again
+  (except within REFRESH_REUSE_GRACE_SECONDS, so a client retrying a request
+  that raced with itself only gets a 401, not a logout)
+- a password change bumps user.token_version, which also kills refresh tokens
+"""
+import asyncio
+import hashlib
+import os
+import secrets
+import uuid
+from datetime import datetime, timedelta
+
+from sqlalchemy import select, update, delete
+from sqlalchemy.ext.asyncio import AsyncSession
+
+import metrics
+from database import AsyncSessionLocal
+from models import RefreshToken, User
+
+REFRESH_TOKEN_DAYS = int(os.getenv("REFRESH_TOKEN_DAYS", "30"))
+REFRESH_REUSE_GRACE_SECONDS = int(os.getenv("REFRESH_REUSE_GRACE_SECONDS", "10"))
+
+refreshes_total = metrics.Counter("tendr_token_refreshes_total", "Refresh token attempts by outcome")
+
+
+def _digest(token: str) -> str:
+    return hashlib.sha256(token.encode()).hexdigest()
+
+
+def _add(db: AsyncSession, user: User, family_id: str) -> str:
+    token = secrets.token_urlsafe(32)
+    db.add(RefreshToken(
+        token_hash=_digest(token),
+        family_id=family_id,
+        user_id=user.id,
+        token_version=user.token_version or 0,
+        expires_at=datetime.utcnow() + timedelta(days=REFRESH_TOKEN_DAYS),
+    ))
+    return token
+
+
+async def issue(db: AsyncSession, user: User) -> str:
+    """New family, at login."""
+    token = _add(db, user, str(uuid.uuid4()))
+    await db.commit()
+    return token
+
+
+async def rotate(db: AsyncSession, token: str):
+    """(user, next refresh token) if the token is good, otherwise None."""
+    row = (await db.execute(
+        select(RefreshToken, User)
+        .join(User, User.id == RefreshToken.user_id)
+        .where(RefreshToken.token_hash == _digest(token))
+        .with_for_update(of=RefreshToken)
+    )).first()
+    if row is None:
+        refreshes_total.inc(outcome="unknown")
+        return None
+    stored, user = row
+    now = datetime.utcnow()
+
+    if stored.revoked:
+        refreshes_total.inc(outcome="revoked")
+        await db.rollback()
+        return None
+    if stored.used_at is not None:
+        if (now - stored.used_at).total_seconds() < REFRESH_REUSE_GRACE_SECONDS:
+            refreshes_total.inc(outcome="raced")
+            await db.rollback()
+            return None
+        print(f"Refresh token reuse for user {user.id}, revoking family {stored.family_id}")
+        await db.execute(update(RefreshToken).where(RefreshToken.family_id == stored.family_id).values(revoked=True))
+        await db.commit()
+        refreshes_total.inc(outcome="reuse")
+        return None
+    if stored.expires_at < now or stored.token_version != (user.token_version or 0):
+        refreshes_total.inc(outcome="expired")
+        await db.rollback()
+        return None
+
+    stored.used_at = now
+    next_token = _add(db, user, stored.family_id)
+    await db.commit()
+    refreshes_total.inc(outcome="ok")
+    return user, next_token
+
+
+async def revoke(db: AsyncSession, token: str) -> bool:
+    """Logout: revoke the family the token belongs to."""
+    family_id = (await db.execute(
+        select(RefreshToken.family_id).where(RefreshToken.token_hash == _digest(token))
+    )).scalar()
+    if family_id is None:
+        return False
+    await db.execute(update(RefreshToken).where(RefreshToken.family_id == family_id).values(revoked=True))
+    await db.commit()
+    return True
+
+
+async def purge_expired(db: AsyncSession) -> int:
+    # used rows are kept until they expire: they're what detects reuse
+    result = await db.execute(delete(RefreshToken).where(RefreshToken.expires_at < datetime.utcnow()))
+    await db.commit()
+    return result.rowcount
+
+
+async def purge_loop(interval: float = 3600):
+    """Background task (lifespan): drop expired rows once an hour."""
+    while True:
+        try:
+            async with AsyncSessionLocal() as db:
+                purged = await purge_expired(db)
+            if purged:
+                print(f"Purged {purged} expired refresh tokens")
+        except Exception as e:
+            print(f"Refresh token purge failed: {e}")
+        await asyncio.sleep(interval)
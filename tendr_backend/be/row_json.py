@@ -0,0 +1,29 @@
+"""
+JSON for the list endpoints, straight from Core rows.
+
+GET /tasks and GET /pet used to load full ORM objects, copy them into dicts, run
+model_validate on every item and let FastAPI validate + serialize the list again
+against response_model. They now select only the columns they send and hand plain
+dicts to RowsJSONResponse, which skips all of that (returning a Response bypasses
+response_model; the route still declares it for the OpenAPI docs).
+
+The output matches what pydantic produced: the same keys in the same order,
+ISO 8601 datetimes/dates, and nulls for unset fields.
+"""
+import json
+from datetime import date, datetime
+
+from starlette.responses import JSONResponse
+
+
+def _default(value):
+    if isinstance(value, (datetime, date)):
+        return value.isoformat()
+    raise TypeError(f"{type(value).__name__} is not JSON serializable")
+
+
+class RowsJSONResponse(JSONResponse):
+    def render(self, content) -> bytes:
+        return json.dumps(
+            content, ensure_ascii=False, allow_nan=False, indent=None, separators=(",", ":"), default=_default,
+        ).encode("utf-8")
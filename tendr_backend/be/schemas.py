@@ -62,6 +62,23 @@ class TaskResponse(BaseModel):
 class TaskCompletionUpdate(BaseModel):
     completed: bool
 
+
+class TaskBatchCreate(BaseModel):
+    tasks: list[TaskCreate]
+
+
+class TaskBatchCompletionItem(BaseModel):
+    id: str
+    completed: bool
+
+
+class TaskBatchCompletion(BaseModel):
+    items: list[TaskBatchCompletionItem]
+
+
+class TaskBatchDelete(BaseModel):
+    ids: list[str]
+
 # --------------------------------------
 # PET SCHEMAS
 # --------------------------------------
@@ -122,6 +139,11 @@ class TokenResponse(BaseModel):
     token_type: str
     username: str
     email:str
+    refresh_token: Optional[str] = None
+
+
+class RefreshTokenRequest(BaseModel):
+    refresh_token: str
 
 
 class PasswordResetRequest(BaseModel):
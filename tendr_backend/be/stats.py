@@ -1,7 +1,9 @@
-from sqlalchemy.orm import Session
+from sqlalchemy import select, func, cast, literal_column, Integer, Date
+from sqlalchemy.ext.asyncio import AsyncSession
 from fastapi import HTTPException
-from models import Task, User
-from datetime import datetime
+from models import User, Task, UserDailyActivity
+import xp_service
+from datetime import datetime, time
 from datetime import timedelta
 from auth_dependencies import get_current_user
 from fastapi import Depends
@@ -11,77 +13,103 @@ def start_of_all_time(current_user: User):
     return current_user.start_acc_time
 
 
-def get_user_tasks(db: Session, user_id: str, start_date: datetime, current_user):
-    tasks = db.query(Task).filter(Task.user_id == current_user.id).filter(Task.completed==True).filter(Task.created_at >= start_date).all()
-    if tasks is None:
-        return []
-    else:
-        return tasks
+def stats_query(user_id, since, today):
+    """
+    The whole /analysis payload in one statement:
+    (completed count, open count, current streak, longest streak, XP).
 
-def count_tasks_completed(db: Session, user_id: str, start_date: datetime, current_user):
+    The counts are the user row's counters (counters.py), so they are all time: the
+    stats period (start_of_all_time) starts with the account anyway. The streaks come
+    from the daily rollup (activity.py), from since on.
+
+    Gaps and islands: numbered in date order, consecutive active days all have the same
+    day - row_number(), so grouping on it gives one row per streak. The current streak
+    is the one whose last day is today or yesterday (there is at most one).
+    """
+    days = (
+        select(
+            UserDailyActivity.day,
+            (UserDailyActivity.day - cast(func.row_number().over(order_by=UserDailyActivity.day), Integer)).label("island"),
+        )
+        .where(UserDailyActivity.user_id == user_id, UserDailyActivity.tasks_completed > 0)
+        .where(UserDailyActivity.day >= since)
+        .subquery()
+    )
+    islands = (
+        select(
+            func.count().label("length"),
+            func.max(days.c.day).label("last_day"),
+        )
+        .group_by(days.c.island)
+        .subquery()
+    )
+    return select(
+        select(User.tasks_completed).where(User.id == user_id).scalar_subquery(),
+        select(User.tasks_open).where(User.id == user_id).scalar_subquery(),
+        func.coalesce(func.max(islands.c.length).filter(islands.c.last_day >= today - timedelta(days=1)), 0),
+        func.coalesce(func.max(islands.c.length), 0),
+        # compacted balance + ledger tail, see xp_service
+        xp_service.balance_subquery(user_id),
+    )
 
-    num_completed = db.query(Task).filter(Task.user_id == current_user.id, Task.completed == True).filter(Task.created_at >= start_date).count()
-    if num_completed is None:
-        raise HTTPException(status_code=404, detail="No completed tasks found for the user")    
-    elif num_completed < 0:
-        raise HTTPException(status_code=400, detail="Invalid task count")
-    else:
-        return num_completed
-
-def streak_calculation(db: Session, user_id: str, start_date: datetime, current_user):
-    tasks = get_user_tasks(db, user_id, start_date, current_user)
-    if not tasks:
-        return 0
-        
-    task_dates = {t.created_at.date() for t in tasks}
-    sorted_dates = sorted(task_dates, reverse=True)
-    
-    if not sorted_dates:
-        return 0
-        
-    # A streak is active if the most recent task was completed today or yesterday
-    today = datetime.utcnow().date()
-    if sorted_dates[0] < today - timedelta(days=1):
-        return 0
-        
-    streaks = 1
-    current_date = sorted_dates[0]
-    
-    for i in range(1, len(sorted_dates)):
-        if current_date - sorted_dates[i] == timedelta(days=1):
-            streaks += 1
-            current_date = sorted_dates[i]
-        else:
-            break
-            
-    return streaks
-
-def total_xps(db:Session, user_id:str,current_user):
-    user = db.query(User).filter(User.id == current_user.id).first()
-    if user is None:
-        raise HTTPException(status_code=404, detail="User not found")
-    elif user.xp < 0:
-        raise HTTPException(status_code=400, detail="Invalid XP value")
-    else:
-        return user.xp or 0
 
-def get_user_stats(db: Session, user_id: str, start_period_func, current_user):
+async def get_user_stats(db: AsyncSession, user_id: str, start_period_func, current_user):
     start_date = start_period_func(current_user)
-    num_task_completed = count_tasks_completed(db, user_id, start_date, current_user)
-    streaks_count = streak_calculation(db, user_id, start_date, current_user)
-    xps = total_xps(db, user_id, current_user)
-    
-    if start_date is None or num_task_completed is None or streaks_count is None or xps is None:
+    if start_date is None:
         raise HTTPException(status_code=404, detail="User stats not found")
+
+    row = (await db.execute(stats_query(current_user.id, start_date.date(), datetime.utcnow().date()))).one()
+    num_task_completed, num_task_open, streaks_count, longest_streak, xps = (int(v) if v is not None else None for v in row)
+
+    if xps is None:
+        raise HTTPException(status_code=404, detail="User not found")
     if num_task_completed < 0 or streaks_count < 0 or xps < 0:
         raise HTTPException(status_code=400, detail="Invalid stats values")
-    else:      
+    else:
         return {
             "num_task_completed": num_task_completed,
+            "num_task_open": num_task_open,
             "streaks": streaks_count,
+            "longest_streak": longest_streak,
             "xps": xps,
         }
 
 
+# /analysis/series: how many days one bucket spans (at most), for the range limit and the default range
+SERIES_BUCKET_DAYS = {"day": 1, "week": 7, "month": 31}
+SERIES_MAX_BUCKETS = 366
+SERIES_DEFAULT_BUCKETS = 30
+
+
+async def completed_series(db: AsyncSession, user_id, start, end, bucket: str):
+    """
+    Completed tasks created in [start, end], counted per bucket and grouped by priority
+    and by category, aggregated in Postgres: one row per (bucket, priority, category)
+    instead of one per task. Reads tasks (the daily rollup has no priority/category),
+    a range scan of ix_tasks_user_id_completed_created_at.
+
+    Weeks start on Monday and months on the 1st (date_trunc), so the first and last
+    buckets cover only the part inside the range. Buckets without a completed task are
+    left out. Tasks without a category count as "Other".
+    """
+    # the unit is inlined (it comes from SERIES_BUCKET_DAYS): as a bind parameter the
+    # SELECT and GROUP BY expressions wouldn't be the same expression to Postgres
+    bucket_start = cast(func.date_trunc(literal_column(f"'{bucket}'"), Task.created_at), Date).label("bucket")
+    priority = func.initcap(func.coalesce(Task.priority, "Low")).label("priority")
+    category = func.coalesce(Task.category, "Other").label("category")
+    rows = (await db.execute(
+        select(bucket_start, priority, category, func.count())
+        .where(Task.user_id == user_id, Task.completed.is_(True))
+        .where(Task.created_at >= datetime.combine(start, time.min),
+               Task.created_at < datetime.combine(end + timedelta(days=1), time.min))
+        .group_by(bucket_start, priority, category)
+        .order_by(bucket_start)
+    )).all()
 
-    
\ No newline at end of file
+    buckets = {}
+    for day, prio, cat, count in rows:
+        entry = buckets.setdefault(day, {"start": day, "completed": 0, "by_priority": {}, "by_category": {}})
+        entry["completed"] += count
+        entry["by_priority"][prio] = entry["by_priority"].get(prio, 0) + count
+        entry["by_category"][cat] = entry["by_category"].get(cat, 0) + count
+    return list(buckets.values())
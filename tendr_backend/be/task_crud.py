@@ -1,6 +1,13 @@
+import base64
+import json
+import os
 from datetime import datetime, date as date_type
-from sqlalchemy.orm import Session
-from models import Task, User
+from sqlalchemy import select, update, delete, and_, or_, case, func, literal, Date
+from sqlalchemy.ext.asyncio import AsyncSession
+from models import Task, User, is_uuid
+import activity
+import data_version
+import xp_service
 from auth_dependencies import get_current_user
 from fastapi import Depends
 
@@ -36,94 +43,250 @@ def compute_raw_points(task) -> int:
     return base
 
 #adding task to db
-def create_task(db: Session, title: str, priority: str, current_user, category: str = None, due_date=None):
+async def create_task(db: AsyncSession, title: str, priority: str, current_user, category: str = None, due_date=None):
     priority_normalized = priority.capitalize() if priority else "Medium"
     base = _base_points(priority_normalized)
     new_task = Task(title=title, user_id=current_user.id, completed=False, priority=priority_normalized, category=category, due_date=due_date, points=base)
     db.add(new_task)
-    db.commit()
-    db.refresh(new_task)     # This updates the object with data from the database (like the new id)
+    await db.commit()
+    # id / created_at are client-side defaults, already on the object, and expire_on_commit=False
+    # keeps them readable: no refresh (SELECT) needed
     return new_task
     
 #getting all task from db
-def get_all_tasks(db:Session, current_user):
-    all_tasks = db.query(Task).filter(Task.user_id == current_user.id).all()
+async def get_all_tasks(db:AsyncSession, current_user):
+    result = await db.execute(select(Task).where(Task.user_id == current_user.id))
+    all_tasks = result.scalars().all()
     if all_tasks:
         return all_tasks
     else:
         return None
 
+# ---------------------------------------------------
+# GET /tasks: filters, sorting and keyset pagination
+# ---------------------------------------------------
+# Pages are cut with a cursor (the sort value + id of the last row sent) instead of
+# OFFSET, so page 50 costs the same as page 1 and rows added meanwhile don't shift pages.
+# Every ordering is "<sort column>, id" and matches an index that starts with user_id:
+#   created_at => ix_tasks_user_id_created_at_id
+#   due_date   => ix_tasks_user_id_due_date_id
+#   points     => effective points depend on today's date, so they can't be indexed;
+#                 the user_id prefix narrows the scan and Postgres sorts that user's rows
+# completed / category / priority / due range are filters on top of the same scans.
+
+TASK_SORTS = ("created_at", "-created_at", "due_date", "-due_date", "points", "-points")
+
+
+class InvalidCursor(ValueError):
+    pass
+
+
+def effective_points_expr(today: date_type, completed: bool = None):
+    """
+    compute_effective_points as SQL, so it can be sorted on.
+    completed=True/False prices the task as if it were (not) completed, whatever the
+    row says (for a RETURNING clause, which only sees the row after the update).
+    """
+    base = func.coalesce(Task.points, case(
+        (func.lower(Task.priority) == "high", _XP_BY_PRIORITY["high"]),
+        (func.lower(Task.priority) == "medium", _XP_BY_PRIORITY["medium"]),
+        else_=_XP_BY_PRIORITY["low"],
+    ))
+    if completed:
+        return base
+    ref = func.coalesce(Task.due_date, func.cast(Task.created_at, Date))
+    late = func.greatest(0, literal(today, Date) - ref)
+    if completed is False:
+        return case((late > 0, func.greatest(1, base - 3 * late)), else_=base)
+    return case(
+        (Task.completed.is_(True), base),
+        (late > 0, func.greatest(1, base - 3 * late)),
+        else_=base,
+    )
+
+
+def encode_cursor(sort: str, value, task_id) -> str:
+    if isinstance(value, (datetime, date_type)):
+        value = value.isoformat()
+    raw = json.dumps([sort, value, str(task_id)]).encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip("=")
+
+
+def _decode_cursor(cursor: str, sort: str):
+    try:
+        cursor_sort, value, task_id = json.loads(base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4)))
+    except Exception:
+        raise InvalidCursor("malformed cursor")
+    if cursor_sort != sort or not is_uuid(task_id):
+        raise InvalidCursor("cursor belongs to a different sort")
+    try:
+        if value is not None and sort.lstrip("-") == "created_at":
+            value = datetime.fromisoformat(value)
+        elif value is not None and sort.lstrip("-") == "due_date":
+            value = date_type.fromisoformat(value)
+        elif value is not None:
+            value = int(value)
+    except (TypeError, ValueError):
+        raise InvalidCursor("malformed cursor")
+    return value, task_id
+
+
+def _after(col, value, task_id, descending: bool):
+    """Rows strictly after (value, task_id) in "col ASC NULLS LAST, id ASC" order, or its exact reverse."""
+    if not descending:
+        if value is None:
+            return and_(col.is_(None), Task.id > task_id)
+        return or_(col > value, and_(col == value, Task.id > task_id), col.is_(None))
+    if value is None:
+        return or_(and_(col.is_(None), Task.id < task_id), col.isnot(None))
+    return or_(col < value, and_(col == value, Task.id < task_id))
+
+
+# what GET /tasks sends, read as plain rows: no ORM instances, identity map or pydantic
+# validation per task (benchmarks/bench_list_rows.py)
+TASK_LIST_COLUMNS = (
+    Task.id, Task.title, Task.priority, Task.category, Task.completed, Task.created_at,
+    Task.completed_at, Task.due_date, Task.user_id, Task.points,
+)
+
+
+async def list_tasks(db: AsyncSession, current_user, *, completed: bool = None, category: str = None,
+                     priority: str = None, due_from: date_type = None, due_to: date_type = None,
+                     sort: str = "created_at", limit: int = None, cursor: str = None):
+    """
+    (rows, next_cursor). Rows are TASK_LIST_COLUMNS + xp_reward (effective points).
+    With no limit every matching task comes back (old GET /tasks).
+    next_cursor is None on the last page. Raises InvalidCursor for a bad cursor.
+    """
+    descending = sort.startswith("-")
+    xp_reward = effective_points_expr(datetime.utcnow().date())
+    col = {
+        "created_at": Task.created_at,
+        "due_date": Task.due_date,
+        "points": xp_reward,
+    }[sort.lstrip("-")]
+
+    query = select(*TASK_LIST_COLUMNS, xp_reward.label("xp_reward")).where(Task.user_id == current_user.id)
+    if completed is not None:
+        query = query.where(Task.completed.is_(completed))
+    if category is not None:
+        query = query.where(Task.category == category)
+    if priority is not None:
+        query = query.where(Task.priority == priority.capitalize())
+    if due_from is not None:
+        query = query.where(Task.due_date >= due_from)
+    if due_to is not None:
+        query = query.where(Task.due_date <= due_to)
+    if cursor:
+        value, task_id = _decode_cursor(cursor, sort)
+        query = query.where(_after(col, value, task_id, descending))
+
+    # plain btree order read forwards / backwards
+    if descending:
+        query = query.order_by(col.desc().nulls_first(), Task.id.desc())
+    else:
+        query = query.order_by(col.asc().nulls_last(), Task.id.asc())
+    if limit is not None:
+        # one extra row says whether there is a next page
+        query = query.limit(limit + 1)
+
+    rows = (await db.execute(query)).all()
+    next_cursor = None
+    if limit is not None and len(rows) > limit:
+        rows = rows[:limit]
+        last = rows[-1]
+        last_value = {
+            "created_at": last.created_at,
+            "due_date": last.due_date,
+            "points": last.xp_reward,
+        }[sort.lstrip("-")]
+        next_cursor = encode_cursor(sort, last_value, last.id)
+    return rows, next_cursor
+
 #getting the task by id
 #.first() returns the first matching task
-def get_task_by_title(db: Session, task_title:str, current_user):
-    task = db.query(Task).filter(Task.title == task_title, Task.user_id == current_user.id).first()
+async def get_task_by_title(db: AsyncSession, task_title:str, current_user):
+    result = await db.execute(select(Task).where(Task.title == task_title, Task.user_id == current_user.id))
+    task = result.scalars().first()
     if task:
         return task
     else:
         return None
 
 #getting the task by id
-def get_task_by_id(db: Session, task_id: str, current_user):
-    task = db.query(Task).filter(Task.id == task_id, Task.user_id == current_user.id).first()
+async def get_task_by_id(db: AsyncSession, task_id: str, current_user):
+    if not is_uuid(task_id):
+        return None
+    result = await db.execute(select(Task).where(Task.id == task_id, Task.user_id == current_user.id))
+    task = result.scalars().first()
     if task:
         return task
     else:
         return None
 
 #updating task
-def update_task(db:Session, task_title : str, current_user):
-    task = get_task_by_title(db, task_title, current_user)
+async def update_task(db:AsyncSession, task_title : str, current_user):
+    # first task with that title, marked completed and read back in one statement; the locked
+    # subquery also says whether it already was (RETURNING only sees the new row)
+    first = (
+        select(Task.id, Task.completed.label("was_completed"))
+        .where(Task.title == task_title, Task.user_id == current_user.id)
+        .limit(1).with_for_update().subquery()
+    )
+    task = (await db.execute(
+        update(Task).where(Task.id == first.c.id).values(completed=True)
+        .returning(*TASK_LIST_COLUMNS, first.c.was_completed),
+        execution_options={"synchronize_session": False},
+    )).first()
     if task is None:
         return None
-    task.completed = True
-    db.commit()
-    if task:
-        return task
-    else:
-        return None 
+    if not task.was_completed:
+        day_changes = activity.changes()
+        activity.count_tasks(day_changes, [task.created_at])
+        await activity.add(db, current_user.id, day_changes)
+    await data_version.bump(db, current_user.id)
+    await db.commit()
+    return task
 
 #updating task completion by id
-def update_task_completion(db: Session, task_id: str, completed: bool, current_user: User):
-    task = db.query(Task).filter(Task.id == task_id, Task.user_id == current_user.id).first()
-    user = db.query(User).filter(User.id == current_user.id).first()
-
-    if not task:
+async def update_task_completion(db: AsyncSession, task_id: str, completed: bool, current_user: User):
+    if not is_uuid(task_id):
         return None
+    today = datetime.utcnow().date()
 
-    
-
-    # Effective XP: base priority points penalised 3/day if late, floor 1
-    xp_reward = compute_effective_points(task)
-
-    # Initialize XP if null (default is 100)
-    if user.xp is None:
-        user.xp = 100
-
-    # Only add XP when marking task as complete
-    if not task.completed and completed:
-        print(f"[DEBUG] XP before: {user.xp}")
-        user.xp = (user.xp or 0) + xp_reward
-        print(f"[DEBUG] XP after: {user.xp}")
-
-    task.completed = completed
-    task.completed_at = datetime.utcnow() if completed else None
+    # Conditional on the current state: of two requests completing the same task
+    # only the one whose UPDATE matched pays out XP.
+    # Effective XP: base priority points penalised 3/day if late, floor 1. RETURNING sees
+    # the updated row, so price it in the state it was in before (open when completing).
+    condition = Task.completed.isnot(True) if completed else Task.completed.is_(True)
+    task = (await db.execute(
+        update(Task).where(Task.id == task_id, Task.user_id == current_user.id, condition)
+        .values(completed=completed, completed_at=datetime.utcnow() if completed else None)
+        .returning(*TASK_LIST_COLUMNS, effective_points_expr(today, completed=not completed).label("xp_reward")),
+        execution_options={"synchronize_session": False},
+    )).first()
 
-    print(f"[DEBUG] Before commit: user {user.id} XP = {user.xp}, reward = {xp_reward}")
-    db.commit()
-    db.refresh(task)
-    db.refresh(user)
-    print(f"[DEBUG] After commit: user {user.id} XP = {user.xp}")
+    if task is None:
+        # not the caller's task, or already in that state: nothing to pay, report it as it is
+        task = (await db.execute(
+            select(*TASK_LIST_COLUMNS, effective_points_expr(today).label("xp_reward"))
+            .where(Task.id == task_id, Task.user_id == current_user.id)
+        )).first()
+        if not task:
+            return None
+        user_xp = await xp_service.current(db, current_user.id)
+    else:
+        day_changes = activity.changes()
+        activity.count_tasks(day_changes, [task.created_at], 1 if completed else -1)
+        if completed:
+            day_changes[today]["xp_gained"] += task.xp_reward
+            user_xp = await xp_service.grant(db, current_user.id, task.xp_reward, "task_completed", task_id)
+        else:
+            user_xp = await xp_service.current(db, current_user.id)
+        await activity.add(db, current_user.id, day_changes)
+        await data_version.bump(db, current_user.id)
+    await db.commit()
 
-    print({
-        "id": task.id,
-        "title": task.title,
-        "priority": task.priority,
-        "completed": task.completed,
-        "created_at": task.created_at,
-        "user_id": task.user_id,
-        "xpReward": xp_reward,
-        "userXP": user.xp,
-    })
     return {
         "id": task.id,
         "title": task.title,
@@ -135,42 +298,196 @@ def update_task_completion(db: Session, task_id: str, completed: bool, current_u
         "due_date": task.due_date,
         "user_id": task.user_id,
         "points": task.points,
-        "xpReward": xp_reward,
-        "userXP": user.xp,
+        "xpReward": task.xp_reward,
+        "userXP": user_xp,
     }
 
 
 
 #delete task
-def delete_task(db: Session, task_title : str, current_user):
-    task = get_task_by_title(db, task_title, current_user)
+async def delete_task(db: AsyncSession, task_title : str, current_user):
+    task = await get_task_by_title(db, task_title, current_user)
     if task is None:
         return None
-    db.delete(task)
-    db.commit()
+    await db.delete(task)
+    await db.commit()
     if task:
         return True  # Return True to indicate successful deletion
     else:
         return False
 
 #delete task by id
-def delete_task_by_id(db: Session, task_id: str, current_user):
-    task = get_task_by_id(db, task_id, current_user)
+async def delete_task_by_id(db: AsyncSession, task_id: str, current_user):
+    if not is_uuid(task_id):
+        return None
+    # DELETE ... RETURNING: of two concurrent deletes only one gets the row (and the penalty)
+    task = (await db.execute(
+        delete(Task).where(Task.id == task_id, Task.user_id == current_user.id)
+        .returning(Task.completed, Task.points, Task.priority, Task.due_date, Task.created_at),
+        execution_options={"synchronize_session": False},
+    )).first()
     if task is None:
         return None
     xp_deducted = 0
     if not task.completed:
         raw = compute_raw_points(task)
         if raw < 0:
-            user = db.query(User).filter(User.id == current_user.id).first()
-            if user:
-                penalty = abs(raw)
-                user.xp = max(0, (user.xp or 0) - penalty)
-                xp_deducted = penalty
-    db.delete(task)
-    db.commit()
+            xp_deducted = abs(raw)
+    else:
+        day_changes = activity.changes()
+        activity.count_tasks(day_changes, [task.created_at], -1)
+        await activity.add(db, current_user.id, day_changes)
+    if xp_deducted:
+        # also bumps data_version (xp_service)
+        await xp_service.deduct(db, current_user.id, xp_deducted, "task_deleted_late", task_id)
+    else:
+        await data_version.bump(db, current_user.id)
+    await db.commit()
     return {"message": "Task deleted successfully", "xp_deducted": xp_deducted}
     # Note: Returning True or False is a common practice to indicate success or failure of an operation.
     # In this case, we return True if the task was successfully deleted, otherwise False
     # This can be useful for the caller to know whether the deletion was successful or not.
     # If you want to raise an exception instead, you can do so, but returning True
+
+
+# ---------------------------------------------------
+# batch operations (/tasks/batch)
+# ---------------------------------------------------
+# One transaction per batch, a statement per kind of change instead of one per task,
+# and a single XP update (xp_service) for the whole batch. Results come back per item, in request
+# order: ids that aren't the caller's tasks are "not_found", repeats are "duplicate".
+
+TASK_BATCH_MAX = int(os.getenv("TASK_BATCH_MAX", "100"))
+
+
+def task_row_dict(row, xp_reward=None):
+    # same keys/order as TaskResponse
+    return {
+        "id": row.id, "title": row.title, "description": None, "priority": row.priority,
+        "category": row.category, "completed": row.completed,
+        "created_at": row.created_at, "completed_at": row.completed_at,
+        "due_date": row.due_date, "user_id": row.user_id,
+        "points": row.points, "xpReward": xp_reward, "userXP": None,
+    }
+
+
+def _dedupe(ids):
+    """[(id, first time seen?)] in request order"""
+    seen = set()
+    out = []
+    for task_id in ids:
+        out.append((task_id, task_id not in seen))
+        seen.add(task_id)
+    return out
+
+
+async def create_tasks(db: AsyncSession, items, current_user):
+    tasks = []
+    for item in items:
+        priority = item.priority.capitalize() if item.priority else "Medium"
+        tasks.append(Task(title=item.title, user_id=current_user.id, completed=False, priority=priority,
+                          category=item.category, due_date=item.due_date, points=_base_points(priority)))
+    db.add_all(tasks)
+    await db.commit()  # one multi-row INSERT; ids and created_at are set client side, no refresh needed
+    return [{"index": i, "status": "created", "task": task_row_dict(t)} for i, t in enumerate(tasks)]
+
+
+async def update_tasks_completion(db: AsyncSession, items, current_user):
+    """items: [(task_id, completed)]. XP is granted once per task that actually goes to completed."""
+    wanted = [task_id for task_id, _ in items if is_uuid(task_id)]
+    today = datetime.utcnow().date()
+    rows = {row.id: row for row in (await db.execute(
+        select(*TASK_LIST_COLUMNS, effective_points_expr(today).label("xp_reward"))
+        .where(Task.user_id == current_user.id, Task.id.in_(wanted))
+    )).all()} if wanted else {}
+
+    target = {}
+    for task_id, completed in items:
+        if task_id in rows and task_id not in target:
+            target[task_id] = completed
+    to_complete = [task_id for task_id, completed in target.items() if completed]
+    to_reopen = [task_id for task_id, completed in target.items() if not completed]
+
+    # conditional on the current state, so a task completed by a concurrent request isn't paid twice
+    changed = {}
+    now = datetime.utcnow()
+    for ids, values, condition in (
+        (to_complete, {"completed": True, "completed_at": now}, Task.completed.isnot(True)),
+        (to_reopen, {"completed": False, "completed_at": None}, Task.completed.is_(True)),
+    ):
+        if not ids:
+            continue
+        result = await db.execute(
+            update(Task).where(Task.user_id == current_user.id, Task.id.in_(ids), condition)
+            .values(**values).returning(*TASK_LIST_COLUMNS),
+            execution_options={"synchronize_session": False},
+        )
+        changed.update({row.id: row for row in result.all()})
+
+    xp_gained = sum(rows[task_id].xp_reward for task_id in to_complete if task_id in changed)
+    day_changes = activity.changes()
+    activity.count_tasks(day_changes, [changed[t].created_at for t in to_complete if t in changed], 1)
+    activity.count_tasks(day_changes, [changed[t].created_at for t in to_reopen if t in changed], -1)
+    day_changes[today]["xp_gained"] += xp_gained
+    if xp_gained:
+        user_xp = await xp_service.grant(db, current_user.id, xp_gained, "tasks_completed")
+    else:
+        user_xp = await xp_service.current(db, current_user.id)
+    if changed:
+        await activity.add(db, current_user.id, day_changes)
+        await data_version.bump(db, current_user.id)
+    await db.commit()
+
+    results = []
+    for task_id, first in _dedupe([task_id for task_id, _ in items]):
+        if not first:
+            results.append({"id": task_id, "status": "duplicate"})
+        elif task_id not in rows:
+            results.append({"id": task_id, "status": "not_found"})
+        elif task_id in changed:
+            completed = target[task_id]
+            reward = rows[task_id].xp_reward if completed else 0
+            results.append({"id": task_id, "status": "completed" if completed else "reopened",
+                            "xpReward": reward, "task": task_row_dict(changed[task_id], reward)})
+        else:
+            results.append({"id": task_id, "status": "unchanged", "xpReward": 0, "task": task_row_dict(rows[task_id], 0)})
+    return {"results": results, "xp_gained": xp_gained, "userXP": user_xp}
+
+
+async def delete_tasks_by_id(db: AsyncSession, ids, current_user):
+    """Same XP penalty as delete_task_by_id, summed over the batch and applied once."""
+    wanted = [task_id for task_id in ids if is_uuid(task_id)]
+    deleted = {}
+    if wanted:
+        result = await db.execute(
+            delete(Task).where(Task.user_id == current_user.id, Task.id.in_(wanted))
+            .returning(Task.id, Task.completed, Task.points, Task.priority, Task.due_date, Task.created_at),
+            execution_options={"synchronize_session": False},
+        )
+        deleted = {row.id: row for row in result.all()}
+
+    penalties = {}
+    for task_id, row in deleted.items():
+        raw = compute_raw_points(row) if not row.completed else 0
+        penalties[task_id] = -raw if raw < 0 else 0
+    xp_deducted = sum(penalties.values())
+    day_changes = activity.changes()
+    activity.count_tasks(day_changes, [row.created_at for row in deleted.values() if row.completed], -1)
+    await activity.add(db, current_user.id, day_changes)
+    if xp_deducted:
+        # max(0, max(0, xp - a) - b) == max(0, xp - (a + b)): one deduction for the batch,
+        # which also bumps data_version (xp_service)
+        await xp_service.deduct(db, current_user.id, xp_deducted, "tasks_deleted_late")
+    elif deleted:
+        await data_version.bump(db, current_user.id)
+    await db.commit()
+
+    results = []
+    for task_id, first in _dedupe(ids):
+        if not first:
+            results.append({"id": task_id, "status": "duplicate"})
+        elif task_id in deleted:
+            results.append({"id": task_id, "status": "deleted", "xp_deducted": penalties[task_id]})
+        else:
+            results.append({"id": task_id, "status": "not_found"})
+    return {"results": results, "xp_deducted": xp_deducted}
@@ -0,0 +1,130 @@
+"""
+Per-process cache of authenticated users, keyed by the token subject (username).
+
+get_current_user used to run a SELECT on "user" for every authenticated request.
+With this cache a warm request does no user lookup at all.
+
+- bounded: least recently used entries are dropped past USER_CACHE_SIZE
+- TTL: entries expire after USER_CACHE_TTL_SECONDS. That is also the worst-case
+  staleness when several worker processes run, since each has its own cache.
+- invalidation: any committed ORM update/delete of a User row (password change,
+  theme, XP, account deletion...) drops that user's entry. Code that changes
+  users with a bulk UPDATE/DELETE has to call invalidate(user_id) itself.
+
+Cached users are detached copies: read their columns, but never add them to a
+session or touch relationships. Re-select the row to modify it.
+
+Alongside whole users it keeps user id -> token_version for get_token_user,
+which only needs to know whether a token's "ver" claim is still current.
+Same TTL, same invalidation.
+"""
+import os
+import threading
+import time
+from collections import OrderedDict
+
+from sqlalchemy import event
+from sqlalchemy.orm import Session
+
+from models import User
+
+USER_CACHE_TTL_SECONDS = float(os.getenv("USER_CACHE_TTL_SECONDS", "30"))
+USER_CACHE_SIZE = int(os.getenv("USER_CACHE_SIZE", "10000"))
+
+_entries = OrderedDict()   # subject -> (expires_at, user)
+_subject_by_id = {}        # user id -> subject, so writes can invalidate by id
+_versions = OrderedDict()  # user id -> (expires_at, token_version)
+_lock = threading.Lock()
+
+
+def get(subject: str):
+    with _lock:
+        entry = _entries.get(subject)
+        if entry is None:
+            return None
+        expires_at, user = entry
+        if expires_at < time.monotonic():
+            _drop(subject)
+            return None
+        _entries.move_to_end(subject)
+        return user
+
+
+def put(subject: str, user: User):
+    with _lock:
+        _entries[subject] = (time.monotonic() + USER_CACHE_TTL_SECONDS, user)
+        _entries.move_to_end(subject)
+        _subject_by_id[user.id] = subject
+        while len(_entries) > USER_CACHE_SIZE:
+            _drop(next(iter(_entries)))
+
+
+def get_token_version(user_id):
+    with _lock:
+        entry = _versions.get(user_id)
+        if entry is not None and entry[0] >= time.monotonic():
+            _versions.move_to_end(user_id)
+            return entry[1]
+        _versions.pop(user_id, None)
+        # a cached user carries its version too
+        subject = _subject_by_id.get(user_id)
+    if subject is not None:
+        user = get(subject)
+        if user is not None:
+            return user.token_version
+    return None
+
+
+def put_token_version(user_id, version: int):
+    with _lock:
+        _versions[user_id] = (time.monotonic() + USER_CACHE_TTL_SECONDS, version)
+        _versions.move_to_end(user_id)
+        while len(_versions) > USER_CACHE_SIZE:
+            _versions.popitem(last=False)
+
+
+def invalidate(user_id):
+    with _lock:
+        _versions.pop(user_id, None)
+        subject = _subject_by_id.get(user_id)
+        if subject is not None:
+            _drop(subject)
+
+
+def clear():
+    with _lock:
+        _entries.clear()
+        _subject_by_id.clear()
+        _versions.clear()
+
+
+def _drop(subject):
+    # caller holds _lock
+    entry = _entries.pop(subject, None)
+    if entry is not None:
+        _subject_by_id.pop(entry[1].id, None)
+
+
+# ---------------------------------------------------
+# invalidate on commit
+# ---------------------------------------------------
+# flushes only queue the user id; the entry goes once the transaction commits
+# (a rolled back change never reached the db, so the cached copy is still right)
+
+@event.listens_for(User, "after_update")
+@event.listens_for(User, "after_delete")
+def _queue_invalidation(mapper, connection, target):
+    session = Session.object_session(target)
+    if session is not None:
+        session.info.setdefault("changed_user_ids", set()).add(target.id)
+
+
+@event.listens_for(Session, "after_commit")
+def _invalidate_committed(session):
+    for user_id in session.info.pop("changed_user_ids", ()):
+        invalidate(user_id)
+
+
+@event.listens_for(Session, "after_rollback")
+def _forget_rolled_back(session):
+    session.info.pop("changed_user_ids", None)
@@ -0,0 +1,181 @@
+"""
+XP lives in an append-only ledger (xp_events) with a periodically compacted balance.
+
+Every completion, late-delete penalty and pet feed used to rewrite user.xp, one hot
+row with no history. Now each change is an INSERT into xp_events, and:
+
+    balance = coalesce(user.xp, 100) + sum(delta of the user's uncompacted events)
+
+user.xp holds everything compacted so far. compact() (run by compact_loop from the
+lifespan) folds the uncompacted events into user.xp and flags them, in the same
+statement, so a reader sees either the events or their folded total, never both.
+The uncompacted tail is only what happened since the last run, so reading the
+balance stays a primary key lookup plus a few index entries (ix_xp_events_uncompacted).
+
+    grant   insert +n, no lock: gains can't overdraw anything     (task completion)
+    spend   lock the user row, check balance >= n, insert -n      (feeding; None => not enough XP)
+    deduct  lock the user row, insert -min(n, balance)            (late task deleted, floored at 0)
+
+spend/deduct serialize on the user row lock, and the balance they check is read after
+taking it, so two feeds can't both spend the last 35 XP. Call these inside the
+caller's transaction, after its task/pet statements and before any user_daily_activity
+upsert: task/pet rows, then the user row, then the activity row. (A task or focus
+session write already locks the user row itself, through its counter trigger.)
+The lock is taken by bumping user.data_version (data_version.py), which every caller
+of spend/deduct needs anyway: they don't bump it again.
+
+The lock and the balance read have to stay two statements: a single
+SELECT ... FOR UPDATE would sum xp_events with the snapshot it took before waiting
+for the lock, missing the event the previous holder just committed.
+
+The ledger is kept after compaction: XP over time is a range scan on
+(user_id, created_at), see daily_totals().
+"""
+import asyncio
+import os
+from datetime import datetime, timedelta
+
+from sqlalchemy import select, update, insert, func, text, cast, Date
+from sqlalchemy.ext.asyncio import AsyncSession
+
+import data_version
+import metrics
+from database import AsyncSessionLocal
+from models import User, XpEvent
+
+XP_COMPACT_SECONDS = float(os.getenv("XP_COMPACT_SECONDS", "60"))
+XP_COMPACT_BATCH = int(os.getenv("XP_COMPACT_BATCH", "5000"))
+# one compactor at a time across processes (two folding the same users could deadlock)
+_COMPACT_LOCK_ID = 0x78705F6C  # "xp_l"
+
+xp_changes_total = metrics.Counter("tendr_xp_changes_total", "XP ledger writes by kind and result")
+xp_compacted_total = metrics.Counter("tendr_xp_events_compacted_total", "XP events folded into user.xp")
+
+
+def _balance(user_id):
+    pending = (
+        select(func.coalesce(func.sum(XpEvent.delta), 0))
+        .where(XpEvent.user_id == user_id, XpEvent.compacted.is_(False))
+        .scalar_subquery()
+    )
+    # one statement, so a compaction committing in between can't be counted twice
+    return select(func.coalesce(User.xp, 100) + pending).where(User.id == user_id)
+
+
+def balance_subquery(user_id):
+    """The balance as a scalar subquery, to read it alongside something else in one statement."""
+    return _balance(user_id).scalar_subquery()
+
+
+async def current(db: AsyncSession, user_id):
+    """The user's XP balance (None if there is no such user)."""
+    return (await db.execute(_balance(user_id))).scalar()
+
+
+def _event(user_id, delta: int, reason: str, ref_id):
+    return insert(XpEvent).values(
+        user_id=user_id, delta=delta, reason=reason, ref_id=ref_id, created_at=datetime.utcnow(),
+    )
+
+
+async def _record(db: AsyncSession, user_id, delta: int, reason: str, ref_id):
+    await db.execute(_event(user_id, delta, reason, ref_id))
+
+
+async def _lock(db: AsyncSession, user_id):
+    # an UPDATE locks the row just like SELECT ... FOR UPDATE, and the data_version bump is due anyway
+    await data_version.bump(db, user_id)
+
+
+async def grant(db: AsyncSession, user_id, amount: int, reason: str, ref_id=None):
+    """New balance."""
+    xp_changes_total.inc(kind="grant", result="ok")
+    if not amount:
+        return await current(db, user_id)
+    # one round trip: RETURNING reads the balance with the statement's snapshot, which
+    # doesn't include the event being inserted, so add it
+    return (await db.execute(
+        _event(user_id, amount, reason, ref_id).returning(balance_subquery(user_id) + amount)
+    )).scalar()
+
+
+async def spend(db: AsyncSession, user_id, amount: int, reason: str, ref_id=None):
+    """New balance, or None if the user has less than amount (nothing is recorded then)."""
+    await _lock(db, user_id)
+    balance = await current(db, user_id)
+    if balance is None or balance < amount:
+        xp_changes_total.inc(kind="spend", result="refused")
+        return None
+    await _record(db, user_id, -amount, reason, ref_id)
+    xp_changes_total.inc(kind="spend", result="ok")
+    return balance - amount
+
+
+async def deduct(db: AsyncSession, user_id, amount: int, reason: str, ref_id=None):
+    """New balance; a penalty never takes it below 0."""
+    await _lock(db, user_id)
+    balance = await current(db, user_id) or 0
+    taken = min(amount, max(balance, 0))
+    if taken:
+        await _record(db, user_id, -taken, reason, ref_id)
+    xp_changes_total.inc(kind="deduct", result="ok")
+    return balance - taken
+
+
+async def daily_totals(db: AsyncSession, user_id, start: datetime, end: datetime):
+    """[(date, xp gained, xp spent)] for days with any XP change in [start, end)."""
+    day = cast(XpEvent.created_at, Date)
+    rows = (await db.execute(
+        select(
+            day.label("day"),
+            func.coalesce(func.sum(XpEvent.delta).filter(XpEvent.delta > 0), 0),
+            func.coalesce(-func.sum(XpEvent.delta).filter(XpEvent.delta < 0), 0),
+        )
+        .where(XpEvent.user_id == user_id, XpEvent.created_at >= start, XpEvent.created_at < end)
+        .group_by(day).order_by(day)
+    )).all()
+    return [(row[0], int(row[1]), int(row[2])) for row in rows]
+
+
+# ---------------------------------------------------
+# compaction
+# ---------------------------------------------------
+
+async def compact(db: AsyncSession, limit: int = XP_COMPACT_BATCH) -> int:
+    """Fold up to limit uncompacted events into user.xp. Returns how many were folded."""
+    if not (await db.execute(text("SELECT pg_try_advisory_xact_lock(:id)"), {"id": _COMPACT_LOCK_ID})).scalar():
+        return 0  # another process is on it
+    batch = (
+        select(XpEvent.id).where(XpEvent.compacted.is_(False))
+        .limit(limit).with_for_update(skip_locked=True)
+    )
+    folded = (
+        update(XpEvent).where(XpEvent.id.in_(batch.scalar_subquery())).values(compacted=True)
+        .returning(XpEvent.user_id, XpEvent.delta).cte("folded")
+    )
+    totals = (
+        select(folded.c.user_id, func.sum(folded.c.delta).label("total"), func.count().label("events"))
+        .group_by(folded.c.user_id).cte("totals")
+    )
+    # data-modifying CTEs: the flagging and the folding commit (and are seen) together
+    counts = (
+        update(User).where(User.id == totals.c.user_id)
+        .values(xp=func.coalesce(User.xp, 100) + totals.c.total)
+        .returning(totals.c.events)
+    )
+    events = sum(n for (n,) in (await db.execute(counts, execution_options={"synchronize_session": False})).all())
+    await db.commit()
+    xp_compacted_total.inc(events)
+    return events
+
+
+async def compact_loop():
+    """Background task (lifespan): fold the ledger tail into user.xp every XP_COMPACT_SECONDS."""
+    while True:
+        try:
+            async with AsyncSessionLocal() as db:
+                while await compact(db) >= XP_COMPACT_BATCH:
+                    pass
+        except Exception as e:
+            print(f"XP compaction failed: {e}")
+        await asyncio.sleep(XP_COMPACT_SECONDS)
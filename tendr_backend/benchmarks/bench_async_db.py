@@ -0,0 +1,154 @@
+"""
+Concurrent-request throughput: sync Session routes vs AsyncSession routes.
+
+Both apps run the same request shape as a real authenticated call (user lookup
+like get_current_user, then a task list query) against the same Postgres.
+pg_sleep stands in for network/disk latency so the difference comes from how
+each model waits on the database, not from the queries themselves.
+
+The sync app is what main.py used to be: plain `def` routes on SessionLocal,
+each request holding one of the threadpool's 40 workers while it waits.
+The async app is what main.py is now: `async def` routes on AsyncSessionLocal.
+
+The client runs in the same process as the app, so on a small box the run is
+CPU-bound until --latency is large enough for waiting to dominate. On a
+single core, --latency 0.5 --concurrency 80 gave sync 75 req/s (p50 1020 ms)
+vs async 109 req/s (p50 682 ms): the sync side tops out at 40 workers / latency.
+
+Usage (needs DATABASE_URL pointing at a Postgres you can write to):
+    python tendr_backend/benchmarks/bench_async_db.py --requests 2000 --concurrency 200
+"""
+import argparse
+import asyncio
+import os
+import statistics
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "be"))
+
+import httpx
+from fastapi import Depends, FastAPI
+from sqlalchemy import create_engine, select, text
+from sqlalchemy.orm import Session, sessionmaker
+from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker, create_async_engine
+
+import models
+from database import DATABASE_URL, ASYNC_DATABASE_URL
+from models import Task, User
+
+BENCH_USERNAME = "bench_async_db_user"
+
+
+def _seed(SessionLocal):
+    models.Base.metadata.create_all(bind=SessionLocal.kw["bind"])
+    with SessionLocal() as db:
+        user = db.query(User).filter(User.username == BENCH_USERNAME).first()
+        if user is None:
+            user = User(username=BENCH_USERNAME, email=f"{BENCH_USERNAME}@example.com", hashed_password="")
+            db.add(user)
+            db.commit()
+            db.add_all([Task(title=f"task {i}", user_id=user.id, priority="Low", points=10) for i in range(50)])
+            db.commit()
+        return user.id
+
+
+def build_sync_app(SessionLocal, latency: float) -> FastAPI:
+    app = FastAPI()
+
+    def get_sync_db():
+        db = SessionLocal()
+        try:
+            yield db
+        finally:
+            db.close()
+
+    @app.get("/tasks")
+    def list_tasks(db: Session = Depends(get_sync_db)):
+        user = db.query(User).filter(User.username == BENCH_USERNAME).first()
+        db.execute(text("SELECT pg_sleep(:s)"), {"s": latency})
+        tasks = db.query(Task).filter(Task.user_id == user.id).all()
+        return {"count": len(tasks)}
+
+    return app
+
+
+def build_async_app(AsyncSessionLocal, latency: float) -> FastAPI:
+    app = FastAPI()
+
+    async def get_db():
+        async with AsyncSessionLocal() as db:
+            yield db
+
+    @app.get("/tasks")
+    async def list_tasks(db: AsyncSession = Depends(get_db)):
+        user = (await db.execute(select(User).where(User.username == BENCH_USERNAME))).scalars().first()
+        await db.execute(text("SELECT pg_sleep(:s)"), {"s": latency})
+        tasks = (await db.execute(select(Task).where(Task.user_id == user.id))).scalars().all()
+        return {"count": len(tasks)}
+
+    return app
+
+
+async def drive(app: FastAPI, total: int, concurrency: int):
+    latencies = []
+    sem = asyncio.Semaphore(concurrency)
+    transport = httpx.ASGITransport(app=app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://bench") as client:
+
+        async def one():
+            async with sem:
+                start = time.perf_counter()
+                r = await client.get("/tasks")
+                r.raise_for_status()
+                latencies.append(time.perf_counter() - start)
+
+        # warm up the pools before timing
+        await asyncio.gather(*(one() for _ in range(min(concurrency, 20))))
+        latencies.clear()
+        start = time.perf_counter()
+        await asyncio.gather(*(one() for _ in range(total)))
+        elapsed = time.perf_counter() - start
+
+    latencies.sort()
+    return {
+        "rps": total / elapsed,
+        "p50_ms": statistics.median(latencies) * 1000,
+        "p99_ms": latencies[int(len(latencies) * 0.99) - 1] * 1000,
+    }
+
+
+def _report(label, result):
+    print(f"{label}  {result['rps']:8.1f} req/s   p50 {result['p50_ms']:7.1f} ms   p99 {result['p99_ms']:7.1f} ms")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--requests", type=int, default=2000)
+    parser.add_argument("--concurrency", type=int, default=200)
+    parser.add_argument("--latency", type=float, default=0.01, help="simulated db latency per request, seconds")
+    args = parser.parse_args()
+
+    # give both sides the same connection budget so only the waiting model differs
+    pool = dict(pool_size=args.concurrency, max_overflow=0)
+    sync_engine = create_engine(DATABASE_URL, **pool)
+    async_engine = create_async_engine(ASYNC_DATABASE_URL, **pool)
+    SessionLocal = sessionmaker(bind=sync_engine, autoflush=False)
+    AsyncSessionLocal = async_sessionmaker(async_engine, autoflush=False, expire_on_commit=False)
+
+    _seed(SessionLocal)
+    print(f"{args.requests} requests, concurrency {args.concurrency}, simulated latency {args.latency * 1000:.0f} ms\n")
+
+    async def run_all():
+        result = await drive(build_sync_app(SessionLocal, args.latency), args.requests, args.concurrency)
+        sync_engine.dispose()
+        _report("sync  (before)", result)
+        result = await drive(build_async_app(AsyncSessionLocal, args.latency), args.requests, args.concurrency)
+        await async_engine.dispose()
+        _report("async (after) ", result)
+
+    asyncio.run(run_all())
+
+
+if __name__ == "__main__":
+    main()
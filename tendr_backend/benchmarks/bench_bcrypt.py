@@ -0,0 +1,58 @@
+"""
+bcrypt throughput per core, for planning login capacity.
+
+For each cost in --rounds it runs one hashing process per core for --seconds
+and reports hashes/sec in total and per core, plus the latency of a single
+verify. Logins, signups and password resets each cost one bcrypt call (a login
+that upgrades an old hash costs two), so hashes/sec/core x cores is the ceiling
+on logins per second for a box with PASSWORD_HASH_WORKERS = cores.
+
+It also prints what configure_bcrypt() would pick here for BCRYPT_TARGET_MS.
+
+    python tendr_backend/benchmarks/bench_bcrypt.py --rounds 10 11 12 13 --seconds 5
+"""
+import argparse
+import os
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "be"))
+
+# auth imports metrics only, no database settings needed
+import auth
+
+
+def _hash_for(rounds: int, seconds: float) -> int:
+    done, deadline = 0, time.perf_counter() + seconds
+    while time.perf_counter() < deadline:
+        auth.pwd_context.hash("bench-password", rounds=rounds)
+        done += 1
+    return done
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--rounds", type=int, nargs="+", default=[10, 11, 12, 13])
+    parser.add_argument("--seconds", type=float, default=5.0, help="measurement window per cost")
+    parser.add_argument("--cores", type=int, default=os.cpu_count() or 1)
+    parser.add_argument("--target-ms", type=float, default=auth.BCRYPT_TARGET_MS)
+    args = parser.parse_args()
+
+    print(f"{args.cores} cores, {args.seconds:.0f}s per cost\n")
+    print(f"{'rounds':>6} {'verify ms':>10} {'hashes/s':>10} {'per core':>10}")
+    with ProcessPoolExecutor(max_workers=args.cores) as pool:
+        for rounds in args.rounds:
+            single_ms = auth.time_bcrypt(rounds) * 1000
+            start = time.perf_counter()
+            total = sum(pool.map(_hash_for, [rounds] * args.cores, [args.seconds] * args.cores))
+            rate = total / (time.perf_counter() - start)
+            print(f"{rounds:>6} {single_ms:>10.1f} {rate:>10.1f} {rate / args.cores:>10.2f}")
+
+    chosen = auth.calibrate_bcrypt_rounds(target_ms=args.target_ms)
+    print(f"\nconfigure_bcrypt() would pick {chosen} rounds for a {args.target_ms:.0f}ms target "
+          f"(pin it with BCRYPT_ROUNDS={chosen})")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,169 @@
+"""
+Proves the query-shaped indexes in models.py are the ones Postgres picks.
+
+Seeds a synthetic dataset (10M tasks by default), runs every hot query under
+EXPLAIN (ANALYZE, BUFFERS), checks the plan uses the expected index, and
+reports execution time with the index and, for comparison, with it dropped
+inside a rolled-back transaction.
+
+Point DATABASE_URL at a throwaway database, the seed is large:
+    python tendr_backend/benchmarks/bench_indexes.py --tasks 10000000 --users 100000
+    python tendr_backend/benchmarks/bench_indexes.py --skip-seed      # re-run checks only
+Exits non-zero if any query stops using its index.
+"""
+import argparse
+import json
+import os
+import sys
+from datetime import date, datetime, timedelta
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "be"))
+
+from sqlalchemy import text
+
+import migrations
+from database import engine
+
+# md5(...)::uuid gives every synthetic row a stable id, so we can address user N
+# or pet N without looking it up (and it casts cleanly to both varchar and uuid columns)
+USER_ID = "md5('idxbench-user-' || {n})::uuid"
+PET_ID = "md5('idxbench-pet-' || {n})::uuid"
+CHUNK = 1_000_000
+
+
+def seed(conn, users: int, tasks: int, focus: int, days: int):
+    print(f"seeding {users} users, {tasks} tasks, {focus} focus sessions, {2 * users} pets ...")
+    conn.execute(text(f"""
+        INSERT INTO "user" (id, username, email, hashed_password, xp, start_acc_time, user_verified)
+        SELECT {USER_ID.format(n='g')}, 'idxbench_' || g, 'idxbench_' || g || '@example.com', '', 100,
+               now() - interval '2 years', true
+        FROM generate_series(0, :n - 1) g
+    """), {"n": users})
+    conn.commit()
+    for lo in range(0, tasks, CHUNK):
+        hi = min(tasks, lo + CHUNK) - 1
+        conn.execute(text(f"""
+            INSERT INTO tasks (id, title, completed, created_at, updated_at, priority, points, user_id)
+            SELECT gen_random_uuid(), 'task ' || g, random() < 0.6, ts, ts,
+                   (ARRAY['Low', 'Medium', 'High'])[1 + g % 3], 10, {USER_ID.format(n='g % :users')}
+            FROM generate_series(:lo, :hi) g,
+                 LATERAL (SELECT now() - random() * interval '730 days' AS ts) t
+        """), {"lo": lo, "hi": hi, "users": users})
+        conn.commit()
+        print(f"  tasks {hi + 1}/{tasks}")
+    for lo in range(0, focus, CHUNK):
+        hi = min(focus, lo + CHUNK) - 1
+        conn.execute(text(f"""
+            INSERT INTO focus_sessions (id, user_id, duration_seconds, created_at)
+            SELECT gen_random_uuid(), {USER_ID.format(n='g % :users')}, 300 + g % 3000,
+                   now() - random() * interval '730 days'
+            FROM generate_series(:lo, :hi) g
+        """), {"lo": lo, "hi": hi, "users": users})
+        conn.commit()
+    # two pets per user, the second one dead
+    conn.execute(text(f"""
+        INSERT INTO pets (id, name, type, hunger, age, bond, is_alive, last_fed, last_focused_at, user_id)
+        SELECT {PET_ID.format(n='g')}, 'pet ' || g, 'cat', 100, 0, 0, g % 2 = 0, now(), now(),
+               {USER_ID.format(n='g / 2')}
+        FROM generate_series(0, 2 * :users - 1) g
+    """), {"users": users})
+    conn.execute(text(f"""
+        INSERT INTO pet_qualifying_days (id, pet_id, user_id, date, created_at)
+        SELECT gen_random_uuid(), {PET_ID.format(n='p')}, {USER_ID.format(n='p / 2')}, current_date - d, now()
+        FROM generate_series(0, 2 * :users - 1, 2) p, generate_series(0, :days - 1) d
+    """), {"users": users, "days": days})
+    conn.commit()
+    conn.execute(text("ANALYZE"))
+    conn.commit()
+
+
+def checks(user_n: int):
+    """(label, expected index, sql, params) for every hot access path."""
+    today = datetime.combine(date.today(), datetime.min.time())
+    user = text(f"SELECT {USER_ID.format(n=user_n)}")
+    pet = text(f"SELECT {PET_ID.format(n=user_n * 2)}")
+    return user, pet, [
+        ("stats count (user, completed, created_at)", "ix_tasks_user_id_completed_created_at",
+         "SELECT count(*) FROM tasks WHERE user_id = :u AND completed = true AND created_at >= :since",
+         {"since": today - timedelta(days=365)}),
+        ("streak scan (user, completed, created_at)", "ix_tasks_user_id_completed_created_at",
+         "SELECT created_at FROM tasks WHERE user_id = :u AND completed = true AND created_at >= :since",
+         {"since": today - timedelta(days=730)}),
+        ("task list (user)", "ix_tasks_user_id_completed_created_at",
+         "SELECT * FROM tasks WHERE user_id = :u", {}),
+        ("/focus/today (user, created_at)", "ix_focus_sessions_user_id_created_at",
+         "SELECT sum(duration_seconds) FROM focus_sessions WHERE user_id = :u AND created_at >= :since",
+         {"since": today}),
+        ("/focus/total (user)", "ix_focus_sessions_user_id_created_at",
+         "SELECT sum(duration_seconds) FROM focus_sessions WHERE user_id = :u", {}),
+        ("add_bond_from_focus (user, alive)", "ix_pets_user_id_alive",
+         "SELECT * FROM pets WHERE user_id = :u AND is_alive = true LIMIT 1", {}),
+        ("_check_qualifying_day (pet, date)", "pet_qualifying_days_pet_id_date_key",
+         "SELECT * FROM pet_qualifying_days WHERE pet_id = :p AND date = :d LIMIT 1",
+         {"d": date.today()}),
+    ]
+
+
+def _index_names(plan):
+    found = set()
+    if "Index Name" in plan:
+        found.add(plan["Index Name"])
+    for child in plan.get("Plans", []):
+        found |= _index_names(child)
+    return found
+
+
+def explain(conn, sql, params, runs):
+    times, plan = [], None
+    for _ in range(runs):
+        out = conn.execute(text(f"EXPLAIN (ANALYZE, BUFFERS, FORMAT JSON) {sql}"), params).scalar()
+        out = out if isinstance(out, list) else json.loads(out)
+        plan = out[0]["Plan"]
+        times.append(out[0]["Execution Time"])
+    times.sort()
+    return plan, times[len(times) // 2]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--tasks", type=int, default=10_000_000)
+    parser.add_argument("--users", type=int, default=100_000)
+    parser.add_argument("--focus", type=int, default=None, help="focus sessions (default tasks / 5)")
+    parser.add_argument("--days", type=int, default=30, help="qualifying days per living pet")
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--skip-seed", action="store_true")
+    parser.add_argument("--no-compare", action="store_true", help="skip the dropped-index comparison")
+    args = parser.parse_args()
+
+    migrations.run_migrations(engine)
+    failures = 0
+    with engine.connect() as conn:
+        if not args.skip_seed:
+            seed(conn, args.users, args.tasks, args.focus if args.focus is not None else args.tasks // 5, args.days)
+
+        user_sql, pet_sql, cases = checks(args.users // 2)
+        u, p = conn.execute(user_sql).scalar(), conn.execute(pet_sql).scalar()
+        print(f"\n{'query':45} {'index used':8} {'with idx':>10} {'without':>10}")
+        for label, index, sql, params in cases:
+            params = {**params, "u": str(u), "p": str(p)}
+            plan, with_ms = explain(conn, sql, params, args.runs)
+            used = index in _index_names(plan)
+            failures += not used
+            without = ""
+            if not args.no_compare:
+                # DROP INDEX is transactional: measure the fallback plan, then roll it back
+                conn.execute(text(f'DROP INDEX "{index}"') if not index.endswith("_key")
+                             else text(f'ALTER TABLE pet_qualifying_days DROP CONSTRAINT "{index}"'))
+                _, without_ms = explain(conn, sql, params, args.runs)
+                conn.rollback()
+                without = f"{without_ms:8.2f}ms"
+            print(f"{label:45} {'yes' if used else 'NO':8} {with_ms:8.2f}ms {without:>10}")
+            if not used:
+                print(json.dumps(plan, indent=2))
+            conn.rollback()
+
+    sys.exit(1 if failures else 0)
+
+
+if __name__ == "__main__":
+    main()
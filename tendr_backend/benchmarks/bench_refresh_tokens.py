@@ -0,0 +1,105 @@
+"""
+bcrypt CPU saved by refresh tokens.
+
+Measures CPU time (all threads of this process, so the bcrypt pool is included)
+and wall time per request for POST /login and POST /token/refresh against the
+real app and DATABASE_URL. It then projects a day of use: with 20-minute access
+tokens, a user active for --active-hours used to log in once per expiry. Now
+they log in once and refresh for the rest of the day.
+
+    python tendr_backend/benchmarks/bench_refresh_tokens.py --requests 30 --active-hours 8 --users 10000
+"""
+import argparse
+import asyncio
+import math
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "be"))
+
+import httpx
+from sqlalchemy import delete, select
+
+import auth
+import main
+import migrations
+from database import engine, SessionLocal
+from models import User
+
+USERNAME = "bench_refresh_user"
+PASSWORD = "bench-password"
+
+
+def _seed():
+    migrations.run_migrations(engine)
+    auth.configure_bcrypt()
+    with SessionLocal() as db:
+        db.execute(delete(User).where(User.username == USERNAME))
+        db.add(User(username=USERNAME, email=f"{USERNAME}@example.com", user_verified=True,
+                    hashed_password=auth.pwd_context.hash(PASSWORD)))
+        db.commit()
+
+
+def _cleanup():
+    with SessionLocal() as db:
+        db.execute(delete(User).where(User.username == USERNAME))
+        db.commit()
+
+
+async def _measure(client, n, call):
+    await call()  # warm up
+    cpu, wall = time.process_time(), time.perf_counter()
+    for _ in range(n):
+        await call()
+    return (time.process_time() - cpu) / n * 1000, (time.perf_counter() - wall) / n * 1000
+
+
+async def run(n):
+    transport = httpx.ASGITransport(app=main.app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://bench") as client:
+        state = {}
+
+        async def login():
+            r = await client.post("/login", data={"username": USERNAME, "password": PASSWORD})
+            r.raise_for_status()
+            state["refresh"] = r.json()["refresh_token"]
+
+        async def refresh():
+            r = await client.post("/token/refresh", json={"refresh_token": state["refresh"]})
+            r.raise_for_status()
+            state["refresh"] = r.json()["refresh_token"]
+
+        login_cost = await _measure(client, n, login)
+        refresh_cost = await _measure(client, n, refresh)
+    return login_cost, refresh_cost
+
+
+def main_():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--requests", type=int, default=30)
+    parser.add_argument("--active-hours", type=float, default=8, help="hours a typical user keeps the app open per day")
+    parser.add_argument("--access-minutes", type=float, default=20, help="access token lifetime")
+    parser.add_argument("--users", type=int, default=10_000, help="daily active users to project for")
+    args = parser.parse_args()
+
+    _seed()
+    try:
+        (login_cpu, login_wall), (refresh_cpu, refresh_wall) = asyncio.run(run(args.requests))
+    finally:
+        _cleanup()
+
+    print(f"bcrypt rounds {auth.bcrypt_rounds}, {args.requests} requests each\n")
+    print(f"{'':16} {'cpu ms':>8} {'wall ms':>8}")
+    print(f"{'/login':16} {login_cpu:8.1f} {login_wall:8.1f}")
+    print(f"{'/token/refresh':16} {refresh_cpu:8.1f} {refresh_wall:8.1f}")
+
+    renewals = max(0, math.ceil(args.active_hours * 60 / args.access_minutes) - 1)
+    saved_ms = renewals * (login_cpu - refresh_cpu)
+    print(f"\n{args.active_hours:g}h active with {args.access_minutes:g}-minute access tokens = {renewals} renewals per user-day")
+    print(f"CPU saved per user-day: {saved_ms / 1000:.2f}s")
+    print(f"CPU saved for {args.users} users/day: {saved_ms * args.users / 3_600_000:.2f} core-hours")
+
+
+if __name__ == "__main__":
+    main_()
@@ -0,0 +1,159 @@
+"""
+GET /analysis/{id} stats payload: the old per-task Python pass vs one gaps-and-islands query.
+
+tasks:   what stats.py did before the daily rollup: SELECT every completed task (ORM),
+         a set of their dates sorted in Python for the streak, a separate COUNT and a
+         separate XP read (3 statements, O(n log n) in Python)
+rollup:  the same three reads over user_daily_activity (activity.py), one row per
+         active day instead of one per task, streak still walked in Python
+after:   stats.stats_query: current and longest streak from the rollup (window
+         function + group by island), the count from the user row's counter
+         (counters.py) and XP, in one statement
+
+Seeds --tasks tasks for one user over --days days (with a few gaps so there is more
+than one streak), rebuilds its rollup, checks the three agree and prints wall time
+per call, as seen by the app (so including the round trips).
+
+On a single core with 100k tasks (75k completed) over 730 days: tasks 2023.4 ms,
+rollup 4.3 ms, after 3.6 ms per call. Most of the win is the rollup itself; the single
+statement saves the two extra round trips and the Python walk on top of it.
+
+Usage (needs DATABASE_URL pointing at a Postgres you can write to):
+    python tendr_backend/benchmarks/bench_stats.py --tasks 100000 --repeat 20
+"""
+import argparse
+import asyncio
+import os
+import sys
+import time
+from datetime import datetime, timedelta
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "be"))
+
+from sqlalchemy import delete, func, insert, select, update
+
+import activity
+import stats
+import xp_service
+from database import AsyncSessionLocal, async_engine
+from models import Task, User, UserDailyActivity
+
+BENCH_USERNAME = "bench_stats_user"
+
+
+def _active(k: int) -> bool:
+    # k days ago; a month off a year back and a missed day every few weeks
+    return not (300 <= k < 330 or k % 23 == 11)
+
+
+async def _seed(tasks: int, days: int):
+    today = datetime.utcnow().replace(hour=12, minute=0, second=0, microsecond=0)
+    start = today - timedelta(days=days)
+    async with AsyncSessionLocal() as db:
+        user = (await db.execute(select(User).where(User.username == BENCH_USERNAME))).scalars().first()
+        if user is None:
+            user = User(username=BENCH_USERNAME, email=f"{BENCH_USERNAME}@example.com", hashed_password="",
+                        user_verification_token="")
+            db.add(user)
+            await db.commit()
+        await db.execute(delete(Task).where(Task.user_id == user.id))
+        await db.execute(update(User).where(User.id == user.id).values(start_acc_time=start.replace(hour=0)))
+        active = [k for k in range(days) if _active(k)]
+        rows = [
+            {"title": f"task {i}", "user_id": user.id, "priority": "Low", "points": 10,
+             "completed": i % 4 != 3, "created_at": today - timedelta(days=active[i % len(active)])}
+            for i in range(tasks)
+        ]
+        for i in range(0, len(rows), 10000):
+            await db.execute(insert(Task), rows[i:i + 10000])
+        await db.commit()
+        user_id = user.id
+    async with async_engine.begin() as conn:
+        await conn.run_sync(lambda sync_conn: activity.rebuild(sync_conn, [user_id]))
+    return user_id, start.replace(hour=0)
+
+
+def _walk(sorted_dates):
+    # the old streak loop, newest first
+    if not sorted_dates or sorted_dates[0] < datetime.utcnow().date() - timedelta(days=1):
+        return 0
+    streaks, current = 1, sorted_dates[0]
+    for d in sorted_dates[1:]:
+        if current - d != timedelta(days=1):
+            break
+        streaks, current = streaks + 1, d
+    return streaks
+
+
+async def tasks_path(db, user_id, start):
+    tasks = (await db.execute(
+        select(Task).where(Task.user_id == user_id, Task.completed == True, Task.created_at >= start)
+    )).scalars().all()
+    streak = _walk(sorted({t.created_at.date() for t in tasks}, reverse=True))
+    count = (await db.execute(
+        select(func.count()).select_from(Task)
+        .where(Task.user_id == user_id, Task.completed == True, Task.created_at >= start)
+    )).scalar()
+    return count, streak, await xp_service.current(db, user_id)
+
+
+async def rollup_path(db, user_id, start):
+    count = await activity.total(db, user_id, "tasks_completed", start.date())
+    sorted_dates = (await db.execute(
+        select(UserDailyActivity.day)
+        .where(UserDailyActivity.user_id == user_id, UserDailyActivity.tasks_completed > 0,
+               UserDailyActivity.day >= start.date())
+        .order_by(UserDailyActivity.day.desc())
+    )).scalars().all()
+    return count, _walk(sorted_dates), await xp_service.current(db, user_id)
+
+
+async def after_path(db, user_id, start):
+    count, _, streak, longest, xp = (await db.execute(
+        stats.stats_query(user_id, start.date(), datetime.utcnow().date())
+    )).one()
+    return count, streak, xp, longest
+
+
+async def _measure(fn, user_id, start, repeat: int):
+    async with AsyncSessionLocal() as db:
+        result = await fn(db, user_id, start)  # warm up the pool and statement caches
+        began = time.perf_counter()
+        for _ in range(repeat):
+            await fn(db, user_id, start)
+            await db.rollback()
+        return (time.perf_counter() - began) / repeat * 1000, result
+
+
+async def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--tasks", type=int, default=100000)
+    parser.add_argument("--days", type=int, default=730)
+    parser.add_argument("--repeat", type=int, default=20)
+    args = parser.parse_args()
+
+    user_id, start = await _seed(args.tasks, args.days)
+    print(f"{args.tasks} tasks over {args.days} days, {args.repeat} runs each\n")
+    print(f"{'path':>7} {'ms/call':>9}  (completed, current streak, xp[, longest])")
+    results = {}
+    for name, fn in (("tasks", tasks_path), ("rollup", rollup_path), ("after", after_path)):
+        ms, results[name] = await _measure(fn, user_id, start, args.repeat)
+        print(f"{name:>7} {ms:>9.1f}  {results[name]}")
+
+    # the longest streak in Python, from the same dates the old path saw
+    active = sorted({args.days - k for k in range(args.days) if _active(k)})
+    longest = run = 0
+    for prev, d in zip([None] + active, active):
+        run = run + 1 if prev is not None and d - prev == 1 else 1
+        longest = max(longest, run)
+    same = results["tasks"] == results["rollup"] == results["after"][:3] and results["after"][3] == longest
+    print(f"\nsame stats: {same} (longest streak {longest})")
+    async with AsyncSessionLocal() as db:
+        await db.execute(delete(Task).where(Task.user_id == user_id))
+        await db.execute(delete(UserDailyActivity).where(UserDailyActivity.user_id == user_id))
+        await db.commit()
+    await async_engine.dispose()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,112 @@
+"""
+Index size and join speed: String (varchar) ids vs native uuid ids.
+
+Builds the same users/tasks pair twice, once keyed the old way (varchar holding
+str(uuid4())) and once with uuid columns, with identical data, primary keys and
+the tasks(user_id) foreign key index. Then reports on-disk size of every index
+and the median execution time of the join shapes the app uses.
+
+Runs in two scratch schemas that are dropped afterwards:
+    python tendr_backend/benchmarks/bench_uuid_keys.py --users 100000 --tasks 2000000
+"""
+import argparse
+import json
+import os
+import sys
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "be"))
+
+from sqlalchemy import text
+
+from database import engine
+
+KINDS = {"bench_varchar_keys": "varchar", "bench_uuid_keys": "uuid"}
+
+JOINS = [
+    ("full join count (hash join)",
+     "SELECT count(*) FROM {s}.tasks t JOIN {s}.users u ON u.id = t.user_id"),
+    ("one user's tasks by username (nested loop)",
+     "SELECT t.* FROM {s}.users u JOIN {s}.tasks t ON t.user_id = u.id WHERE u.username = 'user_42'"),
+    ("primary key lookups x1000",
+     "SELECT count(*) FROM {s}.tasks t WHERE t.id IN (SELECT md5('task' || g)::uuid::{k} FROM generate_series(0, 999) g)"),
+]
+
+
+def build(conn, schema: str, kind: str, users: int, tasks: int):
+    conn.execute(text(f"DROP SCHEMA IF EXISTS {schema} CASCADE"))
+    conn.execute(text(f"CREATE SCHEMA {schema}"))
+    conn.execute(text(f"CREATE TABLE {schema}.users (id {kind} PRIMARY KEY, username varchar UNIQUE)"))
+    conn.execute(text(f"""
+        CREATE TABLE {schema}.tasks (
+            id {kind} PRIMARY KEY, user_id {kind} REFERENCES {schema}.users (id),
+            completed boolean, created_at timestamp
+        )
+    """))
+    # same uuids on both sides: md5(...)::uuid is deterministic
+    conn.execute(text(f"""
+        INSERT INTO {schema}.users
+        SELECT md5('user' || g)::uuid, 'user_' || g FROM generate_series(0, :n - 1) g
+    """), {"n": users})
+    conn.execute(text(f"""
+        INSERT INTO {schema}.tasks
+        SELECT md5('task' || g)::uuid, md5('user' || (g % :users))::uuid, g % 3 = 0,
+               now() - (g % 730) * interval '1 day'
+        FROM generate_series(0, :n - 1) g
+    """), {"n": tasks, "users": users})
+    conn.execute(text(f"CREATE INDEX ON {schema}.tasks (user_id, completed, created_at)"))
+    conn.execute(text(f"VACUUM ANALYZE {schema}.users"))
+    conn.execute(text(f"VACUUM ANALYZE {schema}.tasks"))
+
+
+def index_sizes(conn, schema: str):
+    return dict(conn.execute(text("""
+        SELECT c.relname, pg_relation_size(c.oid)
+        FROM pg_class c JOIN pg_namespace n ON n.oid = c.relnamespace
+        WHERE n.nspname = :s AND c.relkind = 'i' ORDER BY c.relname
+    """), {"s": schema}).all())
+
+
+def median_ms(conn, sql: str, runs: int) -> float:
+    times = []
+    for _ in range(runs):
+        out = conn.execute(text(f"EXPLAIN (ANALYZE, FORMAT JSON) {sql}")).scalar()
+        out = out if isinstance(out, list) else json.loads(out)
+        times.append(out[0]["Execution Time"])
+    times.sort()
+    return times[len(times) // 2]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--users", type=int, default=100_000)
+    parser.add_argument("--tasks", type=int, default=2_000_000)
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--keep", action="store_true", help="don't drop the scratch schemas")
+    args = parser.parse_args()
+
+    with engine.connect() as conn:
+        conn.execution_options(isolation_level="AUTOCOMMIT")
+        sizes, timings = {}, {}
+        for schema, kind in KINDS.items():
+            print(f"building {schema} ({args.users} users, {args.tasks} tasks) ...")
+            build(conn, schema, kind, args.users, args.tasks)
+            sizes[kind] = index_sizes(conn, schema)
+            timings[kind] = [median_ms(conn, sql.format(s=schema, k=kind), args.runs) for _, sql in JOINS]
+
+        print(f"\n{'index':42} {'varchar':>10} {'uuid':>10} {'delta':>8}")
+        for (name, old), new in zip(sizes["varchar"].items(), sizes["uuid"].values()):
+            print(f"{name:42} {old / 2**20:8.1f}MB {new / 2**20:8.1f}MB {100 * (new - old) / old:+7.1f}%")
+        old, new = sum(sizes["varchar"].values()), sum(sizes["uuid"].values())
+        print(f"{'all indexes':42} {old / 2**20:8.1f}MB {new / 2**20:8.1f}MB {100 * (new - old) / old:+7.1f}%")
+
+        print(f"\n{'join':42} {'varchar':>10} {'uuid':>10} {'delta':>8}")
+        for (label, _), old, new in zip(JOINS, timings["varchar"], timings["uuid"]):
+            print(f"{label:42} {old:8.2f}ms {new:8.2f}ms {100 * (new - old) / old:+7.1f}%")
+
+        if not args.keep:
+            for schema in KINDS:
+                conn.execute(text(f"DROP SCHEMA {schema} CASCADE"))
+
+
+if __name__ == "__main__":
+    main()
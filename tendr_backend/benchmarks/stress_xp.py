@@ -0,0 +1,206 @@
+"""
+Concurrency stress test for XP changes (xp_service): no lost or doubled updates.
+
+Against a real Postgres, with --concurrency requests in flight at once:
+
+1. completes --tasks tasks, each one twice at the same time (a double-click):
+   XP must go up by exactly one reward per task
+2. spends 35 XP --spends times from a balance that only covers a third of them:
+   exactly that third must succeed and the balance must end at its remainder
+3. feeds one pet from two requests at once, --feeds times: each pair must cost
+   exactly 35 XP
+
+XP is a ledger with a compacted balance (xp_service), so xp_service.compact runs
+in a loop alongside all three: folding events into user.xp mid-flight must not
+change any balance.
+
+--naive repeats step 1 with the old read-modify-write (SELECT user, xp += n in
+Python, commit) to show what the conditional UPDATEs fix; on one core with 200
+tasks at concurrency 50 it kept 170 of the 2000 XP.
+
+Usage (needs DATABASE_URL pointing at a Postgres you can write to):
+    python tendr_backend/benchmarks/stress_xp.py --tasks 200 --concurrency 50
+"""
+import argparse
+import asyncio
+import os
+import sys
+from datetime import datetime, timedelta
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "be"))
+# enough connections that the requests really overlap
+os.environ.setdefault("DB_POOL_SIZE", "20")
+os.environ.setdefault("DB_MAX_OVERFLOW", "40")
+
+from sqlalchemy import delete, select, update
+
+import pet_crud
+import task_crud
+import xp_service
+from auth_dependencies import TokenUser
+from database import AsyncSessionLocal, async_engine
+from models import Pet, Task, User, XpEvent
+
+STRESS_USERNAME = "stress_xp_user"
+
+
+async def _reset(xp: int, tasks: int) -> TokenUser:
+    async with AsyncSessionLocal() as db:
+        user = (await db.execute(select(User).where(User.username == STRESS_USERNAME))).scalars().first()
+        if user is None:
+            user = User(username=STRESS_USERNAME, email=f"{STRESS_USERNAME}@example.com", hashed_password="",
+                        user_verification_token="")
+            db.add(user)
+            await db.commit()
+        await db.execute(delete(Task).where(Task.user_id == user.id))
+        await db.execute(delete(Pet).where(Pet.user_id == user.id))
+        await _set_balance(db, user.id, xp)
+        db.add_all([Task(title=f"stress {i}", user_id=user.id, priority="Low", points=10) for i in range(tasks)])
+        await db.commit()
+        return TokenUser(id=user.id, username=user.username)
+
+
+async def _set_balance(db, user_id, xp: int):
+    await db.execute(delete(XpEvent).where(XpEvent.user_id == user_id))
+    await db.execute(update(User).where(User.id == user_id).values(xp=xp))
+
+
+async def _xp(current_user) -> int:
+    async with AsyncSessionLocal() as db:
+        return await xp_service.current(db, current_user.id)
+
+
+async def _compacting(stop: asyncio.Event):
+    while not stop.is_set():
+        async with AsyncSessionLocal() as db:
+            await xp_service.compact(db)
+        await asyncio.sleep(0.01)
+
+
+def _start_compactor():
+    stop = asyncio.Event()
+    return stop, asyncio.create_task(_compacting(stop))
+
+
+async def _stop_compactor(compactor):
+    stop, task = compactor
+    stop.set()
+    await task
+
+
+async def _task_ids(current_user):
+    async with AsyncSessionLocal() as db:
+        return (await db.execute(select(Task.id).where(Task.user_id == current_user.id))).scalars().all()
+
+
+def _limited(concurrency: int):
+    gate = asyncio.Semaphore(concurrency)
+
+    async def run(fn, *args):
+        async with gate:
+            async with AsyncSessionLocal() as db:
+                return await fn(db, *args)
+    return run
+
+
+async def _complete_naive(db, task_id, current_user):
+    # what update_task_completion used to do
+    task = (await db.execute(select(Task).where(Task.id == task_id))).scalars().first()
+    user = (await db.execute(select(User).where(User.id == current_user.id))).scalars().first()
+    if not task.completed:
+        user.xp = (user.xp or 0) + task_crud.compute_effective_points(task)
+    task.completed = True
+    await db.commit()
+
+
+async def completions(current_user, concurrency: int, naive: bool):
+    run = _limited(concurrency)
+    ids = await _task_ids(current_user)
+    before = await _xp(current_user)
+    if naive:
+        calls = [run(_complete_naive, task_id, current_user) for task_id in ids for _ in range(2)]
+    else:
+        calls = [run(task_crud.update_task_completion, task_id, True, current_user) for task_id in ids for _ in range(2)]
+    await asyncio.gather(*calls)
+    return await _xp(current_user) - before, 10 * len(ids)
+
+
+async def spends(current_user, concurrency: int, count: int):
+    run = _limited(concurrency)
+    affordable = count // 3
+    async with AsyncSessionLocal() as db:
+        await _set_balance(db, current_user.id, 35 * affordable + 7)
+        await db.commit()
+
+    async def spend(db):
+        new_xp = await xp_service.spend(db, current_user.id, 35, "stress")
+        await db.commit()
+        return new_xp is not None
+
+    succeeded = sum(await asyncio.gather(*(run(spend) for _ in range(count))))
+    return succeeded, affordable, await _xp(current_user)
+
+
+async def feeds(current_user, concurrency: int, pairs: int):
+    run = _limited(concurrency)
+    async with AsyncSessionLocal() as db:
+        await _set_balance(db, current_user.id, 35 * pairs)
+        pets = [Pet(name=f"stress {i}", type="cat", user_id=current_user.id, hunger=50, is_alive=True,
+                    last_fed=datetime.utcnow() - timedelta(days=1)) for i in range(pairs)]
+        db.add_all(pets)
+        await db.commit()
+        pet_ids = [pet.id for pet in pets]
+    results = await asyncio.gather(
+        *(run(pet_crud.feed_pet, pet_id, current_user) for pet_id in pet_ids for _ in range(2)),
+        return_exceptions=True,
+    )
+    # a double charge would run out of XP before the last pets: those feeds raise 400
+    refused = sum(isinstance(r, Exception) for r in results)
+    return await _xp(current_user), refused
+
+
+async def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--tasks", type=int, default=200)
+    parser.add_argument("--spends", type=int, default=300)
+    parser.add_argument("--feeds", type=int, default=50)
+    parser.add_argument("--concurrency", type=int, default=50)
+    parser.add_argument("--naive", action="store_true", help="also run the old read-modify-write for comparison")
+    args = parser.parse_args()
+    failures = 0
+
+    current_user = await _reset(0, args.tasks)
+    compactor = _start_compactor()
+    gained, expected = await completions(current_user, args.concurrency, naive=False)
+    ok = gained == expected
+    failures += not ok
+    print(f"completions x2: +{gained} XP, expected +{expected}  {'OK' if ok else 'LOST/DOUBLED UPDATES'}")
+
+    if args.naive:
+        # the old code wrote user.xp directly; no ledger involved
+        await _stop_compactor(compactor)
+        current_user = await _reset(0, args.tasks)
+        gained, expected = await completions(current_user, args.concurrency, naive=True)
+        print(f"  old read-modify-write: +{gained} XP, expected +{expected} ({expected - gained} lost)")
+        compactor = _start_compactor()
+
+    succeeded, affordable, left = await spends(current_user, args.concurrency, args.spends)
+    ok = succeeded == affordable and left == 7
+    failures += not ok
+    print(f"spends: {succeeded}/{args.spends} succeeded, {affordable} affordable, {left} XP left (expected 7)  "
+          f"{'OK' if ok else 'OVERSPENT/LOST'}")
+
+    left, refused = await feeds(current_user, args.concurrency, args.feeds)
+    ok = left == 0 and refused == 0
+    failures += not ok
+    print(f"feed pairs: {args.feeds} pets fed by two requests each, {left} XP left (expected 0), {refused} refused  "
+          f"{'OK' if ok else 'DOUBLE CHARGED'}")
+
+    await _stop_compactor(compactor)
+    await _reset(0, 0)
+    await async_engine.dispose()
+    sys.exit(1 if failures else 0)
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,5 @@
+import os
+import sys
+
+# the backend modules import each other flat (`import metrics`), as they do when run from be/
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "be"))
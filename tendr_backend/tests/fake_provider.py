@@ -0,0 +1,39 @@
+"""
+A local fake of the two email providers (the Apps Script bridge and Resend), served
+through httpx.MockTransport on email_verify's shared client: no network involved.
+"""
+import asyncio
+
+import httpx
+
+import email_verify
+
+BRIDGE_URL = "http://bridge.test/send"
+RESEND_URL = "http://resend.test/emails"
+
+
+class FakeProviders:
+    """status[name] is what that provider answers; "hang" never answers. calls[name] counts requests."""
+
+    def __init__(self, bridge=200, resend=200):
+        self.status = {"bridge": bridge, "resend": resend}
+        self.calls = {"bridge": 0, "resend": 0}
+        self.sent = []
+
+    async def handler(self, request: httpx.Request):
+        name = "bridge" if request.url.host == "bridge.test" else "resend"
+        self.calls[name] += 1
+        if self.status[name] == "hang":
+            await asyncio.Event().wait()
+        if self.status[name] in (200, 201):
+            self.sent.append((name, request.read()))
+        return httpx.Response(self.status[name], json={})
+
+    def install(self, monkeypatch):
+        monkeypatch.setenv("EMAIL_BRIDGE_URL", BRIDGE_URL)
+        monkeypatch.setenv("RESEND_API_KEY", "test-key")
+        monkeypatch.setenv("RESEND_API_URL", RESEND_URL)
+        monkeypatch.setattr(email_verify, "_client", httpx.AsyncClient(transport=httpx.MockTransport(self.handler)))
+        for name in email_verify.breakers:
+            monkeypatch.setitem(email_verify.breakers, name, email_verify.CircuitBreaker(name))
+        return self
@@ -0,0 +1,98 @@
+"""The outbox worker delivering to the fake providers. Needs DATABASE_URL pointing at a Postgres you can write to."""
+import asyncio
+import os
+import uuid
+
+import pytest
+
+if not os.getenv("DATABASE_URL"):
+    pytest.skip("DATABASE_URL is not set", allow_module_level=True)
+
+from sqlalchemy import delete, select
+
+import database
+import email_outbox
+import migrations
+from fake_provider import FakeProviders
+from models import EmailOutbox
+
+
+@pytest.fixture(scope="module", autouse=True)
+def schema():
+    migrations.run_migrations(database.engine)
+
+
+@pytest.fixture
+def providers(monkeypatch):
+    return FakeProviders().install(monkeypatch)
+
+
+@pytest.fixture
+def key():
+    # rows of this test only, whatever else is in the outbox
+    key = f"test:{uuid.uuid4().hex}"
+    yield key
+    with database.SessionLocal() as db:
+        db.execute(delete(EmailOutbox).where(EmailOutbox.to_email == f"{key}@example.com"))
+        db.commit()
+
+
+def run(coro):
+    async def with_engine():
+        try:
+            return await coro
+        finally:
+            # asyncpg connections belong to this event loop
+            await database.async_engine.dispose()
+    return asyncio.run(with_engine())
+
+
+async def enqueue(key, body, dedupe=True):
+    async with database.AsyncSessionLocal() as db:
+        await email_outbox.enqueue(db, f"{key}@example.com", "Your code", body, dedupe_key=key if dedupe else None)
+        await db.commit()
+
+
+def rows(key):
+    with database.SessionLocal() as db:
+        return db.execute(
+            select(EmailOutbox).where(EmailOutbox.to_email == f"{key}@example.com").order_by(EmailOutbox.created_at)
+        ).scalars().all()
+
+
+async def deliver_all():
+    while await email_outbox.deliver_due():
+        pass
+
+
+def test_delivered_and_marked_sent(providers, key):
+    run(enqueue(key, "111111"))
+    run(deliver_all())
+    [row] = rows(key)
+    assert (row.status, row.provider, row.attempts) == ("sent", "bridge", 1)
+    assert b"111111" in providers.sent[0][1]
+
+
+def test_resent_otp_supersedes_pending(providers, key):
+    run(enqueue(key, "111111"))
+    run(enqueue(key, "222222"))
+    run(deliver_all())
+    assert [(r.status, r.body) for r in rows(key)] == [("superseded", "111111"), ("sent", "222222")]
+    assert len(providers.sent) == 1 and b"222222" in providers.sent[0][1]
+
+
+def test_failover_to_second_provider(providers, key):
+    providers.status["bridge"] = 500
+    run(enqueue(key, "111111"))
+    run(deliver_all())
+    [row] = rows(key)
+    assert (row.status, row.provider) == ("sent", "resend")
+
+
+def test_failed_send_is_retried_later(providers, key):
+    providers.status.update(bridge=500, resend=500)
+    run(enqueue(key, "111111"))
+    run(deliver_all())
+    [row] = rows(key)
+    assert (row.status, row.attempts) == ("pending", 1)
+    assert row.last_error and row.next_attempt_at > row.created_at
@@ -0,0 +1,110 @@
+"""send_email against the fake providers: failure counting, the circuit breaker and failover."""
+import asyncio
+import time
+
+import pytest
+
+import email_verify
+from fake_provider import FakeProviders
+
+
+@pytest.fixture
+def providers(monkeypatch):
+    monkeypatch.setattr(email_verify, "EMAIL_BREAKER_FAILURES", 3)
+    monkeypatch.setattr(email_verify, "EMAIL_BREAKER_COOLDOWN_SECONDS", 60)
+    return FakeProviders().install(monkeypatch)
+
+
+def send():
+    return asyncio.run(email_verify.send_email("a@example.com", "Your code", "123456"))
+
+
+def cool_down(name):
+    # as if the cooldown had run out
+    email_verify.breakers[name].opened_at = time.monotonic() - email_verify.EMAIL_BREAKER_COOLDOWN_SECONDS - 1
+
+
+def test_bridge_first_when_healthy(providers):
+    assert send() == "bridge"
+    assert providers.calls == {"bridge": 1, "resend": 0}
+
+
+def test_failures_counted_and_failed_over(providers):
+    providers.status["bridge"] = 500
+    for i in range(1, 3):
+        assert send() == "resend"
+        assert email_verify.breakers["bridge"].failures == i
+        assert not email_verify.breakers["bridge"].is_open()
+    assert providers.calls == {"bridge": 2, "resend": 2}
+
+
+def test_breaker_opens_and_skips_provider(providers):
+    providers.status["bridge"] = 500
+    for _ in range(3):
+        send()
+    assert email_verify.breakers["bridge"].is_open()
+    # open: straight to the second provider, the bridge isn't called at all
+    assert send() == "resend"
+    assert providers.calls["bridge"] == 3
+
+
+def test_half_open_trial_closes_breaker(providers):
+    providers.status["bridge"] = 500
+    for _ in range(3):
+        send()
+    providers.status["bridge"] = 200
+    cool_down("bridge")
+    assert send() == "bridge"
+    breaker = email_verify.breakers["bridge"]
+    assert not breaker.is_open() and breaker.failures == 0 and not breaker.trial_running
+
+
+def test_half_open_trial_failure_reopens(providers):
+    providers.status["bridge"] = 500
+    for _ in range(3):
+        send()
+    cool_down("bridge")
+    assert send() == "resend"
+    assert providers.calls["bridge"] == 4
+    # a new cooldown started with the failed trial
+    assert send() == "resend"
+    assert providers.calls["bridge"] == 4
+
+
+def test_one_trial_at_a_time(providers):
+    providers.status["bridge"] = 500
+    for _ in range(3):
+        send()
+    cool_down("bridge")
+    breaker = email_verify.breakers["bridge"]
+    assert breaker.allow()
+    assert not breaker.allow()
+
+
+def test_cancelled_trial_releases_breaker(providers):
+    providers.status["bridge"] = 500
+    for _ in range(3):
+        send()
+    cool_down("bridge")
+    providers.status["bridge"] = "hang"
+
+    async def cancel_mid_trial():
+        task = asyncio.create_task(email_verify.send_email("a@example.com", "Your code", "123456"))
+        while providers.calls["bridge"] < 4:
+            await asyncio.sleep(0)
+        task.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await task
+
+    asyncio.run(cancel_mid_trial())
+    breaker = email_verify.breakers["bridge"]
+    assert not breaker.trial_running
+    providers.status["bridge"] = 200
+    assert send() == "bridge"
+    assert not breaker.is_open()
+
+
+def test_no_provider_accepts(providers):
+    providers.status.update(bridge=500, resend=500)
+    assert send() is None
+    assert providers.calls == {"bridge": 1, "resend": 1}
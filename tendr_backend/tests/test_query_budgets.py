@@ -0,0 +1,215 @@
+"""
+Query budgets: how many SQL statements each task / pet / focus / XP endpoint may run.
+
+Runs each request once through the app (TestClient, without the background jobs),
+counting the statements sent on the request engines. Each endpoint is its own test
+case, failing when it goes over its budget in BUDGETS (the failure lists its SQL).
+Transactions (BEGIN/COMMIT) are shown but not budgeted.
+The token version is already cached (user_cache), as it is for almost every request;
+a cold cache adds one primary key lookup to any of them.
+
+Lower a budget when a change saves a statement, raise it only on purpose.
+Before -> after the UPDATE/DELETE ... RETURNING rewrite of task_crud / pet_crud:
+
+    POST   /tasks                  3 -> 2      POST   /pets                  3 -> 2
+    PATCH  /tasks/{id} complete    5 -> 3      PATCH  /pet/feed/{id}         8 -> 6
+    PATCH  /tasks/{id} reopen      4 -> 3      PUT    /pet/{id}        (500) -> 2
+    PUT    /tasks/{title}          3 -> 2      DELETE /pet/{id}              5 -> 2
+    DELETE /tasks/{id} late        5 -> 4      POST   /focus/session        12 -> 5
+    PATCH  /tasks/batch            5 -> 4
+
+Each write that moves a user_daily_activity counter (activity.py) pays one upsert for
+it: complete / reopen / PUT by title / batch PATCH / batch DELETE of completed tasks,
+focus sessions and feeds are one over the numbers above. That buys the analytics
+reads: GET /activity and /focus/total no longer scan the user's history.
+GET /analysis/{id} 4 -> 2: the whole stats payload is one statement (stats.stats_query),
+the other is the ETag.
+GET /leaderboard is 2 once the process has loaded its ranking (leaderboard.py): the
+ledger poll and the usernames. The load itself is a one-off per process, outside.
+
+Needs DATABASE_URL pointing at a Postgres you can write to, skipped without it:
+    DATABASE_URL=... python -m pytest tendr_backend/tests/test_query_budgets.py
+"""
+import os
+import uuid
+from contextlib import asynccontextmanager
+from datetime import date, timedelta
+
+import pytest
+
+if not os.getenv("DATABASE_URL"):
+    pytest.skip("DATABASE_URL is not set", allow_module_level=True)
+
+from fastapi.testclient import TestClient
+from sqlalchemy import delete, event
+
+import auth_crud
+import database
+import main
+import migrations
+from models import FocusSession, Pet, Task, User, UserDailyActivity, XpEvent
+
+# (label): max statements
+BUDGETS = {
+    "POST /tasks": 2,
+    "GET /tasks": 2,
+    "GET /tasks (304)": 1,
+    "PATCH /tasks/{id} complete": 4,
+    "PATCH /tasks/{id} unchanged": 3,
+    "PATCH /tasks/{id} reopen": 4,
+    "PUT /tasks/{title}": 3,
+    "DELETE /tasks/{id} late": 4,
+    "POST /tasks/batch": 2,
+    "PATCH /tasks/batch": 5,
+    "DELETE /tasks/batch": 3,
+    "POST /pets": 2,
+    "GET /pet": 2,
+    "POST /focus/session": 6,
+    "PATCH /pet/feed/{id}": 7,
+    "PUT /pet/{id}": 2,
+    "DELETE /pet/{id}": 2,
+    "GET /focus/total": 2,
+    "GET /focus/today": 2,
+    "GET /user/xp": 1,
+    "GET /user/xp/history": 1,
+    "GET /activity": 2,
+    "GET /analysis/series": 2,
+    "GET /analysis/{id}": 2,
+    "GET /leaderboard": 2,
+}
+
+
+class _Counter:
+    def __init__(self):
+        self.statements = 0
+        self.transactions = 0
+        self.sql = []
+
+    def reset(self):
+        self.__init__()
+
+
+counter = _Counter()
+
+
+def _statement(conn, cursor, statement, parameters, context, executemany):
+    counter.statements += 1
+    counter.sql.append(" ".join(statement.split())[:120])
+
+
+def _commit(conn):
+    counter.transactions += 1
+
+
+def _seed_user():
+    with database.SessionLocal() as db:
+        name = f"budget_{uuid.uuid4().hex[:8]}"
+        user = User(username=name, email=f"{name}@example.com", hashed_password="", user_verified=True)
+        db.add(user)
+        db.commit()
+        token = auth_crud.create_access_token(auth_crud.token_claims(user), timedelta(minutes=10))
+        return user.id, {"Authorization": f"Bearer {token}"}
+
+
+def _cleanup(user_id):
+    with database.SessionLocal() as db:
+        for model in (UserDailyActivity, XpEvent, FocusSession, Pet, Task):
+            db.execute(delete(model).where(model.user_id == user_id))
+        db.execute(delete(User).where(User.id == user_id))
+        db.commit()
+
+
+
+
+@asynccontextmanager
+async def _no_background_jobs(app):
+    # the real lifespan starts the outbox / compaction / purge loops, whose queries would be counted too
+    yield
+
+
+def _scenario(client, auth, user_id, measure):
+    client.get("/user/xp", headers=auth)  # caches the token version
+    client.get(f"/analysis/{user_id}", headers=auth)  # and the user (get_current_user)
+    client.get("/leaderboard", headers=auth)  # and loads this process's leaderboard
+
+    task = measure("POST /tasks", "POST", "/tasks", json={"title": "budget", "priority": "high"}).json()
+    late = client.post("/tasks", headers=auth, json={
+        "title": "late", "priority": "low", "due_date": str(date.today() - timedelta(days=10)),
+    }).json()
+    listed = measure("GET /tasks", "GET", "/tasks")
+    measure("GET /tasks (304)", "GET", "/tasks", expect=304, headers={"If-None-Match": listed.headers["ETag"]})
+    measure("PATCH /tasks/{id} complete", "PATCH", f"/tasks/{task['id']}", json={"completed": True})
+    measure("PATCH /tasks/{id} unchanged", "PATCH", f"/tasks/{task['id']}", json={"completed": True})
+    measure("PATCH /tasks/{id} reopen", "PATCH", f"/tasks/{task['id']}", json={"completed": False})
+    measure("PUT /tasks/{title}", "PUT", "/tasks/budget")
+    measure("DELETE /tasks/{id} late", "DELETE", f"/tasks/{late['id']}")
+
+    created = measure("POST /tasks/batch", "POST", "/tasks/batch",
+                      json={"tasks": [{"title": f"batch {i}"} for i in range(3)]}).json()["results"]
+    ids = [r["task"]["id"] for r in created]
+    measure("PATCH /tasks/batch", "PATCH", "/tasks/batch",
+            json={"items": [{"id": i, "completed": True} for i in ids]})
+    measure("DELETE /tasks/batch", "DELETE", "/tasks/batch", json={"ids": ids})
+
+    pet = measure("POST /pets", "POST", "/pets", json={"name": "budget", "type": "cat"}).json()
+    measure("GET /pet", "GET", "/pet")
+    # the new pet counts as fed today: focusing records the qualifying day and ages it
+    measure("POST /focus/session", "POST", "/focus/session", json={"duration_seconds": 600})
+    fed = measure("PATCH /pet/feed/{id}", "PATCH", f"/pet/feed/{pet['id']}").json()
+    assert fed["age"] == 1, fed
+    measure("PUT /pet/{id}", "PUT", f"/pet/{pet['id']}", json={"hunger": 80, "last_fed": fed["last_fed"]})
+    measure("DELETE /pet/{id}", "DELETE", f"/pet/{pet['id']}")
+
+    measure("GET /focus/total", "GET", "/focus/total")
+    measure("GET /focus/today", "GET", "/focus/today")
+    measure("GET /user/xp", "GET", "/user/xp")
+    measure("GET /user/xp/history", "GET", "/user/xp/history")
+    measure("GET /activity", "GET", "/activity")
+    measure("GET /analysis/series", "GET", "/analysis/series?bucket=week")
+    measure("GET /analysis/{id}", "GET", f"/analysis/{user_id}")
+    measure("GET /leaderboard", "GET", "/leaderboard")
+
+
+@pytest.fixture(scope="module")
+def measured():
+    """{label: (statements, transactions, sql)}, every endpoint run once in order"""
+    migrations.run_migrations(database.engine)
+    engines = [e.sync_engine for e in database.all_pools().values()]
+    for sync_engine in engines:
+        event.listen(sync_engine, "before_cursor_execute", _statement)
+        event.listen(sync_engine, "commit", _commit)
+    user_id, auth = _seed_user()
+    lifespan = main.app.router.lifespan_context
+    main.app.router.lifespan_context = _no_background_jobs
+    results = {}
+    try:
+        with TestClient(main.app) as client:
+            def measure(label, method, path, expect=200, headers=None, **kwargs):
+                counter.reset()
+                response = client.request(method, path, headers={**auth, **(headers or {})}, **kwargs)
+                assert response.status_code == expect, (label, response.status_code, response.text)
+                results[label] = (counter.statements, counter.transactions, list(counter.sql))
+                return response
+
+            try:
+                _scenario(client, auth, user_id, measure)
+            finally:
+                # pooled asyncpg connections belong to the client's event loop
+                for pool in database.all_pools().values():
+                    client.portal.call(pool.dispose)
+    finally:
+        main.app.router.lifespan_context = lifespan
+        for sync_engine in engines:
+            event.remove(sync_engine, "before_cursor_execute", _statement)
+            event.remove(sync_engine, "commit", _commit)
+        _cleanup(user_id)
+    return results
+
+
+@pytest.mark.parametrize("label", list(BUDGETS))
+def test_query_budget(measured, label):
+    statements, transactions, sql = measured[label]
+    assert statements <= BUDGETS[label], (
+        f"{label}: {statements} statements, budget {BUDGETS[label]} ({transactions} commits)\n    "
+        + "\n    ".join(sql)
+    )
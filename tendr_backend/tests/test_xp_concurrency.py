@@ -0,0 +1,133 @@
+"""
+Concurrent XP changes (xp_service) against a real Postgres: no lost or doubled updates,
+and a balance that never goes below 0, while the compactor folds the ledger mid-flight.
+Needs DATABASE_URL pointing at a Postgres you can write to.
+
+benchmarks/stress_xp.py runs the same kind of load through the task / pet endpoints,
+at a larger scale and with the old read-modify-write for comparison.
+"""
+import asyncio
+import os
+import random
+import uuid
+
+import pytest
+
+if not os.getenv("DATABASE_URL"):
+    pytest.skip("DATABASE_URL is not set", allow_module_level=True)
+
+from sqlalchemy import delete, func, select
+
+import database
+import migrations
+import xp_service
+from models import User, XpEvent
+
+CONCURRENCY = 20
+
+
+@pytest.fixture(scope="module", autouse=True)
+def schema():
+    migrations.run_migrations(database.engine)
+
+
+@pytest.fixture
+def user_id():
+    name = f"xp_test_{uuid.uuid4().hex[:8]}"
+    with database.SessionLocal() as db:
+        user = User(username=name, email=f"{name}@example.com", hashed_password="", user_verification_token="")
+        db.add(user)
+        db.commit()
+        user_id = user.id
+    yield user_id
+    with database.SessionLocal() as db:
+        db.execute(delete(User).where(User.id == user_id))
+        db.commit()
+
+
+def run(coro):
+    async def with_engine():
+        try:
+            return await coro
+        finally:
+            # asyncpg connections belong to this event loop
+            await database.async_engine.dispose()
+    return asyncio.run(with_engine())
+
+
+def set_balance(user_id, xp: int):
+    with database.SessionLocal() as db:
+        db.execute(delete(XpEvent).where(XpEvent.user_id == user_id))
+        db.get(User, user_id).xp = xp
+        db.commit()
+
+
+def ledger(user_id, start: int):
+    """(balance, start + every delta in the ledger, compacted or not)"""
+    with database.SessionLocal() as db:
+        balance = db.execute(select(xp_service.balance_subquery(user_id))).scalar()
+        deltas = db.execute(
+            select(func.coalesce(func.sum(XpEvent.delta), 0)).where(XpEvent.user_id == user_id)
+        ).scalar()
+        return balance, start + deltas
+
+
+async def concurrently(calls):
+    """Run fn(db) for every fn in calls, CONCURRENCY at a time, each in its own committed transaction."""
+    gate = asyncio.Semaphore(CONCURRENCY)
+    stop = asyncio.Event()
+
+    async def call(fn):
+        async with gate:
+            async with database.AsyncSessionLocal() as db:
+                result = await fn(db)
+                await db.commit()
+                return result
+
+    async def compacting():
+        while not stop.is_set():
+            async with database.AsyncSessionLocal() as db:
+                await xp_service.compact(db)
+            await asyncio.sleep(0.005)
+
+    compactor = asyncio.create_task(compacting())
+    try:
+        return await asyncio.gather(*(call(fn) for fn in calls))
+    finally:
+        stop.set()
+        await compactor
+
+
+def test_grants_and_spends_lose_nothing(user_id):
+    set_balance(user_id, 100)
+    rng = random.Random(18)
+    ops = [("grant", rng.randint(1, 50)) for _ in range(150)] + [("spend", 35)] * 150
+    rng.shuffle(ops)
+    results = run(concurrently([
+        lambda db, kind=kind, n=n: getattr(xp_service, kind)(db, user_id, n, "test") for kind, n in ops
+    ]))
+
+    spends = [r for (kind, _), r in zip(ops, results) if kind == "spend" and r is not None]
+    assert all(r >= 0 for r in spends)
+    expected = 100 + sum(n for kind, n in ops if kind == "grant") - 35 * len(spends)
+    assert ledger(user_id, 100) == (expected, expected)
+    assert expected >= 0
+
+
+def test_spends_never_overdraw(user_id):
+    affordable = 40
+    set_balance(user_id, 35 * affordable + 7)
+    results = run(concurrently([lambda db: xp_service.spend(db, user_id, 35, "test") for _ in range(120)]))
+
+    succeeded = [r for r in results if r is not None]
+    assert len(succeeded) == affordable
+    assert sorted(succeeded) == [35 * i + 7 for i in range(affordable)]
+    assert ledger(user_id, 35 * affordable + 7) == (7, 7)
+
+
+def test_deductions_floor_at_zero(user_id):
+    set_balance(user_id, 100)
+    results = run(concurrently([lambda db: xp_service.deduct(db, user_id, 15, "test") for _ in range(30)]))
+
+    assert min(results) == 0
+    assert ledger(user_id, 100) == (0, 0)
@@ -3,7 +3,7 @@ from tkinter import ttk, messagebox
 import json
 import os
 import calendar
-from datetime import datetime, timedelta
+from datetime import date, datetime, timedelta
 import threading
 import time
 import requests
@@ -51,6 +51,8 @@ class TendrApp:
         self.current_email = None
         self.auth_token = None
         self.backend_url = "https://tendrbackend.onrender.com"
+        # path -> (etag, parsed body) for conditional GETs; the server answers 304 when nothing changed
+        self._etag_cache = {}
 
         self.C = {
             'bg':       '#1a1410',
@@ -1311,13 +1313,13 @@ class TendrApp:
             return
 
         # ── fetch data ────────────────────────────────────────────────────────
-        tasks = self.fetch_tasks_from_backend()
-        user_id = next((t.get('user_id') for t in tasks if t.get('user_id')), None)
-        stats   = self.fetch_stats_from_backend(user_id) if user_id else {}
+        # aggregates only: the route takes the user from the token, not the path
+        stats   = self.fetch_stats_from_backend("me")
         focus   = self.fetch_focus_total_from_backend()
 
         streak       = stats.get('streaks', 0) or 0
-        tasks_done   = stats.get('num_task_completed') or len([t for t in tasks if t.get('completed')])
+        longest      = stats.get('longest_streak', 0) or 0
+        tasks_done   = stats.get('num_task_completed', 0) or 0
         focus_secs   = focus.get('total_seconds', 0) or 0
         focus_hrs    = focus_secs // 3600
         focus_mins   = (focus_secs % 3600) // 60
@@ -1352,14 +1354,10 @@ class TendrApp:
 
         # ── 21-day heatmap ─────────────────────────────────────────────────────
         today = datetime.now().date()
-        day_counts_21 = []
-        for i in range(20, -1, -1):
-            d = today - timedelta(days=i)
-            cnt = sum(
-                1 for t in tasks
-                if t.get('completed') and t.get('created_at', '')[:10] == d.strftime('%Y-%m-%d')
-            )
-            day_counts_21.append(cnt)
+        recent = {a['date']: a.get('tasks_completed', 0)
+                  for a in self.fetch_activity_from_backend(today - timedelta(days=20), today)}
+        day_counts_21 = [recent.get((today - timedelta(days=i)).isoformat(), 0)
+                         for i in range(20, -1, -1)]
         max21 = max(max(day_counts_21), 1)
 
         hm21_card = tk.Frame(self.content_frame, bg=self.C['surface'],
@@ -1400,16 +1398,17 @@ class TendrApp:
         first_weekday    = calendar.monthrange(vy, vm)[0]  # 0=Mon
         month_name       = datetime(vy, vm, 1).strftime('%B')
 
+        # one series for the viewed month: the calendar and the priority breakdown below
+        month_series = self.fetch_series_from_backend(date(vy, vm, 1), date(vy, vm, days_in_month), 'day')
         month_counts = [0] * days_in_month
-        for t in tasks:
-            if not t.get('completed'): continue
-            ds = (t.get('created_at') or '')[:10]
+        prio_counts = {}
+        for b in month_series:
             try:
-                d = datetime.strptime(ds, '%Y-%m-%d')
-                if d.year == vy and d.month == vm:
-                    month_counts[d.day - 1] += 1
+                month_counts[int(b['start'][8:10]) - 1] += b.get('completed', 0)
             except Exception:
                 pass
+            for p, cnt in (b.get('by_priority') or {}).items():
+                prio_counts[p.upper()] = prio_counts.get(p.upper(), 0) + cnt
         max_month = max(max(month_counts), 1)
         total_month = sum(month_counts)
 
@@ -1523,7 +1522,7 @@ class TendrApp:
                              highlightthickness=1, highlightbackground=self.C['rule'])
         prio_card.grid(row=0, column=0, padx=(0, 8), sticky='nsew')
 
-        tk.Label(prio_card, text="BY PRIORITY",
+        tk.Label(prio_card, text=f"BY PRIORITY · {month_name.upper()}",
                  font=(*self.FONT_MONO, 8), fg=self.C['muted'],
                  bg=self.C['surface'], anchor='w').pack(anchor='w', padx=16, pady=(14, 4))
         tk.Label(prio_card, text="Where your effort went.",
@@ -1531,17 +1530,11 @@ class TendrApp:
                  fg=self.C['ink'], bg=self.C['surface'],
                  anchor='w').pack(anchor='w', padx=16, pady=(0, 12))
 
-        prio_counts = {}
-        for t in tasks:
-            if not t.get('completed'): continue
-            p = (t.get('priority') or 'low').upper()
-            prio_counts[p] = prio_counts.get(p, 0) + 1
-
         prio_colors = {'HIGH': self.C['accent'], 'MEDIUM': self.C['accent3'], 'LOW': self.C['accent2']}
         pmax = max(max(prio_counts.values()) if prio_counts else 1, 1)
 
         if not prio_counts:
-            tk.Label(prio_card, text="no completed tasks yet.",
+            tk.Label(prio_card, text="no completed tasks this month.",
                      font=(*self.FONT_SERIF, 11, 'italic'),
                      fg=self.C['muted'], bg=self.C['surface'],
                      anchor='w').pack(anchor='w', padx=16, pady=(0, 16))
@@ -1598,7 +1591,11 @@ class TendrApp:
                  font=(*self.FONT_SERIF, 11, 'italic'),
                  fg=self.C['ink_soft'], bg=self.C['surface'],
                  anchor='w', wraplength=280, justify='left').pack(
-                     anchor='w', padx=16, pady=(10, 16))
+                     anchor='w', padx=16, pady=(10, 4 if longest else 16))
+        if longest:
+            tk.Label(streak_card, text=f"LONGEST  {longest} DAYS",
+                     font=(*self.FONT_MONO, 8), fg=self.C['muted'],
+                     bg=self.C['surface'], anchor='w').pack(anchor='w', padx=16, pady=(0, 16))
 
     # ─── Archive (Settings) ───────────────────────────────────────────────────
 
@@ -2178,6 +2175,7 @@ class TendrApp:
         self.is_logged_in = False
         self.current_user = None
         self.auth_token = None
+        self._etag_cache.clear()
         messagebox.showinfo("Logged out", "You have been logged out.")
         self.switch_page("archive")
 
@@ -2394,11 +2392,26 @@ class TendrApp:
 
     # ─── backend API helpers ──────────────────────────────────────────────────
 
+    def _conditional_get(self, path, headers):
+        """GET that reuses the last body when the server says 304 Not Modified."""
+        cached = self._etag_cache.get(path)
+        if cached:
+            headers = dict(headers, **{"If-None-Match": cached[0]})
+        r = requests.get(f"{self.backend_url}{path}", headers=headers)
+        if r.status_code == 304 and cached:
+            return cached[1]
+        if r.status_code != 200:
+            return None
+        body = r.json()
+        if r.headers.get("ETag"):
+            self._etag_cache[path] = (r.headers["ETag"], body)
+        return body
+
     def fetch_tasks_from_backend(self):
         try:
             h = {"Authorization": f"Bearer {self.auth_token}"} if self.auth_token else {}
-            r = requests.get(f"{self.backend_url}/tasks", headers=h)
-            return r.json() if r.status_code == 200 else []
+            tasks = self._conditional_get("/tasks", h)
+            return tasks if tasks is not None else []
         except Exception as e:
             print(f"fetch tasks: {e}")
             return []
@@ -2415,17 +2428,38 @@ class TendrApp:
     def fetch_stats_from_backend(self, user_id):
         try:
             h = {"Authorization": f"Bearer {self.auth_token}"} if self.auth_token else {}
-            r = requests.get(f"{self.backend_url}/analysis/{user_id}", headers=h)
-            return r.json() if r.status_code == 200 else {}
+            stats = self._conditional_get(f"/analysis/{user_id}", h)
+            return stats if stats is not None else {}
         except Exception as e:
             print(f"fetch stats: {e}")
             return {}
 
+    def fetch_activity_from_backend(self, start, end):
+        """Per-day totals (tasks_completed, focus_seconds, ...) for the active days in [start, end]."""
+        try:
+            h = {"Authorization": f"Bearer {self.auth_token}"} if self.auth_token else {}
+            days = self._conditional_get(f"/activity?from={start.isoformat()}&to={end.isoformat()}", h)
+            return days if days is not None else []
+        except Exception as e:
+            print(f"fetch activity: {e}")
+            return []
+
+    def fetch_series_from_backend(self, start, end, bucket='day'):
+        """Completed tasks per bucket in [start, end], with by_priority / by_category counts."""
+        try:
+            h = {"Authorization": f"Bearer {self.auth_token}"} if self.auth_token else {}
+            series = self._conditional_get(
+                f"/analysis/series?from={start.isoformat()}&to={end.isoformat()}&bucket={bucket}", h)
+            return series.get('buckets', []) if series is not None else []
+        except Exception as e:
+            print(f"fetch series: {e}")
+            return []
+
     def fetch_focus_total_from_backend(self):
         try:
             h = {"Authorization": f"Bearer {self.auth_token}"} if self.auth_token else {}
-            r = requests.get(f"{self.backend_url}/focus/total", headers=h)
-            return r.json() if r.status_code == 200 else {}
+            total = self._conditional_get("/focus/total", h)
+            return total if total is not None else {}
         except Exception as e:
             print(f"fetch focus total: {e}")
             return {}
@@ -2466,8 +2500,8 @@ class TendrApp:
     def fetch_pets_from_backend(self):
         try:
             h = {"Authorization": f"Bearer {self.auth_token}"} if self.auth_token else {}
-            r = requests.get(f"{self.backend_url}/pet", headers=h)
-            return r.json() if r.status_code == 200 else []
+            pets = self._conditional_get("/pet", h)
+            return pets if pets is not None else []
         except Exception as e:
             print(f"fetch pets: {e}")
             return []
@@ -9,7 +9,9 @@ import type {
   PetCreate,
   UserStats,
   UserXP,
-  FocusTotal
+  FocusTotal,
+  AnalysisSeries,
+  SeriesBucketSize
 } from './types';
 
 // Get token from auth context (will be passed as parameter)
@@ -296,6 +298,15 @@ export const statsAPI = {
   },
 };
 
+export const analysisAPI = {
+  getSeries: async (from: string, to: string, bucket: SeriesBucketSize = 'day'): Promise<AnalysisSeries> => {
+    const response = await fetch(API_ENDPOINTS.ANALYSIS_SERIES(from, to, bucket), {
+      headers: getAuthHeaders(),
+    });
+    return handleResponse<AnalysisSeries>(response);
+  },
+};
+
 // User API
 export const userAPI = {
   getProvider: async (): Promise<{ provider: string | null }> => {
@@ -30,6 +30,8 @@ export const API_ENDPOINTS = {
 
   // Stats
   STATS: (userId: string) => `${API_URL}/analysis/${userId}`,
+  ANALYSIS_SERIES: (from: string, to: string, bucket: string) =>
+    `${API_URL}/analysis/series?from=${from}&to=${to}&bucket=${bucket}`,
 
   // Focus
   FOCUS_SESSION: `${API_URL}/focus/session`,
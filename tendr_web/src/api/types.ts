@@ -69,7 +69,9 @@ export interface PetCreate {
 // Stats Types
 export interface UserStats {
   num_task_completed: number;
+  num_task_open: number;
   streaks: number;
+  longest_streak: number;
   xps: number;
 }
 
@@ -83,3 +85,20 @@ export interface FocusTotal {
   total_seconds: number;
 }
 
+// Analysis series (GET /analysis/series): completed tasks per bucket
+export type SeriesBucketSize = 'day' | 'week' | 'month';
+
+export interface SeriesBucket {
+  start: string;
+  completed: number;
+  by_priority: Record<string, number>;
+  by_category: Record<string, number>;
+}
+
+export interface AnalysisSeries {
+  bucket: SeriesBucketSize;
+  from: string;
+  to: string;
+  buckets: SeriesBucket[];
+}
+
@@ -1,6 +1,6 @@
-import { useState, useEffect, useMemo } from 'react';
+import { useMemo } from 'react';
 import { useQuery } from '@tanstack/react-query';
-import { statsAPI, tasksAPI, petsAPI } from '../api/client';
+import { statsAPI } from '../api/client';
 import { useAuth } from '../contexts/AuthContext';
 import { useLocalTasksContext } from '../contexts/LocalTasksContext';
 import StatsCard from '../components/stats/StatsCard';
@@ -10,40 +10,12 @@ import { BarChart2, BarChart, CheckCircle2, Flame } from 'lucide-react';
 export default function Analytics() {
   const { isAuthenticated } = useAuth();
   const { tasks: localTasks } = useLocalTasksContext();
-  const [userId, setUserId] = useState<string | null>(null);
 
-  // Try to get user ID from tasks (only when authenticated)
-  const { data: tasks, isLoading: tasksLoading } = useQuery({
-    queryKey: ['tasks'],
-    queryFn: () => tasksAPI.getAll(),
-    enabled: isAuthenticated && !userId,
-    retry: 1,
-  });
-
-  // Try to get user ID from pets if tasks didn't work (only when authenticated)
-  const { data: pets, isLoading: petsLoading } = useQuery({
-    queryKey: ['pets'],
-    queryFn: () => petsAPI.getAll(),
-    enabled: isAuthenticated && !userId && (!tasks || tasks.length === 0) && !tasksLoading,
-    retry: 1,
-  });
-
-  // Extract userId from tasks or pets (only when authenticated)
-  useEffect(() => {
-    if (isAuthenticated) {
-      if (tasks && tasks.length > 0 && tasks[0].user_id) {
-        setUserId(tasks[0].user_id);
-      } else if (pets && pets.length > 0 && pets[0].user_id) {
-        setUserId(pets[0].user_id);
-      }
-    }
-  }, [tasks, pets, isAuthenticated]);
-
-  // Fetch stats from backend (only when authenticated)
+  // The stats route takes the user from the token; no need to download tasks or pets for an id
   const { data: stats, isLoading: statsLoading, error } = useQuery({
-    queryKey: ['stats', userId],
-    queryFn: () => statsAPI.getStats(userId!),
-    enabled: isAuthenticated && userId !== null,
+    queryKey: ['stats', 'me'],
+    queryFn: () => statsAPI.getStats('me'),
+    enabled: isAuthenticated,
     retry: 1,
   });
 
@@ -60,7 +32,7 @@ export default function Analytics() {
     };
   }, [localTasks, isAuthenticated]);
 
-  const isLoading = isAuthenticated && (tasksLoading || petsLoading || statsLoading);
+  const isLoading = isAuthenticated && statsLoading;
   const displayStats = isAuthenticated ? stats : localStats;
 
   return (
@@ -117,7 +89,7 @@ export default function Analytics() {
         )}
 
         {/* No Stats Available Message (only when authenticated and no data) */}
-        {!isLoading && !error && isAuthenticated && !stats && userId && (
+        {!isLoading && !error && isAuthenticated && !stats && (
           <div className="text-center py-12">
             <p className="text-purple-gentle-100 text-lg">
               No stats available. Start completing tasks to see your progress!
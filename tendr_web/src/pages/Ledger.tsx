@@ -2,8 +2,8 @@ import { useState } from 'react';
 import { useQuery } from '@tanstack/react-query';
 import { useAuth } from '../contexts/AuthContext';
 import { useIsMobile } from '../hooks/useIsMobile';
-import { tasksAPI, statsAPI, petsAPI, focusAPI } from '../api/client';
-import type { Task } from '../api/types';
+import { statsAPI, focusAPI, analysisAPI } from '../api/client';
+import type { SeriesBucket } from '../api/types';
 
 const MONTH_NAMES = [
   'January', 'February', 'March', 'April', 'May', 'June',
@@ -20,25 +20,25 @@ function firstDayOfWeek(month: number, year: number): number {
   return d === 0 ? 6 : d - 1;
 }
 
-function buildMonthCounts(tasks: Task[], month: number, year: number): number[] {
-  const days = daysInMonth(month, year);
-  const counts = Array(days).fill(0);
-  tasks.forEach(t => {
-    if (!t.completed) return;
-    const d = new Date(t.created_at);
-    if (d.getFullYear() === year && d.getMonth() === month) {
-      counts[d.getDate() - 1]++;
-    }
+function isoDate(year: number, month: number, day: number): string {
+  return `${year}-${String(month + 1).padStart(2, '0')}-${String(day).padStart(2, '0')}`;
+}
+
+function buildMonthCounts(buckets: SeriesBucket[], month: number, year: number): number[] {
+  const counts = Array(daysInMonth(month, year)).fill(0);
+  buckets.forEach(b => {
+    const day = Number(b.start.slice(8, 10));
+    if (day >= 1 && day <= counts.length) counts[day - 1] += b.completed;
   });
   return counts;
 }
 
-function buildCategoryCounts(tasks: Task[]): Record<string, number> {
+function buildCategoryCounts(buckets: SeriesBucket[]): Record<string, number> {
   const counts: Record<string, number> = {};
-  tasks.forEach(t => {
-    if (!t.completed) return;
-    const cat = t.category ?? 'Other';
-    counts[cat] = (counts[cat] ?? 0) + 1;
+  buckets.forEach(b => {
+    Object.entries(b.by_category).forEach(([cat, n]) => {
+      counts[cat] = (counts[cat] ?? 0) + n;
+    });
   });
   return counts;
 }
@@ -60,23 +60,11 @@ export default function Ledger() {
   const [viewMonth, setViewMonth] = useState(now.getMonth());
   const [viewYear, setViewYear] = useState(now.getFullYear());
 
-  const { data: tasks = [] } = useQuery({
-    queryKey: ['tasks'],
-    queryFn: () => tasksAPI.getAll(),
-    enabled: isAuthenticated,
-  });
-
-  const { data: pets = [] } = useQuery({
-    queryKey: ['pets'],
-    queryFn: () => petsAPI.getAll(),
-    enabled: isAuthenticated,
-  });
-
-  const userId = tasks[0]?.user_id ?? pets[0]?.user_id;
+  // the stats route takes the user from the token, whatever the path says
   const { data: stats } = useQuery({
-    queryKey: ['stats', userId],
-    queryFn: () => statsAPI.getStats(userId!),
-    enabled: isAuthenticated && !!userId,
+    queryKey: ['stats', 'me'],
+    queryFn: () => statsAPI.getStats('me'),
+    enabled: isAuthenticated,
   });
 
   const { data: focusTotal } = useQuery({
@@ -85,12 +73,24 @@ export default function Ledger() {
     enabled: isAuthenticated,
   });
 
-  const monthCounts = buildMonthCounts(tasks, viewMonth, viewYear);
-  const catCounts = buildCategoryCounts(tasks);
+  // one aggregated series for the viewed month feeds the calendar and the category breakdown
+  const { data: monthSeries } = useQuery({
+    queryKey: ['series', viewYear, viewMonth],
+    queryFn: () => analysisAPI.getSeries(
+      isoDate(viewYear, viewMonth, 1),
+      isoDate(viewYear, viewMonth, daysInMonth(viewMonth, viewYear)),
+      'day',
+    ),
+    enabled: isAuthenticated,
+  });
+  const monthBuckets = monthSeries?.buckets ?? [];
+
+  const monthCounts = buildMonthCounts(monthBuckets, viewMonth, viewYear);
+  const catCounts = buildCategoryCounts(monthBuckets);
   const catMax = Math.max(...Object.values(catCounts), 1);
   const maxInMonth = Math.max(...monthCounts, 1);
 
-  const tasksCompleted = stats?.num_task_completed ?? tasks.filter(t => t.completed).length;
+  const tasksCompleted = stats?.num_task_completed ?? 0;
 
   const totalFocusSecs = focusTotal?.total_seconds ?? 0;
   const focusHrs = Math.floor(totalFocusSecs / 3600);
@@ -248,13 +248,13 @@ export default function Ledger() {
         {/* Category breakdown + Streak */}
         <div style={{ display: 'grid', gridTemplateColumns: isMobile ? '1fr' : '1fr 1fr', gap: 20, alignItems: 'stretch' }}>
           <div style={{ border: '1px solid var(--rule)', background: 'var(--card)', padding: 22 }}>
-            <div style={{ ...monoStyle, marginBottom: 6 }}>BY CATEGORY</div>
+            <div style={{ ...monoStyle, marginBottom: 6 }}>BY CATEGORY · {MONTH_NAMES[viewMonth]}</div>
             <div style={{ fontFamily: 'Fraunces, Georgia, serif', fontStyle: 'italic', fontSize: 18, color: 'var(--ink)', marginBottom: 16 }}>
               Where your effort went.
             </div>
             {Object.entries(catCounts).length === 0 ? (
               <div style={{ fontFamily: 'Fraunces, Georgia, serif', fontStyle: 'italic', fontSize: 14, color: 'var(--muted)' }}>
-                no completed tasks yet.
+                no completed tasks this month.
               </div>
             ) : Object.entries(catCounts)
                 .sort((a, b) => b[1] - a[1])
@@ -283,6 +283,11 @@ export default function Ledger() {
             <div style={{ fontFamily: 'Fraunces, Georgia, serif', fontStyle: 'italic', fontSize: 13, color: 'var(--ink-soft)', marginTop: 14 }}>
               {(stats?.streaks ?? 0) === 0 ? 'Start today.' : 'Keep going.'}
             </div>
+            {(stats?.longest_streak ?? 0) > 0 && (
+              <div style={{ ...monoStyle, fontSize: 9, marginTop: 10 }}>
+                LONGEST · {stats?.longest_streak} DAYS
+              </div>
+            )}
           </div>
         </div>
 